@@ -0,0 +1,140 @@
+"""
+Archives compressées des conversations anciennes
+
+Chaque passage de rétention écrit un fichier `conversations-<date>.jsonl.gz` :
+une conversation (métadonnées et messages) par membre gzip indépendant. Le
+fichier complet reste lisible par les outils gzip habituels (zcat), et une
+conversation se relit seule grâce à son couple (position, longueur) conservé
+dans la table `archived_conversations` de la base.
+
+    python -m backend.archive run --days 90
+    python -m backend.archive compact [--enable]
+"""
+
+import argparse
+import fcntl
+import gzip
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+from . import config
+
+
+class ConversationArchive:
+    def __init__(self, directory: str, compresslevel: int = 6):
+        # Dossier créé à la première écriture : rien sur disque tant que la rétention est inactive
+        self.directory = directory
+        self.compresslevel = compresslevel
+
+    def path(self, name: str) -> str:
+        # Le nom vient de la base : on refuse tout chemin hors du dossier d'archives
+        return os.path.join(self.directory, os.path.basename(name))
+
+    def write(self, conversations: List[dict]) -> Tuple[str, List[Tuple[int, int]]]:
+        """Écrit les conversations dans un nouveau fichier ; retourne son nom et la
+        position de chaque conversation. Le fichier est synchronisé sur disque avant
+        le retour : les lignes ne sont supprimées de la base qu'ensuite."""
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"conversations-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl.gz"
+        locations = []
+        with open(self.path(name), "xb") as f:
+            offset = f.tell()
+            for conversation in conversations:
+                line = json.dumps(conversation, ensure_ascii=False).encode("utf-8") + b"\n"
+                member = gzip.compress(line, compresslevel=self.compresslevel, mtime=0)
+                f.write(member)
+                locations.append((offset, len(member)))
+                offset += len(member)
+            f.flush()
+            os.fsync(f.fileno())
+        return name, locations
+
+    def read(self, name: str, offset: int, length: int) -> dict:
+        with open(self.path(name), "rb") as f:
+            f.seek(offset)
+            return json.loads(gzip.decompress(f.read(length)))
+
+    def files(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [name for name in os.listdir(self.directory)
+                if name.startswith("conversations-") and name.endswith(".jsonl.gz")]
+
+    def age(self, name: str) -> float:
+        return time.time() - os.path.getmtime(self.path(name))
+
+    def remove(self, name: str):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def exclusive(self):
+        """Verrou entre processus : un seul worker exécute la rétention à la fois.
+        Rend False (sans attendre) si un autre processus la détient déjà."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def run_maintenance(db_manager, retention_days: int = config.RETENTION_DAYS,
+                    batch_size: int = config.ARCHIVE_BATCH, vacuum_pages: int = config.VACUUM_PAGES) -> dict:
+    """Archive les conversations inactives depuis `retention_days` jours, par lots,
+    puis rend au système une partie des pages libérées (vacuum incrémental)"""
+    stats = {"archived": 0}
+    with db_manager.archive.exclusive() as acquired:
+        if not acquired:
+            return {"skipped": "maintenance en cours dans un autre processus"}
+        if retention_days > 0:
+            while True:
+                archived = db_manager.archive_conversations(retention_days, batch_size)
+                stats["archived"] += archived
+                if archived < batch_size:
+                    break
+        stats["orphan_archives_removed"] = db_manager.remove_orphan_archives()
+        stats.update(db_manager.incremental_vacuum(vacuum_pages))
+    return stats
+
+
+def main():
+    from .database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Rétention et compaction de l'historique des conversations")
+    parser.add_argument("--db", default=config.DB_PATH)
+    parser.add_argument("--archive-dir", default=config.ARCHIVE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="archive les conversations anciennes puis compacte la base")
+    run.add_argument("--days", type=int, default=config.RETENTION_DAYS or 90)
+    run.add_argument("--batch", type=int, default=config.ARCHIVE_BATCH)
+    compact = subparsers.add_parser("compact", help="vacuum incrémental de la base")
+    compact.add_argument("--pages", type=int, default=0, help="pages à libérer (0 = toutes)")
+    compact.add_argument("--enable", action="store_true",
+                         help="active auto_vacuum=INCREMENTAL sur une base existante (VACUUM complet, hors ligne)")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db, archive_dir=args.archive_dir)
+    if args.command == "run":
+        stats = run_maintenance(db_manager, args.days, args.batch, config.VACUUM_PAGES)
+    elif args.enable:
+        stats = db_manager.enable_incremental_vacuum()
+    else:
+        stats = db_manager.incremental_vacuum(args.pages)
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
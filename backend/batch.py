@@ -0,0 +1,296 @@
+"""
+Questions-réponses par lots (JSONL)
+
+Entrée : une question par ligne, {"id": ..., "question": ..., "filters": {...}}
+(id et filters facultatifs, "message" accepté à la place de "question").
+Sortie : une ligne JSON par question, dans l'ordre de fin de traitement, avec
+la réponse, les sources, le serveur Ollama utilisé et le détail des durées.
+
+Les questions sont recherchées par paquets (un encodage et un produit matriciel
+par paquet, voir DataProcessor.search_batch) pendant que les réponses des
+paquets précédents sont générées, avec au plus `concurrency` générations
+simultanées par serveur Ollama ; chaque serveur prend la question suivante dès
+qu'il se libère.
+
+Reprise : chaque résultat est ajouté au fichier de sortie dès qu'il est prêt,
+avec sa question, ses filtres et la version du corpus. Relancé sur le même
+fichier, le lot ne traite que les questions sans réponse (ou en erreur) : une
+réponse déjà obtenue n'est restituée que pour la même question et la même
+version du corpus, sinon elle est régénérée. Le fichier est verrouillé
+(flock) pendant le traitement : un même lot ne tourne pas deux fois à la fois,
+y compris d'un worker à l'autre.
+
+    python -m backend.batch questions.jsonl -o reponses.jsonl [--ollama-url URL ...]
+
+Via l'API : POST /api/batch?run_id=<nom> avec le fichier JSONL en corps ; la
+même requête, avec le même run_id, reprend le lot interrompu.
+"""
+
+import argparse
+import asyncio
+import fcntl
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from . import config
+from .metadata_index import METADATA_FIELDS
+from .rate_limit import SchedulerFull
+
+
+class BatchError(ValueError):
+    """Fichier de questions invalide"""
+
+
+class BatchBusy(BatchError):
+    """Lot déjà en cours de traitement (fichier de résultats verrouillé)"""
+
+
+def parse_questions(lines: Iterable[str], max_items: int = 0) -> List[dict]:
+    items, seen = [], set()
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise BatchError(f"Ligne {number}: JSON invalide ({e})")
+        if isinstance(item, str):
+            item = {"question": item}
+        if not isinstance(item, dict):
+            raise BatchError(f"Ligne {number}: objet JSON attendu")
+
+        question = item.get("question") or item.get("message")
+        if not isinstance(question, str) or not question.strip():
+            raise BatchError(f"Ligne {number}: question manquante")
+        filters = item.get("filters") or None
+        if filters is not None and not isinstance(filters, dict):
+            raise BatchError(f"Ligne {number}: filters doit être un objet")
+        unknown_filters = set(filters or {}) - set(METADATA_FIELDS)
+        if unknown_filters:
+            raise BatchError(f"Ligne {number}: filtres inconnus: {', '.join(sorted(unknown_filters))}")
+        item_id = str(item.get("id", number))
+        if item_id in seen:
+            raise BatchError(f"Ligne {number}: id en double ({item_id})")
+        seen.add(item_id)
+
+        items.append({"id": item_id, "question": question.strip(), "filters": filters})
+        if max_items and len(items) > max_items:
+            raise BatchError(f"Lot limité à {max_items} questions")
+    return items
+
+
+def open_output(path: str):
+    """Ouvre le fichier de résultats en ajout, verrouillé jusqu'à sa fermeture"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    f = open(path, "a+", encoding="utf-8")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        raise BatchBusy(f"Lot déjà en cours de traitement ({path})")
+    return f
+
+
+def load_completed(output) -> Dict[str, dict]:
+    """Résultats sans erreur déjà écrits dans le fichier `output` (le dernier pour
+    chaque id) ; prépare le fichier pour l'ajout des suivants"""
+    completed = {}
+    output.seek(0)
+    line = ""
+    for line in output:
+        try:
+            result = json.loads(line)
+        except ValueError:
+            # Dernière ligne tronquée par un arrêt brutal : la question sera refaite
+            continue
+        if not isinstance(result, dict) or "id" not in result:
+            continue
+        if result.get("error"):
+            completed.pop(result["id"], None)
+        else:
+            completed[result["id"]] = result
+    if line and not line.endswith("\n"):
+        output.write("\n")
+    return completed
+
+
+async def run_batch(assistant, items: List[dict], backends: list,
+                    concurrency: int = config.BATCH_CONCURRENCY, output=None,
+                    client: Optional[str] = None,
+                    retrieval_size: int = config.BATCH_RETRIEVAL_SIZE) -> AsyncIterator[dict]:
+    """Traite les questions et produit leurs résultats au fur et à mesure.
+
+    `backends` : clients Ollama (OllamaClient). Celui de l'assistant passe par son
+    ordonnanceur équitable, au nom de `client` : un lot n'accapare pas le serveur
+    des utilisateurs interactifs. `output` : fichier ouvert par open_output, repris
+    puis complété (fermé par l'appelant).
+    """
+    corpus_version = assistant.corpus_version()
+    completed = load_completed(output) if output else {}
+    pending = []
+    for item in items:
+        previous = completed.get(item["id"])
+        # Question modifiée ou corpus mis à jour depuis : la réponse est régénérée
+        if (previous and previous.get("question") == item["question"]
+                and previous.get("filters") == item["filters"]
+                and previous.get("corpus_version") == corpus_version):
+            yield {**previous, "resumed": True}
+        else:
+            pending.append(item)
+    if not pending:
+        return
+
+    def identity(item: dict) -> dict:
+        # Ce qui détermine la réponse : comparé à la reprise
+        return {"id": item["id"], "question": item["question"], "filters": item["filters"],
+                "corpus_version": corpus_version}
+
+    # Instantané de la base : un rechargement pendant le lot ne l'affecte pas
+    data_processor = assistant.data_processor
+    # File bornée : la recherche ne prend pas trop d'avance sur la génération
+    work: asyncio.Queue = asyncio.Queue(maxsize=2 * retrieval_size)
+    results: asyncio.Queue = asyncio.Queue()
+    workers = [backend for backend in backends for _ in range(max(1, concurrency))]
+
+    async def retrieve_all():
+        # Paquets de questions partageant les mêmes filtres
+        groups = OrderedDict()
+        for item in pending:
+            groups.setdefault(json.dumps(item["filters"], sort_keys=True), []).append(item)
+        for group in groups.values():
+            for start in range(0, len(group), retrieval_size):
+                chunk = group[start:start + retrieval_size]
+                started = time.perf_counter()
+                try:
+                    retrieved = await asyncio.to_thread(
+                        assistant.retrieve_batch, data_processor, [item["question"] for item in chunk],
+                        chunk[0]["filters"])
+                except Exception as e:
+                    for item in chunk:
+                        await results.put({**identity(item), "error": f"Erreur de recherche: {e}"})
+                    continue
+                retrieval_ms = round((time.perf_counter() - started) * 1000, 2)
+                for item, (similar_content, stats) in zip(chunk, retrieved):
+                    await work.put((item, similar_content, stats, retrieval_ms, time.perf_counter()))
+        for _ in workers:
+            await work.put(None)
+
+    async def generate_all(backend):
+        while True:
+            job = await work.get()
+            if job is None:
+                return
+            item, similar_content, stats, retrieval_ms, queued_at = job
+            started = time.perf_counter()
+            args = (item["question"], assistant.prompt_context(similar_content))
+            try:
+                if backend is assistant.ollama_client:
+                    response, _ = await assistant.generate(client, *args, raise_errors=True)
+                else:
+                    response, _ = await backend.generate_response(*args, raise_errors=True)
+            except SchedulerFull:
+                # Le message de l'exception est l'identité hachée du client : inutile dans le rapport
+                await results.put({**identity(item), "backend": backend.base_url,
+                                   "error": "Trop de questions en attente de génération pour ce client"})
+                continue
+            except Exception as e:
+                await results.put({**identity(item), "backend": backend.base_url,
+                                   "error": str(e) or type(e).__name__})
+                continue
+            finished = time.perf_counter()
+            await results.put({
+                **identity(item),
+                "response": response,
+                "sources": list(set([content["source"] for content in similar_content])),
+                "backend": backend.base_url,
+                "retrieval": stats,
+                "timings": {
+                    # Recherche du paquet entier, partagée par ses questions
+                    "retrieval_ms": retrieval_ms,
+                    "queue_ms": round((started - queued_at) * 1000, 2),
+                    "generation_ms": round((finished - started) * 1000, 2),
+                },
+            })
+
+    tasks = [asyncio.create_task(retrieve_all())]
+    tasks += [asyncio.create_task(generate_all(backend)) for backend in workers]
+    try:
+        for _ in pending:
+            result = await results.get()
+            if output:
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+            yield result
+    finally:
+        # Client déconnecté ou arrêt : les questions restantes seront reprises
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run(args) -> dict:
+    # Import ici : backend.main importe ce module pour l'endpoint /api/batch
+    from .main import AIAssistant, OllamaClient
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        items = parse_questions(f)
+    output = open_output(args.output)
+    if args.restart:
+        output.truncate(0)
+
+    assistant = await asyncio.to_thread(AIAssistant, config.OLLAMA_MODEL)
+    backends = [OllamaClient(base_url=url, model=config.OLLAMA_MODEL) for url in args.ollama_url]
+    stats = {"questions": len(items), "answered": 0, "resumed": 0, "errors": 0}
+    start = time.perf_counter()
+    try:
+        async for result in run_batch(assistant, items, backends, args.concurrency, output,
+                                      retrieval_size=args.retrieval_size):
+            if result.get("error"):
+                stats["errors"] += 1
+                print(f"[{result['id']}] erreur: {result['error']}", file=sys.stderr)
+            elif result.get("resumed"):
+                stats["resumed"] += 1
+            else:
+                stats["answered"] += 1
+                done = stats["answered"] + stats["resumed"] + stats["errors"]
+                print(f"[{done}/{len(items)}] {result['id']} ({result['timings']['generation_ms']:.0f} ms, "
+                      f"{result['backend']})", file=sys.stderr)
+    finally:
+        output.close()
+        for backend in backends:
+            await backend.close()
+        await assistant.close()
+    stats["duration_s"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Questions-réponses par lots (JSONL)")
+    parser.add_argument("questions", help="fichier JSONL des questions")
+    parser.add_argument("-o", "--output", required=True, help="fichier JSONL des résultats (repris s'il existe)")
+    parser.add_argument("--ollama-url", action="append", default=None,
+                        help="serveur Ollama (option répétable ; défaut : YOLSDA_BATCH_OLLAMA_URLS)")
+    parser.add_argument("--concurrency", type=int, default=config.BATCH_CONCURRENCY,
+                        help="générations simultanées par serveur Ollama")
+    parser.add_argument("--retrieval-size", type=int, default=config.BATCH_RETRIEVAL_SIZE,
+                        help="questions recherchées ensemble")
+    parser.add_argument("--restart", action="store_true", help="ignore les résultats existants")
+    args = parser.parse_args()
+    args.ollama_url = args.ollama_url or config.BATCH_OLLAMA_URLS
+
+    try:
+        stats = asyncio.run(run(args))
+    except BatchError as e:
+        parser.error(str(e))
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
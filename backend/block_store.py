@@ -0,0 +1,168 @@
+"""
+Stockage compressé, à accès direct, du texte des passages
+
+Les textes sont regroupés en blocs d'environ `block_size` octets, compressés
+un par un (zstd si le module `zstandard` est installé, zlib sinon). Un index
+de positions (numpy, quelques octets par passage) associe à chaque passage
+son bloc et sa position dans le bloc décompressé : la lecture d'un passage ne
+décompresse qu'un bloc, gardé dans un petit cache LRU.
+
+Fichiers (dans le répertoire d'index) :
+- texts.blk : blocs compressés concaténés, lus par mmap ;
+- texts.idx.npz : positions des blocs et des passages ;
+- texts.json : codec, taille de bloc et nombre de passages.
+"""
+
+import json
+import mmap
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Iterable, List
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    zstandard = None
+
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "zlib"
+
+
+class _Codec:
+    def __init__(self, name: str, level: int = None):
+        if name == "zstd":
+            if zstandard is None:
+                raise RuntimeError("Index compressé avec zstd : installez le module zstandard")
+            # Une instance zstandard ne doit pas servir à deux threads à la fois : la
+            # recherche tourne dans plusieurs threads (asyncio.to_thread, shard_server)
+            self._level = level or 3
+            self._local = threading.local()
+            self.compress = self._zstd_compress
+            self.decompress = self._zstd_decompress
+        elif name == "zlib":
+            self.compress = lambda data: zlib.compress(data, level or 6)
+            self.decompress = zlib.decompress
+        else:
+            raise ValueError(f"Codec inconnu: {name}")
+
+    def _zstd_compress(self, data: bytes) -> bytes:
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self._level)
+        return compressor.compress(data)
+
+    def _zstd_decompress(self, data: bytes) -> bytes:
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor.decompress(data)
+
+
+def write_block_store(directory: str, texts: Iterable[str], block_size: int = 32768,
+                      codec: str = None, suffix: str = "") -> dict:
+    """Écrit les textes dans `directory` ; `suffix` permet une écriture atomique
+    (fichiers temporaires renommés par l'appelant, voir BLOCK_STORE_FILES)"""
+    import numpy as np
+    codec = codec or default_codec()
+    compressor = _Codec(codec)
+    block_offsets, block_lengths = [], []
+    text_blocks, text_starts, text_lengths = [], [], []
+    raw_size = 0
+
+    with open(os.path.join(directory, "texts.blk" + suffix), "wb") as f:
+        pending, pending_size = [], 0
+
+        def flush():
+            nonlocal pending, pending_size
+            if not pending:
+                return
+            compressed = compressor.compress(b"".join(pending))
+            block_offsets.append(f.tell())
+            block_lengths.append(len(compressed))
+            f.write(compressed)
+            pending, pending_size = [], 0
+
+        for text in texts:
+            data = text.encode("utf-8")
+            raw_size += len(data)
+            if pending and pending_size + len(data) > block_size:
+                flush()
+            text_blocks.append(len(block_offsets))
+            text_starts.append(pending_size)
+            text_lengths.append(len(data))
+            pending.append(data)
+            pending_size += len(data)
+        flush()
+
+    with open(os.path.join(directory, "texts.idx.npz" + suffix), "wb") as f:
+        np.savez(
+            f,
+            block_offsets=np.asarray(block_offsets, dtype=np.int64),
+            block_lengths=np.asarray(block_lengths, dtype=np.int64),
+            text_blocks=np.asarray(text_blocks, dtype=np.int32),
+            text_starts=np.asarray(text_starts, dtype=np.int32),
+            text_lengths=np.asarray(text_lengths, dtype=np.int32),
+        )
+    header = {"codec": codec, "block_size": block_size, "count": len(text_lengths),
+              "blocks": len(block_offsets), "raw_bytes": raw_size,
+              "compressed_bytes": int(sum(block_lengths))}
+    with open(os.path.join(directory, "texts.json" + suffix), "w", encoding="utf-8") as f:
+        json.dump(header, f)
+    return header
+
+
+# Fichiers du stockage ; texts.json est écrit en dernier et signale un stockage complet
+BLOCK_STORE_FILES = ("texts.blk", "texts.idx.npz", "texts.json")
+
+
+class BlockStore:
+    def __init__(self, directory: str, cache_blocks: int = 64):
+        import numpy as np
+        with open(os.path.join(directory, "texts.json"), "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        self.codec = _Codec(self.header["codec"])
+        with np.load(os.path.join(directory, "texts.idx.npz")) as index:
+            self.block_offsets = index["block_offsets"]
+            self.block_lengths = index["block_lengths"]
+            self.text_blocks = index["text_blocks"]
+            self.text_starts = index["text_starts"]
+            self.text_lengths = index["text_lengths"]
+
+        with open(os.path.join(directory, "texts.blk"), "rb") as f:
+            # Fichier vide (aucun texte) : mmap refuse une longueur nulle
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.header["blocks"] else b""
+        self.cache_blocks = cache_blocks
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.header["count"]
+
+    def _block(self, block: int) -> bytes:
+        with self._lock:
+            data = self._cache.get(block)
+            if data is not None:
+                self._cache.move_to_end(block)
+                return data
+        offset = int(self.block_offsets[block])
+        data = self.codec.decompress(self._mmap[offset:offset + int(self.block_lengths[block])])
+        with self._lock:
+            self._cache[block] = data
+            while len(self._cache) > self.cache_blocks:
+                self._cache.popitem(last=False)
+        return data
+
+    def get(self, index: int) -> str:
+        block = self._block(int(self.text_blocks[index]))
+        start = int(self.text_starts[index])
+        return block[start:start + int(self.text_lengths[index])].decode("utf-8")
+
+    def get_many(self, indices: List[int]) -> List[str]:
+        return [self.get(i) for i in indices]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get(i)
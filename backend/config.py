@@ -0,0 +1,147 @@
+"""
+Configuration du backend Yolsda, lue depuis les variables d'environnement
+"""
+
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+# Serveur Ollama et modèle de génération (Gemma 2B par défaut)
+OLLAMA_URL = os.getenv("YOLSDA_OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("YOLSDA_OLLAMA_MODEL", "gemma:2b")
+
+# Durée de maintien du modèle en mémoire par Ollama après une requête
+# ("-1m" = indéfiniment, vide = valeur par défaut du serveur)
+OLLAMA_KEEP_ALIVE = os.getenv("YOLSDA_OLLAMA_KEEP_ALIVE", "30m")
+
+# Taille maximale (en tokens) du `context` Ollama réutilisé d'un tour à l'autre ;
+# au-delà, on repart d'un prompt complet avec l'historique résumé (0 = jamais réutilisé)
+OLLAMA_CONTEXT_TOKENS = _env_int("YOLSDA_OLLAMA_CONTEXT_TOKENS", 1536)
+
+# Préchauffage avant la disponibilité : recherche factice, vérification du modèle
+# dans /api/tags et génération courte (délai maximal en secondes pour le chargement)
+WARMUP = os.getenv("YOLSDA_WARMUP", "1") == "1"
+WARMUP_TIMEOUT = _env_int("YOLSDA_WARMUP_TIMEOUT", 300)
+
+# Après cette durée d'inactivité (secondes), le modèle Ollama est rechargé par un ping (0 = désactivé)
+KEEP_WARM_INTERVAL = _env_int("YOLSDA_KEEP_WARM_INTERVAL", 240)
+
+# Base SQLite de l'historique des conversations
+DB_PATH = os.getenv("YOLSDA_DB_PATH", "chat_history.db")
+
+# Rétention : les conversations inactives depuis RETENTION_DAYS jours (0 = jamais) sont
+# déplacées, par lots, dans des fichiers compressés de ARCHIVE_DIR ; chaque passage de
+# maintenance (toutes les MAINTENANCE_INTERVAL secondes) libère ensuite au plus
+# VACUUM_PAGES pages de la base (vacuum incrémental)
+RETENTION_DAYS = _env_int("YOLSDA_RETENTION_DAYS", 0)
+ARCHIVE_DIR = os.getenv("YOLSDA_ARCHIVE_DIR", "archives")
+ARCHIVE_BATCH = _env_int("YOLSDA_ARCHIVE_BATCH", 200)
+VACUUM_PAGES = _env_int("YOLSDA_VACUUM_PAGES", 2000)
+MAINTENANCE_INTERVAL = _env_int("YOLSDA_MAINTENANCE_INTERVAL", 3600)
+
+# Écriture différée de l'historique : délai de regroupement (ms) et taille maximale d'un lot
+WRITE_FLUSH_INTERVAL_MS = _env_int("YOLSDA_WRITE_FLUSH_INTERVAL_MS", 5)
+WRITE_MAX_BATCH = _env_int("YOLSDA_WRITE_MAX_BATCH", 256)
+
+# Réponses précalculées aux questions fréquentes (python -m backend.faq_cache build) :
+# servies si la question est au moins aussi proche (cosinus) d'une question enregistrée
+FAQ_ENABLED = os.getenv("YOLSDA_FAQ_ENABLED", "1") == "1"
+FAQ_SIMILARITY = _env_float("YOLSDA_FAQ_SIMILARITY", 0.9)
+
+# Dossier contenant les fichiers JSON du corpus
+DATA_DIR = os.getenv("YOLSDA_DATA_DIR", "data")
+
+# Dossier des index persistés (matrices d'embeddings mappées en mémoire)
+INDEX_DIR = os.getenv("YOLSDA_INDEX_DIR", os.path.join(DATA_DIR, "index"))
+
+# Texte des passages dans l'index : blocs compressés (zstd, ou zlib) d'environ
+# TEXT_BLOCK_SIZE octets, et nombre de blocs décompressés gardés en cache par worker
+TEXT_BLOCK_SIZE = _env_int("YOLSDA_TEXT_BLOCK_SIZE", 32768)
+TEXT_CACHE_BLOCKS = _env_int("YOLSDA_TEXT_CACHE_BLOCKS", 64)
+
+# Encodeur des embeddings : "torch" (SentenceTransformer fp32) ou "onnx"
+# (modèle int8 exporté par `python -m backend.encoders export`, sans PyTorch)
+EMBEDDING_BACKEND = os.getenv("YOLSDA_EMBEDDING_BACKEND", "torch")
+EMBEDDING_MODEL = os.getenv("YOLSDA_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+ONNX_MODEL_DIR = os.getenv("YOLSDA_ONNX_MODEL_DIR", os.path.join("models", "all-MiniLM-L6-v2-int8"))
+# Threads ONNX Runtime par worker (0 = tous les cœurs)
+ONNX_THREADS = _env_int("YOLSDA_ONNX_THREADS", 0)
+
+# Charge le modèle d'embeddings à l'import (avec gunicorn --preload, avant le fork)
+PRELOAD_MODEL = os.getenv("YOLSDA_PRELOAD_MODEL", "0") == "1"
+
+# Recherche hybride : nombre de candidats par classement (BM25 et vectoriel) avant fusion RRF
+LEXICAL_CANDIDATES = _env_int("YOLSDA_LEXICAL_CANDIDATES", 50)
+DENSE_CANDIDATES = _env_int("YOLSDA_DENSE_CANDIDATES", 50)
+RRF_K = _env_int("YOLSDA_RRF_K", 60)
+
+# Au-delà de cette taille de corpus, seuls les candidats BM25 sont scorés par le modèle
+LEXICAL_PREFILTER_MIN_DOCS = _env_int("YOLSDA_LEXICAL_PREFILTER_MIN_DOCS", 5000)
+
+# Recherche en deux étapes : candidats du bi-encodeur, puis top-k après reclassement
+RETRIEVAL_CANDIDATES = _env_int("YOLSDA_RETRIEVAL_CANDIDATES", 20)
+RETRIEVAL_TOP_K = _env_int("YOLSDA_RETRIEVAL_TOP_K", 2)
+
+# Cross-encoder de reclassement (vide = désactivé) et budget de latence en millisecondes
+RERANKER_MODEL = os.getenv("YOLSDA_RERANKER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_BUDGET_MS = _env_int("YOLSDA_RERANK_BUDGET_MS", 150)
+
+# Index réparti : URL des processus de shard (backend.shard_server), séparées par des
+# virgules (vide = index local). Délai de réponse par shard (ms) et nombre minimal de
+# shards ayant répondu pour qu'une recherche partielle soit acceptée
+SHARD_URLS = [url.strip() for url in os.getenv("YOLSDA_SHARD_URLS", "").split(",") if url.strip()]
+SHARD_TIMEOUT_MS = _env_int("YOLSDA_SHARD_TIMEOUT_MS", 500)
+SHARD_MIN_ANSWERS = _env_int("YOLSDA_SHARD_MIN_ANSWERS", 1)
+
+# Intervalle (secondes) de surveillance de DATA_DIR pour le rechargement à chaud (0 = désactivé)
+RELOAD_WATCH_INTERVAL = _env_int("YOLSDA_RELOAD_WATCH_INTERVAL", 30)
+
+# Limitation de débit de /chat et /api/chat par client (clé X-API-Key, sinon adresse IP) :
+# requêtes par minute (0 = désactivée, par défaut) et rafale maximale. Avec RATE_LIMIT_DB,
+# les seaux sont partagés par les workers dans cette base SQLite (vide = en mémoire, par
+# worker). Derrière un proxy, activer RATE_LIMIT_TRUST_PROXY (adresse lue dans
+# X-Forwarded-For) : sans lui, tous les clients partagent le seau de l'adresse du proxy.
+RATE_LIMIT_PER_MINUTE = _env_int("YOLSDA_RATE_LIMIT_PER_MINUTE", 0)
+RATE_LIMIT_BURST = _env_int("YOLSDA_RATE_LIMIT_BURST", 5)
+RATE_LIMIT_DB = os.getenv("YOLSDA_RATE_LIMIT_DB", "")
+RATE_LIMIT_TRUST_PROXY = os.getenv("YOLSDA_RATE_LIMIT_TRUST_PROXY", "0") == "1"
+
+# Appels simultanés à Ollama par worker ; au-delà, les requêtes attendent leur tour
+# (à tour de rôle entre clients), au plus GENERATION_MAX_QUEUED par client
+GENERATION_CONCURRENCY = _env_int("YOLSDA_GENERATION_CONCURRENCY", 1)
+GENERATION_MAX_QUEUED = _env_int("YOLSDA_GENERATION_MAX_QUEUED", 4)
+
+# Questions-réponses par lots (python -m backend.batch, POST /api/batch) : serveurs Ollama
+# utilisés (séparés par des virgules), générations simultanées par serveur, questions
+# recherchées ensemble, taille maximale d'un lot reçu par l'API et dossier de ses résultats
+BATCH_OLLAMA_URLS = [url.strip() for url in os.getenv("YOLSDA_BATCH_OLLAMA_URLS", OLLAMA_URL).split(",") if url.strip()]
+BATCH_CONCURRENCY = _env_int("YOLSDA_BATCH_CONCURRENCY", 2)
+BATCH_RETRIEVAL_SIZE = _env_int("YOLSDA_BATCH_RETRIEVAL_SIZE", 64)
+BATCH_MAX_ITEMS = _env_int("YOLSDA_BATCH_MAX_ITEMS", 1000)
+BATCH_DIR = os.getenv("YOLSDA_BATCH_DIR", "batches")
+
+# Taille minimale (octets) d'une réponse pour qu'elle soit compressée (gzip, ou brotli si installé)
+COMPRESSION_MIN_SIZE = _env_int("YOLSDA_COMPRESSION_MIN_SIZE", 1024)
+
+# Jeton exigé sur les endpoints /api/admin/* (vide = endpoints d'administration désactivés)
+ADMIN_TOKEN = os.getenv("YOLSDA_ADMIN_TOKEN", "")
+
+# Profileur : fraction des requêtes /api/chat échantillonnées (0 = désactivé au démarrage).
+# Un réglage fait via POST /api/admin/profiling (PROFILE_DIR/settings.json) s'applique à
+# tous les workers et prime sur ces valeurs tant que le fichier existe.
+PROFILE_SAMPLE_RATE = _env_float("YOLSDA_PROFILE_SAMPLE_RATE", 0.0)
+PROFILE_INTERVAL_MS = _env_int("YOLSDA_PROFILE_INTERVAL_MS", 5)
+PROFILE_DIR = os.getenv("YOLSDA_PROFILE_DIR", "profiles")
@@ -0,0 +1,170 @@
+"""
+Mémoire des conversations : derniers échanges en cache et résumé glissant des plus anciens
+"""
+
+import asyncio
+import re
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+from .lexical_index import fold_accents, tokenize
+
+# Marqueurs d'une question de suivi qui dépend du tour précédent
+FOLLOW_UP_PRONOUNS = {"ca", "cela", "ceci", "celui", "celle", "ceux", "celles", "lequel", "laquelle"}
+FOLLOW_UP_OPENERS = ("et ", "mais ", "alors ", "donc ", "aussi ", "dans ce cas", "et si ")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def first_sentence(text: str, max_chars: int) -> str:
+    sentence = SENTENCE_END.split(text.strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars].rstrip() + "…"
+
+
+def is_follow_up(query: str) -> bool:
+    """Question trop courte ou qui renvoie au tour précédent (« et pour une SARL ? »)"""
+    folded = fold_accents(query.lower()).strip()
+    words = set(re.findall(r"[a-z]+", folded))
+    return (
+        len(tokenize(query)) <= 2
+        or folded.startswith(FOLLOW_UP_OPENERS)
+        or bool(words & FOLLOW_UP_PRONOUNS)
+    )
+
+
+class ConversationState:
+    def __init__(self, recent_turns: int):
+        self.turns = deque(maxlen=recent_turns)
+        self.summary = deque()
+        # Tokens renvoyés par Ollama à la fin du dernier tour (`context` de /api/generate)
+        self.ollama_context = None
+        # Messages en base lors du chargement, plus les tours ajoutés depuis par ce worker
+        self.message_count = 0
+
+
+class ConversationMemory:
+    """Cache LRU, par conversation, des derniers tours (question, réponse).
+
+    Les tours qui sortent de la fenêtre récente sont compactés en une ligne de
+    résumé (première phrase de la question et de la réponse) ; le résumé est
+    lui-même borné. La taille de l'historique injecté dans le prompt reste donc
+    constante, quelle que soit la longueur de la conversation.
+
+    Le cache est propre au worker : load() le valide par le nombre de messages en
+    base, une autre instance ayant pu répondre dans la même conversation.
+    """
+
+    def __init__(self, db_manager, max_conversations: int = 500, recent_turns: int = 3,
+                 summary_lines: int = 6, turn_chars: int = 400, summary_line_chars: int = 160,
+                 write_queue=None):
+        self.db_manager = db_manager
+        # File d'écriture différée (WriteBehindQueue) vidée avant chaque validation
+        self.write_queue = write_queue
+        self.max_conversations = max_conversations
+        self.recent_turns = recent_turns
+        self.summary_lines = summary_lines
+        self.turn_chars = turn_chars
+        self.summary_line_chars = summary_line_chars
+        self._states: "OrderedDict[str, ConversationState]" = OrderedDict()
+
+    def _compact(self, state: ConversationState, message: str, response: str):
+        line = f"{first_sentence(message, self.summary_line_chars)} → {first_sentence(response, self.summary_line_chars)}"
+        state.summary.append(line)
+        while len(state.summary) > self.summary_lines:
+            state.summary.popleft()
+
+    def _push(self, state: ConversationState, message: str, response: str):
+        if len(state.turns) == state.turns.maxlen:
+            self._compact(state, *state.turns[0])
+        state.turns.append((message, response))
+
+    def _read(self, conversation_id: str, cached_count: Optional[int]):
+        """(nombre de messages, historique) ; l'historique n'est lu que s'il a changé"""
+        count = self.db_manager.count_messages(conversation_id)
+        if count == cached_count:
+            return count, None
+        return count, self.db_manager.get_conversation_history(
+            conversation_id, limit=self.recent_turns + self.summary_lines
+        )
+
+    def _store(self, conversation_id: str, count: int, history: List[dict]) -> ConversationState:
+        state = ConversationState(self.recent_turns)
+        # L'historique est renvoyé du plus récent au plus ancien
+        for turn in reversed(history):
+            self._push(state, turn["message"], turn["response"])
+        state.message_count = count
+
+        self._states[conversation_id] = state
+        while len(self._states) > self.max_conversations:
+            self._states.popitem(last=False)
+        return state
+
+    async def load(self, conversation_id: str) -> ConversationState:
+        """État à jour de la conversation : écritures en file enregistrées, puis état en
+        cache validé (ou rechargé) hors de la boucle d'événements"""
+        if self.write_queue is not None:
+            await self.write_queue.flush(conversation_id)
+        state = self._states.get(conversation_id)
+        count, history = await asyncio.to_thread(
+            self._read, conversation_id, state.message_count if state is not None else None
+        )
+        if history is None and self._states.get(conversation_id) is state:
+            self._states.move_to_end(conversation_id)
+            return state
+        # Absente ou complétée par un autre worker : le context Ollama de l'état en cache
+        # ne contient pas les derniers tours, il est abandonné avec lui
+        return self._store(conversation_id, count, history or [])
+
+    def get(self, conversation_id: str) -> ConversationState:
+        """État de la conversation en cache (voir load) ; lu en base s'il est absent"""
+        state = self._states.get(conversation_id)
+        if state is not None:
+            self._states.move_to_end(conversation_id)
+            return state
+        return self._store(conversation_id, *self._read(conversation_id, None))
+
+    def append(self, conversation_id: str, message: str, response: str):
+        """Ajoute un tour à une conversation déjà en cache (sinon il sera lu en base)"""
+        state = self._states.get(conversation_id)
+        if state is not None:
+            self._push(state, message, response)
+            state.message_count += 1
+
+    def ollama_context(self, conversation_id: str) -> Optional[List[int]]:
+        """Context Ollama du dernier tour, si la conversation est en cache"""
+        state = self._states.get(conversation_id)
+        return state.ollama_context if state is not None else None
+
+    def set_ollama_context(self, conversation_id: str, tokens: Optional[List[int]]):
+        # Conversation sortie du cache entre-temps : le context est simplement perdu
+        state = self._states.get(conversation_id)
+        if state is not None:
+            state.ollama_context = tokens or None
+
+    def forget(self, conversation_id: str):
+        self._states.pop(conversation_id, None)
+
+    def build_history(self, conversation_id: Optional[str]) -> str:
+        """Texte d'historique (résumé + derniers tours) à injecter dans le prompt"""
+        if not conversation_id:
+            return ""
+        state = self.get(conversation_id)
+        parts = []
+        if state.summary:
+            parts.append("Résumé des échanges précédents :\n" + "\n".join(f"- {line}" for line in state.summary))
+        for message, response in state.turns:
+            parts.append(f"Utilisateur : {message[:self.turn_chars]}\nAssistant : {response[:self.turn_chars]}")
+        return "\n\n".join(parts)
+
+    def rewrite_query(self, conversation_id: Optional[str], query: str) -> str:
+        """Complète une question de suivi (« et pour une SARL ? ») avec la question
+        précédente, afin que la recherche porte sur le bon sujet"""
+        if not conversation_id:
+            return query
+        state = self.get(conversation_id)
+        if not state.turns:
+            return query
+
+        if not is_follow_up(query):
+            return query
+        previous_question = state.turns[-1][0]
+        return f"{previous_question} {query}"
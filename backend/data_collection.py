@@ -8,6 +8,7 @@ from bs4 import BeautifulSoup
 import json
 import time
 import os
+import hashlib
 from datetime import datetime
 import PyPDF2
 from urllib.parse import urljoin, urlparse
@@ -20,6 +21,11 @@ class EntrepreneurshipDataCollector:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
+        # Téléchargements PDF : lecture par blocs et plafond de taille
+        self.chunk_size = 64 * 1024
+        self.max_pdf_bytes = 50 * 1024 * 1024
+        self.manifest_path = 'data/pdfs/manifest.json'
+        
         # Créer les dossiers nécessaires
         os.makedirs('data', exist_ok=True)
         os.makedirs('data/pdfs', exist_ok=True)
@@ -97,22 +103,120 @@ class EntrepreneurshipDataCollector:
             self.scrape_article(url, "entrepreneuriat")
             time.sleep(2)
     
-    def download_pdf(self, url, filename):
-        """Télécharge un PDF"""
+    @staticmethod
+    def content_range_start(value):
+        """Premier octet d'un en-tête Content-Range (« bytes 1000-1999/5000 »), ou None"""
+        try:
+            unit, _, byte_range = (value or '').strip().partition(' ')
+            if unit != 'bytes':
+                return None
+            return int(byte_range.split('-', 1)[0])
+        except ValueError:
+            return None
+    
+    def download_pdf(self, url, filename, max_bytes=None, restarted=False):
+        """Télécharge un PDF en streaming (reprise HTTP Range, taille plafonnée, checksum).
+        `restarted` : nouvelle tentative depuis zéro, après une reprise refusée (une seule)"""
+        max_bytes = max_bytes or self.max_pdf_bytes
+        filepath = f"data/pdfs/{filename}"
+        part_path = filepath + ".part"
+        
         try:
             print(f"📥 Téléchargement PDF: {filename}")
-            response = requests.get(url, headers=self.headers, timeout=30)
             
-            filepath = f"data/pdfs/{filename}"
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+            # Reprend un téléchargement interrompu à partir du fichier partiel
+            sha256 = hashlib.sha256()
+            downloaded = 0
+            if os.path.exists(part_path):
+                with open(part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                        sha256.update(chunk)
+                        downloaded += len(chunk)
+            
+            headers = dict(self.headers)
+            if downloaded:
+                headers['Range'] = f"bytes={downloaded}-"
+                print(f"   ↪️  Reprise à {downloaded} octets")
+            
+            with requests.get(url, headers=headers, timeout=30, stream=True) as response:
+                if response.status_code == 416 and downloaded and not restarted:
+                    # Le fichier partiel est invalide côté serveur : on repart de zéro, une seule fois
+                    response.close()
+                    os.remove(part_path)
+                    return self.download_pdf(url, filename, max_bytes, restarted=True)
+                response.raise_for_status()
+                
+                if downloaded:
+                    # 200 : le serveur ignore Range et renvoie le fichier entier
+                    start = self.content_range_start(response.headers.get('Content-Range')) \
+                        if response.status_code == 206 else 0
+                    if start == 0:
+                        # Contenu depuis le début : on recommence le fichier
+                        sha256 = hashlib.sha256()
+                        downloaded = 0
+                    elif start != downloaded:
+                        # Plage différente de celle demandée : le fichier partiel ne peut être complété
+                        if restarted:
+                            raise requests.HTTPError(f"Content-Range inattendu: {response.headers.get('Content-Range')}")
+                        response.close()
+                        os.remove(part_path)
+                        return self.download_pdf(url, filename, max_bytes, restarted=True)
+                
+                content_length = response.headers.get('Content-Length')
+                if content_length and downloaded + int(content_length) > max_bytes:
+                    raise ValueError(f"PDF trop volumineux ({downloaded + int(content_length)} octets > {max_bytes})")
+                
+                with open(part_path, 'ab' if downloaded else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if not chunk:
+                            continue
+                        downloaded += len(chunk)
+                        if downloaded > max_bytes:
+                            raise ValueError(f"PDF trop volumineux (> {max_bytes} octets)")
+                        sha256.update(chunk)
+                        f.write(chunk)
             
-            print(f"✅ PDF téléchargé: {filename}")
+            # Renommage atomique : le PDF final n'est jamais partiel
+            os.replace(part_path, filepath)
+            
+            checksum = sha256.hexdigest()
+            self.record_manifest_entry(filename, {
+                "url": url,
+                "sha256": checksum,
+                "size": downloaded,
+                "downloaded_at": datetime.now().isoformat()
+            })
+            
+            print(f"✅ PDF téléchargé: {filename} ({downloaded} octets, sha256 {checksum[:12]}…)")
             return filepath
+        except ValueError as e:
+            # Dépassement du plafond : le fichier partiel n'a pas vocation à être repris
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            print(f"❌ Erreur téléchargement {filename}: {str(e)}")
+            return None
         except Exception as e:
+            # Le fichier .part est conservé pour une reprise ultérieure
             print(f"❌ Erreur téléchargement {filename}: {str(e)}")
             return None
     
+    def load_manifest(self):
+        """Charge le manifeste d'ingestion des PDFs"""
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+    
+    def record_manifest_entry(self, filename, entry):
+        """Enregistre (atomiquement) une entrée dans le manifeste d'ingestion"""
+        manifest = self.load_manifest()
+        manifest[filename] = entry
+        
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+    
     def extract_text_from_pdf(self, pdf_path):
         """Extrait le texte d'un PDF"""
         try:
@@ -131,6 +235,7 @@ class EntrepreneurshipDataCollector:
         print("\n📚 Traitement des PDFs...")
         
         pdf_files = [f for f in os.listdir('data/pdfs') if f.endswith('.pdf')]
+        manifest = self.load_manifest()
         
         for pdf_file in pdf_files:
             pdf_path = f"data/pdfs/{pdf_file}"
@@ -147,6 +252,8 @@ class EntrepreneurshipDataCollector:
                     "category": "entrepreneuriat",
                     "type": "pdf"
                 }
+                if pdf_file in manifest:
+                    document["sha256"] = manifest[pdf_file]["sha256"]
                 self.corpus.append(document)
                 print(f"✅ PDF traité: {pdf_file}")
     
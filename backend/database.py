@@ -1,17 +1,105 @@
+import html
+import re
 import sqlite3
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
+
+from .archive import ConversationArchive
+from .lexical_index import fold_accents
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Longueur minimale du dernier mot pour une recherche par préfixe (un préfixe très
+# court correspond à une grande partie de l'index)
+PREFIX_MIN_CHARS = 3
+
+
+def highlight_snippet(text: str, terms: List[str], width: int) -> str:
+    """Extrait d'environ `width` mots autour de la première occurrence d'un terme,
+    échappé en HTML, les termes trouvés entourés de <mark>. Comme dans la requête
+    FTS5, le dernier terme est un préfixe s'il compte au moins PREFIX_MIN_CHARS."""
+    text = text or ""
+    words = list(WORD_PATTERN.finditer(text))
+
+    def matches(word: str) -> bool:
+        folded = fold_accents(word).lower()
+        if len(terms[-1]) >= PREFIX_MIN_CHARS:
+            return folded in terms[:-1] or folded.startswith(terms[-1])
+        return folded in terms
+
+    hits = [i for i, word in enumerate(words) if matches(word.group())]
+    first = max(0, (hits[0] if hits else 0) - width // 3)
+    window = words[first:first + width]
+    if not window:
+        return html.escape(text)
+
+    start = 0 if first == 0 else window[0].start()
+    end = len(text) if first + width >= len(words) else window[-1].end()
+    parts = ["…"] if start else []
+    position = start
+    for i, word in enumerate(window, first):
+        parts.append(html.escape(text[position:word.start()]))
+        escaped = html.escape(word.group())
+        parts.append(f"<mark>{escaped}</mark>" if i in hits else escaped)
+        position = word.end()
+    parts.append(html.escape(text[position:end]))
+    if end < len(text):
+        parts.append("…")
+    return "".join(parts)
 
 class DatabaseManager:
-    def __init__(self, db_path: str = "chat_history.db"):
+    def __init__(self, db_path: str = "chat_history.db", archive_dir: Optional[str] = None):
         self.db_path = db_path
+        # Conversations anciennes déplacées hors de la base (voir backend.archive)
+        self.archive = ConversationArchive(archive_dir) if archive_dir else None
+        # Fonctions appelées avec la liste des événements après chaque écriture validée
+        self.listeners: List[Callable[[List[dict]], None]] = []
         self.init_db()
+
+    def add_listener(self, callback: Callable[[List[dict]], None]):
+        self.listeners.append(callback)
+
+    def _notify(self, cursor, events: List[dict]):
+        """Diffuse les événements d'une transaction validée, avec la révision atteinte"""
+        if not events or not self.listeners:
+            return
+        revision = self._read_revision(cursor)
+        for event in events:
+            event["revision"] = revision
+        for listener in self.listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                print(f"Erreur lors de la diffusion des événements: {e}")
+
+    @staticmethod
+    def _now() -> str:
+        # Même format que CURRENT_TIMESTAMP (UTC)
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    @staticmethod
+    def _read_revision(cursor) -> int:
+        cursor.execute("SELECT revision FROM sync_state")
+        return cursor.fetchone()[0]
+
+    def get_revision(self) -> int:
+        """Révision de la liste des conversations, incrémentée à chaque modification
+        (partagée par tous les processus : sert d'ETag)"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return self._read_revision(conn.cursor())
+        finally:
+            conn.close()
     
     def init_db(self):
         """Initialise la base de données avec les tables nécessaires"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        
+
+        # Base neuve : pages libérées récupérables sans VACUUM complet (sans effet
+        # sur une base existante, voir enable_incremental_vacuum)
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
         # Création de la table des conversations
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS conversations (
@@ -53,20 +141,134 @@ class DatabaseManager:
             except Exception:
                 pass
 
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversations_conversation_id ON conversations (conversation_id)"
+        )
+        # Lecture, archivage et suppression d'une conversation sans parcourir tous les messages
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages (conversation_id, created_at)"
+        )
+        # Sélection des conversations inactives par la rétention
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations (updated_at)")
+        self.init_search_index(cursor)
+        self.init_revision(cursor)
+        self.init_archive_index(cursor)
+
         conn.commit()
         conn.close()
+
+    def init_archive_index(self, cursor):
+        """Emplacement, dans les fichiers d'archive, des conversations archivées"""
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_conversations (
+            conversation_id TEXT PRIMARY KEY,
+            title TEXT,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            message_count INTEGER NOT NULL,
+            archive_file TEXT NOT NULL,
+            archive_offset INTEGER NOT NULL,
+            archive_length INTEGER NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_archived_conversations_file ON archived_conversations (archive_file)"
+        )
+
+    def init_revision(self, cursor):
+        """Compteur de révision des conversations, maintenu par des triggers"""
+        cursor.execute("CREATE TABLE IF NOT EXISTS sync_state (revision INTEGER NOT NULL)")
+        cursor.execute("INSERT INTO sync_state (revision) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM sync_state)")
+        for operation in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS conversations_revision_{operation.lower()}
+            AFTER {operation} ON conversations BEGIN
+                UPDATE sync_state SET revision = revision + 1;
+            END
+            ''')
+
+    def init_search_index(self, cursor):
+        """Index plein texte (FTS5) des messages, synchronisé par des triggers"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'")
+        exists = cursor.fetchone() is not None
+
+        # Table à contenu externe : le texte n'est pas dupliqué, seul l'index est stocké.
+        # remove_diacritics : « creation » trouve « création » ; prefix : recherche à la frappe
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            message, response,
+            content='messages', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, message, response) VALUES (new.id, new.message, new.response);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message, response)
+            VALUES ('delete', old.id, old.message, old.response);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message, response)
+            VALUES ('delete', old.id, old.message, old.response);
+            INSERT INTO messages_fts (rowid, message, response) VALUES (new.id, new.message, new.response);
+        END
+        ''')
+
+        if not exists:
+            # Base existante : indexe les messages antérieurs à la création de l'index
+            cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
     
     def save_message(self, conversation_id: str, message: str, response: str, sources: List[str]):
         """Sauvegarde un message et sa réponse dans la base de données"""
+        self.save_messages([(conversation_id, message, response, sources)])
+
+    def save_messages(self, batch: List[tuple]):
+        """Sauvegarde un lot de (conversation_id, message, réponse, sources) en une transaction"""
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Vérifie si la conversation existe, sinon la crée
-        # Crée la conversation si elle n'existe pas (sans title)
+        try:
+            cursor = conn.cursor()
+            events, stale_archives = [], []
+            for conversation_id, message, response, sources in batch:
+                events.extend(self._insert_message(cursor, conversation_id, message, response, sources,
+                                                   stale_archives))
+            conn.commit()
+            self._remove_archives(stale_archives)
+            self._notify(cursor, events)
+        finally:
+            conn.close()
+
+    def _insert_conversation(self, cursor, conversation_id: str, title: Optional[str] = None) -> bool:
+        """Crée la conversation si elle n'existe pas ; retourne True si elle a été créée"""
+        # conversation_id n'est pas unique dans le schéma : INSERT OR IGNORE dupliquerait la ligne
         cursor.execute(
-            "INSERT OR IGNORE INTO conversations (conversation_id) VALUES (?)",
-            (conversation_id,)
+            """
+            INSERT INTO conversations (conversation_id, title)
+            SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM conversations WHERE conversation_id = ?)
+            """,
+            (conversation_id, title, conversation_id)
         )
+        return cursor.rowcount == 1
+
+    def _insert_message(self, cursor, conversation_id: str, message: str, response: str,
+                        sources: List[str], stale_archives: List[str]) -> List[dict]:
+        events = []
+        # Conversation archivée qui reprend : elle revient d'abord dans la base
+        restored = self._restore_archived(cursor, conversation_id, stale_archives)
+        if restored:
+            events.append({"type": "created", "conversation_id": conversation_id, "title": restored["title"],
+                           "created_at": restored["created_at"]})
+        # Vérifie si la conversation existe, sinon la crée (sans title)
+        elif self._insert_conversation(cursor, conversation_id):
+            events.append({"type": "created", "conversation_id": conversation_id, "title": None,
+                           "created_at": self._now()})
         
         # Met à jour le timestamp de la conversation
         cursor.execute(
@@ -88,26 +290,27 @@ class DatabaseManager:
             )
         except Exception:
             # Ne pas bloquer la sauvegarde si la mise à jour du snippet échoue
-            pass
+            snippet = None
 
-        conn.commit()
-        conn.close()
+        events.append({"type": "message", "conversation_id": conversation_id, "snippet": snippet,
+                       "updated_at": self._now()})
+        return events
 
     def create_conversation(self, conversation_id: str, title: Optional[str] = None):
         """Crée une conversation avec un titre optionnel"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
-        cursor.execute(
-            "INSERT OR IGNORE INTO conversations (conversation_id, title) VALUES (?, ?)",
-            (conversation_id, title)
-        )
+        created = self._insert_conversation(cursor, conversation_id, title)
         cursor.execute(
             "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE conversation_id = ?",
             (conversation_id,)
         )
 
         conn.commit()
+        if created:
+            self._notify(cursor, [{"type": "created", "conversation_id": conversation_id, "title": title,
+                                   "created_at": self._now()}])
         conn.close()
 
     def update_conversation_title(self, conversation_id: str, title: str):
@@ -121,6 +324,9 @@ class DatabaseManager:
         )
 
         conn.commit()
+        if cursor.rowcount:
+            self._notify(cursor, [{"type": "renamed", "conversation_id": conversation_id, "title": title,
+                                   "updated_at": self._now()}])
         conn.close()
 
     def get_conversation(self, conversation_id: str, limit: int = 100) -> dict:
@@ -135,7 +341,8 @@ class DatabaseManager:
         row = cursor.fetchone()
         if not row:
             conn.close()
-            return {}
+            # Absente de la base : peut-être archivée (relue à la demande)
+            return self.get_archived_conversation(conversation_id, limit)
 
         conv = {
             "id": row[0],
@@ -171,6 +378,16 @@ class DatabaseManager:
         conn.close()
         return conv
     
+    def count_messages(self, conversation_id: str) -> int:
+        """Nombre de messages (non archivés) d'une conversation"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,))
+            return cursor.fetchone()[0]
+        finally:
+            conn.close()
+
     def get_conversation_history(self, conversation_id: str, limit: int = 10) -> List[dict]:
         """Récupère l'historique d'une conversation"""
         conn = sqlite3.connect(self.db_path)
@@ -181,7 +398,7 @@ class DatabaseManager:
             SELECT message, response, sources, created_at 
             FROM messages 
             WHERE conversation_id = ? 
-            ORDER BY created_at DESC 
+            ORDER BY created_at DESC, id DESC 
             LIMIT ?
             """,
             (conversation_id, limit)
@@ -195,8 +412,16 @@ class DatabaseManager:
                 "sources": row[2].split(",") if row[2] else [],
                 "created_at": row[3]
             })
-        
+
         conn.close()
+        if not history:
+            archived = self._read_archived(conversation_id)
+            if archived:
+                history = [
+                    {"message": m["message"], "response": m["response"],
+                     "sources": m["sources"].split(",") if m["sources"] else [], "created_at": m["created_at"]}
+                    for m in reversed(archived["messages"][-limit:])
+                ]
         return history
     
     def get_all_conversations(self, limit: int = 20) -> List[dict]:
@@ -257,6 +482,84 @@ class DatabaseManager:
         conn.close()
         return conversations
 
+    @staticmethod
+    def fts_query(words: List[str]) -> str:
+        """Requête FTS5 : tous les mots doivent être présents, le dernier pouvant
+        être incomplet (recherche à la frappe)"""
+        terms = [f'"{word}"' for word in words]
+        if len(words[-1]) >= PREFIX_MIN_CHARS:
+            terms[-1] += "*"
+        return " ".join(terms)
+
+    def search_messages(self, query: str, limit: int = 20, offset: int = 0, max_candidates: int = 2000) -> dict:
+        """Recherche plein texte dans l'historique, classée par pertinence (BM25).
+
+        Seules les max_candidates correspondances les plus récentes sont classées :
+        le coût reste borné même pour un terme présent dans des millions de messages.
+        Les extraits sont échappés en HTML, les termes trouvés entourés de <mark>.
+        """
+        words = WORD_PATTERN.findall(query)
+        if not words:
+            return {"query": query, "results": [], "limit": limit, "offset": offset, "has_more": False}
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            # Parcours de l'index par rowid décroissant (arrêt après max_candidates), puis
+            # classement ; une ligne de plus que demandé indique s'il existe une page suivante
+            cursor.execute(
+                """
+                SELECT rowid, rank FROM (
+                    SELECT rowid, rank FROM messages_fts
+                    WHERE messages_fts MATCH ?
+                    ORDER BY rowid DESC
+                    LIMIT ?
+                )
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+                """,
+                (self.fts_query(words), max_candidates, limit + 1, offset)
+            )
+            ranked = cursor.fetchall()
+            page = ranked[:limit]
+
+            # Messages de la page seulement (accès par clé primaire)
+            rows = {}
+            if page:
+                placeholders = ",".join("?" * len(page))
+                cursor.execute(
+                    f"""
+                    SELECT m.id, m.conversation_id,
+                           (SELECT c.title FROM conversations c
+                            WHERE c.conversation_id = m.conversation_id AND c.title IS NOT NULL LIMIT 1),
+                           m.message, m.response, m.created_at
+                    FROM messages m
+                    WHERE m.id IN ({placeholders})
+                    """,
+                    [rowid for rowid, _ in page]
+                )
+                rows = {row[0]: row for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+        terms = [fold_accents(word).lower() for word in words]
+        results = []
+        for rowid, rank in page:
+            row = rows.get(rowid)
+            if row is None:
+                continue
+            results.append({
+                "message_id": row[0],
+                "conversation_id": row[1],
+                "title": row[2] or "Nouvelle conversation",
+                "message": highlight_snippet(row[3], terms, 16),
+                "response": highlight_snippet(row[4], terms, 24),
+                "created_at": row[5],
+                # bm25() est négatif : plus il est petit, plus le message est pertinent
+                "score": round(-rank, 4)
+            })
+        return {"query": query, "results": results, "limit": limit, "offset": offset, "has_more": len(ranked) > limit}
+
     def delete_conversation(self, conversation_id: str):
         """Supprime une conversation et tous ses messages"""
         conn = sqlite3.connect(self.db_path)
@@ -274,12 +577,234 @@ class DatabaseManager:
                 "DELETE FROM conversations WHERE conversation_id = ?",
                 (conversation_id,)
             )
-            
+            deleted = cursor.rowcount
+
+            # Et son éventuelle copie archivée, retirée aussi du fichier d'archive
+            stale_archives = []
+            archived = self._release_archived(cursor, conversation_id, stale_archives)
+
             conn.commit()
+            self._remove_archives(stale_archives)
+            if deleted or archived:
+                self._notify(cursor, [{"type": "deleted", "conversation_id": conversation_id}])
         except Exception as e:
             conn.rollback()
             raise e
         finally:
             conn.close()
 
-  
\ No newline at end of file
+    # Rétention : archivage, relecture et compaction
+
+    def archive_conversations(self, older_than_days: int, limit: int = 200) -> int:
+        """Archive jusqu'à `limit` conversations inactives depuis `older_than_days` jours ;
+        retourne le nombre de conversations archivées"""
+        if self.archive is None:
+            raise RuntimeError("Aucun dossier d'archives configuré")
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT conversation_id, title, snippet, created_at, updated_at FROM conversations "
+                "WHERE updated_at < ? ORDER BY updated_at LIMIT ?",
+                (cutoff, limit)
+            )
+            conversations = []
+            for conversation_id, title, snippet, created_at, updated_at in cursor.fetchall():
+                cursor.execute(
+                    "SELECT message, response, sources, created_at FROM messages "
+                    "WHERE conversation_id = ? ORDER BY created_at ASC, id ASC",
+                    (conversation_id,)
+                )
+                conversations.append({
+                    "conversation_id": conversation_id, "title": title, "snippet": snippet,
+                    "created_at": created_at, "updated_at": updated_at,
+                    "messages": [dict(zip(("message", "response", "sources", "created_at"), m))
+                                 for m in cursor.fetchall()],
+                })
+            if not conversations:
+                return 0
+
+            # Fichier écrit et synchronisé sur disque avant toute suppression
+            archive_file, locations = self.archive.write(conversations)
+
+            archived, events = 0, []
+            for conversation, (offset, length) in zip(conversations, locations):
+                conversation_id = conversation["conversation_id"]
+                # Un message arrivé depuis la lecture : la conversation reste dans la base
+                cursor.execute(
+                    "DELETE FROM conversations WHERE conversation_id = ? AND updated_at = ?",
+                    (conversation_id, conversation["updated_at"])
+                )
+                if not cursor.rowcount:
+                    continue
+                cursor.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                cursor.execute(
+                    """
+                    INSERT OR REPLACE INTO archived_conversations (conversation_id, title, created_at, updated_at,
+                        message_count, archive_file, archive_offset, archive_length)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (conversation_id, conversation["title"], conversation["created_at"], conversation["updated_at"],
+                     len(conversation["messages"]), archive_file, offset, length)
+                )
+                archived += 1
+                events.append({"type": "archived", "conversation_id": conversation_id})
+            conn.commit()
+            if not archived:
+                self.archive.remove(archive_file)
+            self._notify(cursor, events)
+            return archived
+        finally:
+            conn.close()
+
+    def _read_archived(self, conversation_id: str, cursor=None) -> Optional[dict]:
+        if self.archive is None:
+            return None
+        conn = None
+        if cursor is None:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT archive_file, archive_offset, archive_length FROM archived_conversations "
+                "WHERE conversation_id = ?",
+                (conversation_id,)
+            )
+            row = cursor.fetchone()
+        finally:
+            if conn:
+                conn.close()
+        return self.archive.read(*row) if row else None
+
+    def get_archived_conversation(self, conversation_id: str, limit: int = 100) -> dict:
+        """Conversation archivée, au même format que get_conversation (avec archived=True)"""
+        archived = self._read_archived(conversation_id)
+        if not archived:
+            return {}
+        conv = {
+            "id": conversation_id,
+            "title": archived["title"] or "Nouvelle conversation",
+            "snippet": archived["snippet"],
+            "created_at": archived["created_at"],
+            "updated_at": archived["updated_at"],
+            "archived": True,
+            "messages": []
+        }
+        for m in archived["messages"][:limit]:
+            conv["messages"].append({"content": m["message"], "sender": "user", "timestamp": m["created_at"]})
+            conv["messages"].append({"content": m["response"], "sender": "ai", "timestamp": m["created_at"],
+                                     "sources": m["sources"].split(",") if m["sources"] else []})
+        return conv
+
+    def _restore_archived(self, cursor, conversation_id: str, stale_archives: List[str]) -> Optional[dict]:
+        """Réintègre une conversation archivée dans la base (transaction en cours)"""
+        archived = self._read_archived(conversation_id, cursor)
+        if not archived:
+            return None
+        cursor.execute(
+            "INSERT INTO conversations (conversation_id, title, snippet, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (conversation_id, archived["title"], archived["snippet"], archived["created_at"], archived["updated_at"])
+        )
+        cursor.executemany(
+            "INSERT INTO messages (conversation_id, message, response, sources, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(conversation_id, m["message"], m["response"], m["sources"], m["created_at"])
+             for m in archived["messages"]]
+        )
+        self._release_archived(cursor, conversation_id, stale_archives)
+        return archived
+
+    def _release_archived(self, cursor, conversation_id: str, stale_archives: List[str]) -> bool:
+        """Retire une conversation des archives (transaction en cours). Son fichier est
+        réécrit sans elle, avec les conversations qui y restent : le texte restauré ou
+        supprimé ne subsiste pas sur disque. L'ancien fichier est ajouté à
+        `stale_archives`, à supprimer une fois la transaction validée."""
+        if self.archive is None:
+            return False
+        cursor.execute("SELECT archive_file FROM archived_conversations WHERE conversation_id = ?", (conversation_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return False
+        archive_file = row[0]
+        cursor.execute("DELETE FROM archived_conversations WHERE conversation_id = ?", (conversation_id,))
+        cursor.execute(
+            "SELECT conversation_id, archive_offset, archive_length FROM archived_conversations "
+            "WHERE archive_file = ? ORDER BY archive_offset",
+            (archive_file,)
+        )
+        remaining = cursor.fetchall()
+        if remaining:
+            # Nouveau fichier écrit et synchronisé avant la mise à jour des positions
+            new_file, locations = self.archive.write(
+                [self.archive.read(archive_file, offset, length) for _, offset, length in remaining]
+            )
+            cursor.executemany(
+                "UPDATE archived_conversations SET archive_file = ?, archive_offset = ?, archive_length = ? "
+                "WHERE conversation_id = ?",
+                [(new_file, offset, length, other_id)
+                 for (other_id, _, _), (offset, length) in zip(remaining, locations)]
+            )
+        stale_archives.append(archive_file)
+        return True
+
+    def _remove_archives(self, archive_files: List[str]):
+        for archive_file in archive_files:
+            self.archive.remove(archive_file)
+
+    def remove_orphan_archives(self, min_age_s: float = 3600) -> int:
+        """Supprime les fichiers d'archive auxquels plus aucune conversation ne renvoie
+        (arrêt entre la validation d'une transaction et la suppression de l'ancien
+        fichier). Les fichiers récents sont épargnés : leur transaction est peut-être en cours."""
+        if self.archive is None:
+            return 0
+        conn = sqlite3.connect(self.db_path)
+        try:
+            referenced = {row[0] for row in conn.execute("SELECT DISTINCT archive_file FROM archived_conversations")}
+        finally:
+            conn.close()
+        removed = 0
+        for name in self.archive.files():
+            if name not in referenced and self.archive.age(name) >= min_age_s:
+                self.archive.remove(name)
+                removed += 1
+        return removed
+
+    def incremental_vacuum(self, max_pages: int = 0) -> dict:
+        """Rend au système jusqu'à `max_pages` pages libres (0 = toutes) ; appelé par
+        petites étapes, il ne bloque les écritures que brièvement"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if mode != 2:
+                # Base créée avant l'activation : voir enable_incremental_vacuum
+                return {"incremental_vacuum": False, "free_pages": free_before}
+            # executescript exécute la pragma jusqu'au bout (execute ne libère qu'une page)
+            conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+            free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            return {
+                "incremental_vacuum": True,
+                "freed_pages": free_before - free_after,
+                "freed_mb": round((free_before - free_after) * page_size / 1e6, 2),
+                "free_pages": free_after,
+            }
+        finally:
+            conn.close()
+
+    def enable_incremental_vacuum(self) -> dict:
+        """Passe une base existante en auto_vacuum=INCREMENTAL. Nécessite un VACUUM
+        complet, qui réécrit le fichier et bloque les écritures : opération ponctuelle,
+        à lancer hors des heures d'affluence"""
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return {
+                "auto_vacuum": conn.execute("PRAGMA auto_vacuum").fetchone()[0],
+                "pages_before": pages_before,
+                "pages_after": conn.execute("PRAGMA page_count").fetchone()[0],
+            }
+        finally:
+            conn.close()
@@ -0,0 +1,169 @@
+"""
+Encodeurs de texte pour la recherche vectorielle
+
+Interface commune : `encode(textes)` retourne une matrice float32 (n, dim)
+de vecteurs normalisés, et `name` identifie le modèle et son exécution
+(il entre dans la clé de l'index : des embeddings produits par deux
+encodeurs différents ne sont jamais mélangés).
+
+- "torch" : SentenceTransformer en fp32 (PyTorch) ;
+- "onnx" : même modèle exporté en ONNX et quantifié en int8, exécuté par
+  ONNX Runtime avec le tokenizer Rust de `tokenizers`, sans PyTorch.
+
+Le modèle ONNX est produit une fois, hors ligne (PyTorch requis pour l'export) :
+
+    python -m backend.encoders export --output models/all-MiniLM-L6-v2-int8
+"""
+
+import argparse
+import json
+import os
+from typing import List
+
+from . import config
+
+# Module importé par chaque implémentation (phase « imports » du démarrage)
+BACKEND_MODULES = {"torch": "sentence_transformers", "onnx": "onnxruntime"}
+
+
+class SentenceTransformerEncoder:
+    def __init__(self, model_name: str = config.EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.name = f"torch:{model_name}"
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False):
+        import numpy as np
+        embeddings = self.model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar)
+        return np.asarray(embeddings, dtype=np.float32)
+
+
+class OnnxEncoder:
+    """Modèle exporté par `export_onnx` : transformer en ONNX, puis pooling moyen
+    sur le masque d'attention et normalisation L2 (comme SentenceTransformer)"""
+
+    def __init__(self, model_dir: str = config.ONNX_MODEL_DIR, threads: int = config.ONNX_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, "encoder.json"), "r", encoding="utf-8") as f:
+            self.settings = json.load(f)
+        self.max_length = self.settings["max_length"]
+        self.normalize = self.settings.get("normalize", True)
+        self.name = f"onnx-{self.settings['quantization']}:{self.settings['model_name']}"
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.max_length)
+        self.tokenizer.enable_padding(pad_id=self.settings.get("pad_id", 0))
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            # Plusieurs workers par machine : on évite qu'ils se disputent tous les cœurs
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, self.settings["model_file"]), options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False):
+        import numpy as np
+        if not texts:
+            return np.zeros((0, self.settings["dimension"]), dtype=np.float32)
+        # Tri par longueur : moins de remplissage dans chaque lot
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        output = np.empty((len(texts), self.settings["dimension"]), dtype=np.float32)
+        for offset in range(0, len(texts), batch_size):
+            batch = order[offset:offset + batch_size]
+            output[batch] = self._encode_batch([texts[i] for i in batch])
+        return output
+
+    def _encode_batch(self, texts: List[str]):
+        import numpy as np
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled
+
+
+def load_encoder(backend: str = config.EMBEDDING_BACKEND):
+    """Instancie l'encodeur configuré"""
+    if backend == "onnx":
+        return OnnxEncoder()
+    if backend != "torch":
+        raise ValueError(f"Encodeur inconnu: {backend} (attendu: torch ou onnx)")
+    return SentenceTransformerEncoder()
+
+
+def export_onnx(output_dir: str, model_name: str = config.EMBEDDING_MODEL, quantize: bool = True):
+    """Exporte le transformer de SentenceTransformer en ONNX et le quantifie en int8
+    (quantification dynamique des poids ; les activations restent en float)"""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    auto_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+    os.makedirs(output_dir, exist_ok=True)
+
+    sample = tokenizer(["exemple de phrase"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            auto_model, tuple(sample[name] for name in input_names), fp32_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=14
+        )
+
+    model_file = "model.onnx"
+    if quantize:
+        model_file = "model.int8.onnx"
+        quantize_dynamic(fp32_path, os.path.join(output_dir, model_file), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_dir)
+    settings = {
+        "model_name": model_name,
+        "model_file": model_file,
+        "quantization": "int8" if quantize else "fp32",
+        "max_length": model.max_seq_length,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "normalize": any(type(module).__name__ == "Normalize" for module in model),
+        "pad_id": tokenizer.pad_token_id or 0,
+    }
+    with open(os.path.join(output_dir, "encoder.json"), "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=2)
+    print(f"Modèle ONNX ({settings['quantization']}) écrit dans {output_dir}")
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outils d'encodeur Yolsda")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="exporte le modèle d'embeddings en ONNX int8")
+    export.add_argument("--output", default=config.ONNX_MODEL_DIR)
+    export.add_argument("--model", default=config.EMBEDDING_MODEL)
+    export.add_argument("--no-quantize", action="store_true", help="conserve les poids en float32")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.output, args.model, quantize=not args.no_quantize)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Diffusion des événements de conversation (Server-Sent Events)
+
+DatabaseManager signale chaque écriture validée (création, renommage,
+suppression, nouveau message) ; le courtier les relaie aux onglets abonnés.
+Un abonné inactif ne coûte qu'une coroutine en attente. Les écritures des
+autres workers ne passent pas par ce processus : tant qu'il y a des abonnés,
+une seule lecture périodique de la révision par worker les détecte et
+demande aux clients de se resynchroniser (GET conditionnel).
+"""
+
+import asyncio
+import json
+import signal
+from typing import List, Optional, Set
+
+from . import metrics
+
+connected_clients = metrics.registry.counter(
+    "yolsda_sse_connections_total", "Connexions au flux d'événements des conversations"
+)
+
+# Commentaire SSE envoyé sans activité, pour que les proxys ne coupent pas la connexion
+KEEPALIVE = ": keepalive\n\n"
+RESYNC = object()
+# Fin du flux (arrêt du serveur)
+END_OF_STREAM = None
+
+
+class EventBroker:
+    def __init__(self, db_manager, max_queue: int = 100, keepalive_s: float = 25, resync_interval_s: float = 5):
+        self.db_manager = db_manager
+        self.max_queue = max_queue
+        self.keepalive_s = keepalive_s
+        self.resync_interval_s = resync_interval_s
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.revision = db_manager.get_revision()
+        self.watch_task = None
+        db_manager.add_listener(self.publish)
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def publish(self, events: List[dict]):
+        """Appelé par DatabaseManager, éventuellement depuis un thread d'écriture"""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._dispatch, events)
+
+    def _dispatch(self, events):
+        if events is RESYNC:
+            payloads = [{"type": "resync", "revision": self.revision}]
+        else:
+            self.revision = max(self.revision, max(event["revision"] for event in events))
+            payloads = events
+        for queue in list(self.subscribers):
+            try:
+                for payload in payloads:
+                    queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Client trop lent : on le déconnecte, il se resynchronisera à la reconnexion
+                self.subscribers.discard(queue)
+
+    def stop_on_signals(self):
+        """Termine les flux dès la réception de SIGINT/SIGTERM : le serveur attend la
+        fermeture des connexions ouvertes avant d'exécuter l'arrêt de l'application,
+        une connexion SSE bloquerait donc l'arrêt"""
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                previous = signal.getsignal(sig)
+                if not callable(previous):
+                    continue
+
+                def handler(signum, frame, previous=previous):
+                    self.loop.call_soon_threadsafe(self.end_streams)
+                    previous(signum, frame)
+
+                signal.signal(sig, handler)
+            except ValueError:
+                # Hors du thread principal : pas de gestion des signaux
+                return
+
+    def end_streams(self):
+        for queue in list(self.subscribers):
+            self.subscribers.discard(queue)
+            try:
+                queue.put_nowait(END_OF_STREAM)
+            except asyncio.QueueFull:
+                pass
+
+    async def _watch_revision(self):
+        """Détecte les écritures des autres workers, uniquement tant qu'il y a des abonnés"""
+        while self.subscribers:
+            await asyncio.sleep(self.resync_interval_s)
+            try:
+                revision = await asyncio.to_thread(self.db_manager.get_revision)
+            except Exception as e:
+                print(f"Lecture de la révision impossible: {e}")
+                continue
+            if revision > self.revision:
+                self.revision = revision
+                self._dispatch(RESYNC)
+        self.watch_task = None
+
+    @staticmethod
+    def format(event: dict) -> str:
+        data = json.dumps(event, ensure_ascii=False)
+        return f"id: {event.get('revision', '')}\nevent: conversation\ndata: {data}\n\n"
+
+    async def stream(self):
+        """Générateur SSE d'un abonné : événements, puis commentaire keepalive en l'absence d'activité"""
+        queue: asyncio.Queue = asyncio.Queue(self.max_queue)
+        self.subscribers.add(queue)
+        connected_clients.inc()
+        if self.watch_task is None:
+            self.watch_task = asyncio.create_task(self._watch_revision())
+        try:
+            # Délai de reconnexion conseillé au navigateur (millisecondes)
+            yield "retry: 3000\n\n"
+            while queue in self.subscribers:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.keepalive_s)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE
+                    continue
+                if event is END_OF_STREAM:
+                    break
+                yield self.format(event)
+        finally:
+            self.subscribers.discard(queue)
+
+    async def close(self):
+        self.end_streams()
+        if self.watch_task:
+            self.watch_task.cancel()
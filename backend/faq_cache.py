@@ -0,0 +1,292 @@
+"""
+Réponses précalculées aux questions fréquentes
+
+Un traitement par lots (hors ligne) regroupe les questions de la table
+`messages` par similarité d'embeddings, puis génère une réponse pour chaque
+groupe fréquent via le pipeline habituel (recherche + Ollama) :
+
+    python -m backend.faq_cache build --min-count 5 --max-answers 50
+    python -m backend.faq_cache list
+
+À la requête, une question autonome (pas une question de suivi) très proche
+d'une question précalculée reçoit la réponse enregistrée, sans recherche ni
+génération. Chaque réponse porte la version du corpus (et l'encodeur) avec
+laquelle elle a été produite : après une modification du corpus, elle n'est
+plus servie jusqu'à sa régénération par le prochain `build`.
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from . import config, metrics
+from .conversation_memory import is_follow_up
+from .lexical_index import fold_accents
+
+faq_lookups = metrics.registry.counter(
+    "yolsda_faq_lookups_total", "Recherches de réponse précalculée", labelnames=("result",)
+)
+
+
+def normalize_question(text: str) -> str:
+    folded = fold_accents(text.lower())
+    return " ".join(re.findall(r"[a-z0-9]+", folded))
+
+
+def init_faq_table(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS faq_answers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        normalized TEXT NOT NULL UNIQUE,
+        question TEXT NOT NULL,
+        asked_count INTEGER NOT NULL,
+        embedding BLOB NOT NULL,
+        encoder TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        sources TEXT NOT NULL,
+        corpus_version TEXT NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    )
+    ''')
+    conn.commit()
+
+
+class FaqCache:
+    """Réponses précalculées en mémoire (matrice d'embeddings des questions),
+    relues depuis la base quand le traitement par lots les met à jour"""
+
+    def __init__(self, db_path: str = config.DB_PATH, similarity: float = config.FAQ_SIMILARITY,
+                 refresh_interval_s: float = 60):
+        self.db_path = db_path
+        self.similarity = similarity
+        self.refresh_interval_s = refresh_interval_s
+        self.entries: List[dict] = []
+        self.embeddings = None
+        self.encoder = None
+        self._state = None
+        self._checked_at = 0.0
+        conn = sqlite3.connect(db_path)
+        try:
+            init_faq_table(conn)
+        finally:
+            conn.close()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def refresh(self, encoder_name: str, force: bool = False):
+        """Recharge les réponses si la table a changé (vérifié au plus une fois par intervalle)"""
+        now = time.monotonic()
+        if not force and encoder_name == self.encoder and now - self._checked_at < self.refresh_interval_s:
+            return
+        self._checked_at = now
+        conn = sqlite3.connect(self.db_path)
+        try:
+            state = conn.execute("SELECT COUNT(*), MAX(updated_at) FROM faq_answers").fetchone()
+            if state == self._state and encoder_name == self.encoder:
+                return
+            rows = conn.execute(
+                "SELECT question, asked_count, embedding, answer, sources, corpus_version, updated_at "
+                "FROM faq_answers WHERE encoder = ?", (encoder_name,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        import numpy as np
+        entries = [{
+            "question": question,
+            "asked_count": asked_count,
+            "answer": answer,
+            "sources": json.loads(sources),
+            "corpus_version": corpus_version,
+            "updated_at": updated_at,
+        } for question, asked_count, _, answer, sources, corpus_version, updated_at in rows]
+        embeddings = np.vstack([np.frombuffer(row[2], dtype=np.float32) for row in rows]) if rows else None
+        # Réaffectation simple : une recherche concurrente garde l'ancien couple
+        self.entries, self.embeddings = entries, embeddings
+        self.encoder, self._state = encoder_name, state
+
+    def lookup(self, model, query: str, corpus_version: str, query_embedding=None) -> Optional[dict]:
+        """Réponse précalculée pour `query`, si une question enregistrée est assez proche
+        et produite avec la version courante du corpus. `query_embedding` : la question
+        déjà encodée par `model` (la recherche qui suit un échec la réutilise)."""
+        self.refresh(getattr(model, "name", ""))
+        entries, embeddings = self.entries, self.embeddings
+        if embeddings is None or is_follow_up(query):
+            faq_lookups.inc(result="miss")
+            return None
+
+        import numpy as np
+        if query_embedding is None:
+            query_embedding = model.encode([query], show_progress_bar=False)[0]
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        similarities = embeddings @ query_embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity:
+            faq_lookups.inc(result="miss")
+            return None
+        if entries[best]["corpus_version"] != corpus_version:
+            faq_lookups.inc(result="stale")
+            return None
+        faq_lookups.inc(result="hit")
+        return {**entries[best], "similarity": float(similarities[best])}
+
+
+def mine_frequent_questions(db_path: str, model, days: int = 30, min_count: int = 5,
+                            max_clusters: int = 50, similarity: float = config.FAQ_SIMILARITY,
+                            max_messages: int = 50000) -> List[dict]:
+    """Regroupe les questions récentes par similarité et retourne les groupes fréquents
+    (du plus demandé au moins demandé) avec leur formulation la plus courante"""
+    import numpy as np
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT message FROM messages WHERE created_at >= ? ORDER BY id DESC LIMIT ?",
+            (since, max_messages)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    # Doublons exacts (à la casse et aux accents près) regroupés avant tout encodage
+    counts, wording = Counter(), {}
+    for (message,) in rows:
+        if is_follow_up(message):
+            continue
+        normalized = normalize_question(message)
+        if normalized:
+            counts[normalized] += 1
+            wording.setdefault(normalized, Counter())[message.strip()] += 1
+    if not counts:
+        return []
+
+    distinct = [normalized for normalized, _ in counts.most_common()]
+    embeddings = np.asarray(model.encode([wording[n].most_common(1)[0][0] for n in distinct],
+                                         show_progress_bar=False), dtype=np.float32)
+
+    # Regroupement glouton, des formulations les plus fréquentes aux plus rares :
+    # chaque formulation rejoint le premier groupe dont le leader est assez proche
+    clusters = []
+    leaders = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+    for i, normalized in enumerate(distinct):
+        if len(leaders):
+            similarities = leaders @ embeddings[i]
+            best = int(np.argmax(similarities))
+            if similarities[best] >= similarity:
+                clusters[best]["asked_count"] += counts[normalized]
+                continue
+        clusters.append({
+            "normalized": normalized,
+            "question": wording[normalized].most_common(1)[0][0],
+            "asked_count": counts[normalized],
+            "embedding": embeddings[i],
+        })
+        leaders = np.vstack([leaders, embeddings[i]])
+
+    frequent = [cluster for cluster in clusters if cluster["asked_count"] >= min_count]
+    frequent.sort(key=lambda cluster: cluster["asked_count"], reverse=True)
+    return frequent[:max_clusters]
+
+
+async def build(db_path: str, days: int, min_count: int, max_answers: int, force: bool = False) -> dict:
+    """Traitement par lots : extraction des questions fréquentes et génération des réponses"""
+    # Import ici : backend.main importe ce module pour servir les réponses
+    from .main import AIAssistant
+
+    assistant = await asyncio.to_thread(AIAssistant, config.OLLAMA_MODEL)
+    model = assistant.data_processor.model
+    corpus_version = assistant.corpus_version()
+    encoder_name = getattr(model, "name", "")
+    clusters = await asyncio.to_thread(mine_frequent_questions, db_path, model, days, min_count, max_answers)
+    print(f"{len(clusters)} questions fréquentes (au moins {min_count} occurrences sur {days} jours)")
+
+    conn = sqlite3.connect(db_path)
+    init_faq_table(conn)
+    current = {
+        normalized: (version, encoder)
+        for normalized, version, encoder in conn.execute(
+            "SELECT normalized, corpus_version, encoder FROM faq_answers")
+    }
+    stats = {"questions": len(clusters), "generated": 0, "up_to_date": 0, "errors": 0}
+    try:
+        for cluster in clusters:
+            if not force and current.get(cluster["normalized"]) == (corpus_version, encoder_name):
+                conn.execute("UPDATE faq_answers SET asked_count = ? WHERE normalized = ?",
+                             (cluster["asked_count"], cluster["normalized"]))
+                stats["up_to_date"] += 1
+                continue
+            start = time.perf_counter()
+            try:
+                # Une erreur d'Ollama lève une exception : jamais enregistrée comme réponse
+                result = await assistant.generate_response(cluster["question"], raise_errors=True)
+            except Exception as e:
+                print(f"Génération impossible pour « {cluster['question']} »: {e}")
+                stats["errors"] += 1
+                continue
+            conn.execute('''
+            INSERT INTO faq_answers (normalized, question, asked_count, embedding, encoder, answer,
+                                     sources, corpus_version, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (normalized) DO UPDATE SET
+                question = excluded.question, asked_count = excluded.asked_count,
+                embedding = excluded.embedding, encoder = excluded.encoder, answer = excluded.answer,
+                sources = excluded.sources, corpus_version = excluded.corpus_version,
+                updated_at = excluded.updated_at
+            ''', (
+                cluster["normalized"], cluster["question"], cluster["asked_count"],
+                cluster["embedding"].tobytes(), encoder_name, result["response"],
+                json.dumps(result["sources"], ensure_ascii=False), corpus_version,
+                datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            ))
+            # Validation à chaque réponse : un arrêt en cours de lot ne perd rien
+            conn.commit()
+            stats["generated"] += 1
+            print(f"[{cluster['asked_count']}x] {cluster['question']} ({time.perf_counter() - start:.1f}s)")
+        conn.commit()
+    finally:
+        conn.close()
+        await assistant.close()
+    return stats
+
+
+def list_answers(db_path: str) -> List[dict]:
+    conn = sqlite3.connect(db_path)
+    try:
+        init_faq_table(conn)
+        rows = conn.execute(
+            "SELECT question, asked_count, corpus_version, encoder, updated_at FROM faq_answers "
+            "ORDER BY asked_count DESC"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(zip(("question", "asked_count", "corpus_version", "encoder", "updated_at"), row)) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Réponses précalculées aux questions fréquentes")
+    parser.add_argument("--db", default=config.DB_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="extrait les questions fréquentes et génère leurs réponses")
+    build_parser.add_argument("--days", type=int, default=30, help="fenêtre d'historique analysée")
+    build_parser.add_argument("--min-count", type=int, default=5, help="occurrences minimales d'une question")
+    build_parser.add_argument("--max-answers", type=int, default=50)
+    build_parser.add_argument("--force", action="store_true", help="régénère aussi les réponses à jour")
+    subparsers.add_parser("list", help="affiche les réponses enregistrées")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        stats = asyncio.run(build(args.db, args.days, args.min_count, args.max_answers, args.force))
+        print(json.dumps(stats, ensure_ascii=False))
+    else:
+        for answer in list_answers(args.db):
+            print(json.dumps(answer, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
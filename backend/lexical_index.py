@@ -0,0 +1,201 @@
+"""
+Index inversé BM25 pour la recherche lexicale dans le corpus (français)
+"""
+
+import json
+import math
+import os
+import re
+import unicodedata
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+# Mots vides français (sans accents : la comparaison se fait après repliement)
+FRENCH_STOPWORDS = {
+    "a", "au", "aux", "avec", "ce", "ces", "cet", "cette", "d", "dans", "de", "des", "du",
+    "elle", "elles", "en", "est", "et", "etre", "il", "ils", "je", "l", "la", "le", "les",
+    "leur", "leurs", "lui", "m", "ma", "mais", "me", "mes", "mon", "n", "ne", "nos", "notre",
+    "nous", "on", "ou", "par", "pas", "pour", "qu", "que", "qui", "s", "sa", "se", "ses",
+    "son", "sont", "sur", "t", "ta", "te", "tes", "ton", "tu", "un", "une", "vos", "votre",
+    "vous", "y", "comment", "quel", "quelle", "quels", "quelles", "quoi",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def fold_accents(text: str) -> str:
+    """Supprime les accents : « fiscalité » -> « fiscalite »"""
+    normalized = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in normalized if not unicodedata.combining(c))
+
+
+def stem(token: str) -> str:
+    """Racinisation légère : retire la marque du pluriel (impots -> impot)"""
+    if len(token) > 3 and not token.isdigit() and token[-1] in "sx" and token[-2] not in "su":
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Découpe un texte français en termes normalisés (minuscules, sans accents,
+    sans élisions ni mots vides). Les nombres (articles, années) sont conservés."""
+    tokens = TOKEN_PATTERN.findall(fold_accents(text.lower()))
+    return [stem(t) for t in tokens if t not in FRENCH_STOPWORDS]
+
+
+class CorpusStatistics:
+    """Statistiques BM25 d'un corpus entier (nombre de documents, longueur totale,
+    fréquence documentaire des termes). Un shard qui indexe sa seule partition
+    les utilise pour scorer ses passages exactement comme l'index unique."""
+
+    def __init__(self):
+        self.documents = 0
+        self.total_length = 0
+        self.doc_freqs: Dict[str, int] = {}
+
+    def add(self, text: str):
+        tokens = tokenize(text)
+        self.documents += 1
+        self.total_length += len(tokens)
+        for token in set(tokens):
+            self.doc_freqs[token] = self.doc_freqs.get(token, 0) + 1
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = []
+        self.postings: Dict[str, Tuple[list, list]] = {}
+        self.avg_doc_length = 0.0
+        # Corpus entier (index d'un shard) : nombre de documents et fréquences des termes
+        self.collection_documents: Optional[int] = None
+        self.doc_freqs: Optional[Dict[str, int]] = None
+        self._arrays = {}
+        self._norm = None
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def build(self, documents: List[str], statistics: Optional[CorpusStatistics] = None):
+        """Construit l'index à partir de la liste des textes (l'indice = position) ;
+        `statistics` : statistiques du corpus entier dont les textes sont une partie"""
+        postings: Dict[str, Tuple[list, list]] = {}
+        doc_lengths = []
+        for doc_id, text in enumerate(documents):
+            counts: Dict[str, int] = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                ids, tfs = postings.setdefault(token, ([], []))
+                ids.append(doc_id)
+                tfs.append(tf)
+            doc_lengths.append(len(tokens))
+
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+        self.collection_documents = self.doc_freqs = None
+        if statistics is not None and statistics.documents:
+            self.avg_doc_length = statistics.total_length / statistics.documents
+            self.collection_documents = statistics.documents
+            # Seuls les termes présents dans la partition peuvent contribuer à un score
+            self.doc_freqs = {term: statistics.doc_freqs[term] for term in postings}
+        self._arrays = {}
+        self._norm = None
+
+    def save(self, path: str):
+        """Écrit l'index sur disque (écriture atomique)"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        raw = {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings
+        }
+        if self.doc_freqs is not None:
+            raw.update(collection_documents=self.collection_documents, avg_doc_length=self.avg_doc_length,
+                       doc_freqs=self.doc_freqs)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(raw, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        index = cls(k1=raw["k1"], b=raw["b"])
+        index.doc_lengths = raw["doc_lengths"]
+        index.postings = {term: (ids, tfs) for term, (ids, tfs) in raw["postings"].items()}
+        index.avg_doc_length = (sum(index.doc_lengths) / len(index.doc_lengths)) if index.doc_lengths else 0.0
+        if "doc_freqs" in raw:
+            index.collection_documents = raw["collection_documents"]
+            index.avg_doc_length = raw["avg_doc_length"]
+            index.doc_freqs = raw["doc_freqs"]
+        return index
+
+    def _posting_arrays(self, term: str):
+        """Listes de postings converties (et mises en cache) en tableaux numpy"""
+        import numpy as np
+        if term not in self._arrays:
+            ids, tfs = self.postings[term]
+            self._arrays[term] = (np.asarray(ids, dtype=np.int64), np.asarray(tfs, dtype=np.float32))
+        return self._arrays[term]
+
+    def search(self, query: str, top_k: int = 50, mask=None) -> List[Tuple[int, float]]:
+        """Retourne les (indice, score BM25) des meilleurs documents, par score décroissant.
+        Un masque booléen optionnel limite la recherche à une partition du corpus."""
+        import numpy as np
+        terms = [t for t in set(tokenize(query)) if t in self.postings]
+        if not terms or not self.doc_lengths:
+            return []
+
+        n_docs = self.collection_documents or len(self.doc_lengths)
+        if self._norm is None:
+            lengths = np.asarray(self.doc_lengths, dtype=np.float32)
+            self._norm = self.k1 * (1 - self.b + self.b * lengths / max(self.avg_doc_length, 1e-9))
+
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        for term in terms:
+            ids, tfs = self._posting_arrays(term)
+            df = self.doc_freqs[term] if self.doc_freqs is not None else len(ids)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[ids])
+        if mask is not None:
+            scores[~mask] = 0
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(scores[matched], -top_k)[-top_k:]]
+        order = matched[np.argsort(-scores[matched])]
+        return [(int(i), float(scores[i])) for i in order]
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> Dict[int, float]:
+    """Fusionne plusieurs classements (listes d'indices) par Reciprocal Rank Fusion"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return fused
+
+
+def hybrid_fusion(dense_ranking: List[Hashable], lexical_ranking: List[Hashable],
+                  similarity: Callable[[Hashable], float], top_k: int, rrf_k: int = 60,
+                  min_similarity: float = 0.3) -> List[Tuple[Hashable, float]]:
+    """Sélection finale de la recherche hybride : fusion RRF des classements dense et
+    lexical, puis seuil de similarité, sauf pour les meilleures correspondances
+    lexicales. Retourne les (clé, score RRF) des top_k passages retenus.
+
+    Partagée par l'index unique (clés = indices) et le coordinateur des shards
+    (clés = hash de contenu), qui obtiennent ainsi le même classement."""
+    fused = reciprocal_rank_fusion([dense_ranking, lexical_ranking], k=rrf_k)
+    strong_lexical = set(lexical_ranking[:top_k])
+    selected = []
+    for key in sorted(fused, key=fused.get, reverse=True):
+        if similarity(key) <= min_similarity and key not in strong_lexical:
+            continue
+        selected.append((key, fused[key]))
+        if len(selected) >= top_k:
+            break
+    return selected
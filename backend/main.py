@@ -1,18 +1,57 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import json
+import math
 import os
-from typing import List, Optional
+import re
+import time
+import hashlib
+import hmac
+import shutil
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple, Union
 from datetime import datetime
+from . import config, metrics
 from .database import DatabaseManager
-import numpy as np
-from sentence_transformers import SentenceTransformer
-import requests
+from .lexical_index import BM25Index, CorpusStatistics, hybrid_fusion
+from .metadata_index import METADATA_FIELDS, MetadataIndex
+from .reranker import CrossEncoderReranker
+from .profiler import SamplingProfiler
+from .conversation_memory import ConversationMemory
+from .write_queue import WriteBehindQueue
+from .events import EventBroker
+from .compression import CompressionMiddleware
+from .static_assets import REVALIDATE, AssetManifest, HashedStaticFiles
+from .encoders import BACKEND_MODULES, load_encoder
+from .sharding import ShardedRetriever, shard_of
+from .faq_cache import FaqCache
+from .archive import run_maintenance
+from .block_store import BLOCK_STORE_FILES, BlockStore, write_block_store
+from .batch import BatchBusy, BatchError, open_output, parse_questions, run_batch
+from .rate_limit import FairScheduler, SchedulerFull, client_id, create_rate_limiter, rate_limited
 import asyncio
-import aiohttp
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    orjson = None
+
+# numpy, sentence_transformers et aiohttp sont importés à la demande :
+# le serveur HTTP démarre sans attendre ces dépendances coûteuses.
+
+
+
+class FastJSONResponse(JSONResponse):
+    """Sérialisation JSON par orjson (plusieurs fois plus rapide que json), json à défaut"""
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
 
 app = FastAPI(title="Yolsda IA Assistant")
 
@@ -25,38 +64,70 @@ app.add_middleware(
     allow_headers=["\n"],
 )
 
-# Monte le dossier static pour servir les fichiers CSS/JS
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Profileur par échantillonnage, piloté via /api/admin/profiling
+profiler = SamplingProfiler(config.PROFILE_DIR, sample_rate=config.PROFILE_SAMPLE_RATE,
+                            interval_ms=config.PROFILE_INTERVAL_MS)
+profiler.configure(enabled=config.PROFILE_SAMPLE_RATE > 0)
+PROFILED_PATHS = {"/chat", "/api/chat"}
+
+# Seaux à jetons par client (None si YOLSDA_RATE_LIMIT_PER_MINUTE=0) et créneaux
+# de génération partagés à tour de rôle entre clients (voir backend.rate_limit)
+rate_limiter = create_rate_limiter()
+generation_scheduler = FairScheduler()
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """Mesure chaque requête et expose le détail des étapes dans l'en-tête Server-Timing"""
+    timings = {}
+    token = metrics.request_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        if request.url.path in PROFILED_PATHS and profiler.should_sample():
+            async with profiler.profile(request.url.path):
+                response = await call_next(request)
+        else:
+            response = await call_next(request)
+    finally:
+        metrics.request_timings.reset(token)
+    elapsed = time.perf_counter() - start
+    
+    route = request.scope.get("route")
+    metrics.http_request_duration.observe(
+        elapsed, method=request.method, path=route.path if route else "unmatched", status=response.status_code
+    )
+    timings["total"] = elapsed
+    response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
+
+# Compression gzip/brotli des réponses au-delà d'un seuil (middleware le plus externe)
+app.add_middleware(CompressionMiddleware, minimum_size=config.COMPRESSION_MIN_SIZE)
+
+# Monte le dossier static pour servir les fichiers CSS/JS, sous des URL versionnées par empreinte
+asset_manifest = AssetManifest("static")
+app.mount("/static", HashedStaticFiles(directory="static", manifest=asset_manifest), name="static")
 
 class ChatMessage(BaseModel):
     message: str
     conversation_id: Optional[str] = None
+    # Filtres de recherche, ex. {"category": "fiscalite", "type": "!synthetic"}
+    filters: Optional[Dict[str, Union[str, List[str]]]] = None
+
+class ProfilingSettings(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = None
+    interval_ms: Optional[float] = None
 
 class AIResponse(BaseModel):
     response: str
     conversation_id: str
     sources: List[str] = []
+    # Détail de la recherche : top-k et durée de chaque étape
+    retrieval: dict = {}
 
-class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "Mistral-7B"):
-        self.base_url = base_url
-        self.model = model
-        self.session = None
-    
-    async def ensure_session(self):
-        if self.session is None:
-            timeout = aiohttp.ClientTimeout(total=15, connect=5)  # Timeout plus court
-            self.session = aiohttp.ClientSession(timeout=timeout)
-    
-    async def generate_response(self, prompt: str, context: str = "") -> str:
-        await self.ensure_session()
-        
-        # Limite la taille du contexte
-        if context and len(context) > 1000:
-            context = context[:1000] + "..."
-        
-        # Construction du prompt avec contexte
-        system_prompt = """Tu es un assistant IA spécialisé dans l'analyse d'informations entrepreneuriales. Ton objectif est de fournir des réponses **rapides (<5 secondes)**, **précises** et **factuelles**, basées uniquement sur le contexte fourni.
+# Instructions statiques envoyées en préfixe système : identiques à chaque requête
+SYSTEM_PROMPT = """Tu es Yolsda, un assistant IA dédié à l'entrepreneuriat. Tu réponds toujours en français et en anglais de manière professionnelle et utile.
+
+Tu es un assistant IA spécialisé dans l'analyse d'informations entrepreneuriales. Ton objectif est de fournir des réponses **rapides (<5 secondes)**, **précises** et **factuelles**, basées uniquement sur le contexte fourni.
 
 INSTRUCTIONS :
 1. Utilise **uniquement les informations présentes dans le contexte** fourni par l'utilisateur.
@@ -75,59 +146,191 @@ INSTRUCTIONS :
 TON COMPORTEMENT :
 - Tu agis comme un expert entrepreneurial capable d'analyser des données, des projets ou des situations d'affaires.
 - Tu synthétises rapidement les informations pertinentes et les présentes en paragraphes fluides.
-- Tu restes neutre, objectif et factuel.
+- Tu restes neutre, objectif et factuel."""
 
-Contexte disponible :
+# Partie variable du prompt, placée après le préfixe
+PROMPT_TEMPLATE = """{history}Contexte disponible :
 {context}
 
 Question : {question}
 
 Réponse structurée en paragraphes :"""
+
+# Contexte envoyé quand la recherche ne retient aucun passage
+NO_CONTEXT_PROMPT = "Aucune information spécifique dans la base de connaissances. Réponds en tant qu'expert en entrepreneuriat."
+
+class OllamaClient:
+    def __init__(self, base_url: str = config.OLLAMA_URL, model: str = "Mistral-7B"):
+        self.base_url = base_url
+        self.model = model
+        self.session = None
+        # Instant (time.monotonic) de la dernière requête envoyée au modèle
+        self.last_request_at = 0.0
+    
+    async def ensure_session(self):
+        import aiohttp
+        if self.session is None:
+            timeout = aiohttp.ClientTimeout(total=15, connect=5)  # Timeout plus court
+            self.session = aiohttp.ClientSession(timeout=timeout)
+    
+    async def generate_response(self, prompt: str, context: str = "", history: str = "",
+                                ollama_context: Optional[List[int]] = None,
+                                raise_errors: bool = False) -> Tuple[str, Optional[List[int]]]:
+        """Retourne (réponse, context Ollama à réutiliser pour le tour suivant)
+
+        Avec ollama_context, le prompt prolonge la conversation déjà évaluée par
+        Ollama : les instructions et les tours précédents n'y sont pas renvoyés.
+        Avec raise_errors, une erreur lève une exception au lieu d'être rendue
+        comme texte de réponse (traitements par lots, qui la réessaient).
+        """
+        import aiohttp
+        await self.ensure_session()
         
-        full_prompt = system_prompt.format(context=context, question=prompt)
+        # Limite la taille du contexte
+        if context and len(context) > 1000:
+            context = context[:1000] + "..."
         
+        # Historique borné (résumé + derniers tours) fourni par ConversationMemory
+        if history:
+            history = f"Historique de la conversation :\n{history}\n\n"
+        
+        full_prompt = PROMPT_TEMPLATE.format(history=history, context=context, question=prompt)
+        payload = {
+            "model": self.model,
+            "prompt": full_prompt,
+            "stream": False,
+            "options": {
+                "temperature": 0.2,  # Réduit pour des réponses plus cohérentes
+                "top_p": 0.9,       # Légèrement réduit pour plus de précision
+                "top_k": 40,  
+                "num_thread": 4,     
+                "num_predict": 700, # Augmenté pour des réponses plus détaillées
+                "repeat_penalty": 1.2, # Évite les répétitions
+                "stop": ["Question :", "Contexte :"]  # Arrête la génération aux marqueurs
+            }
+        }
+        if config.OLLAMA_KEEP_ALIVE:
+            # Garde le modèle chargé entre deux rafales de requêtes
+            payload["keep_alive"] = config.OLLAMA_KEEP_ALIVE
+        if ollama_context:
+            # Les instructions figurent déjà au début du context : Ollama les réinsérerait sinon
+            payload["context"] = ollama_context
+        else:
+            # Préfixe identique d'une requête à l'autre : son évaluation reste en cache dans Ollama
+            payload["system"] = SYSTEM_PROMPT
+        
+        self.last_request_at = time.monotonic()
         try:
-            async with self.session.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": full_prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.2,  # Réduit pour des réponses plus cohérentes
-                        "top_p": 0.9,       # Légèrement réduit pour plus de précision
-                        "top_k": 40,  
-                        "num_thread": 4,     
-                        "num_predict": 700, # Augmenté pour des réponses plus détaillées
-                        "repeat_penalty": 1.2, # Évite les répétitions
-                        "stop": ["Question :", "Contexte :"]  # Arrête la génération aux marqueurs
-                    },
-                    "system": "Tu es Yolsda, un assistant IA dédié à l'entrepreneuriat. Tu réponds toujours en français et en anglais de manière professionnelle et utile."
-                },
-                timeout=aiohttp.ClientTimeout(total=60)
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result["response"]
-                else:
-                    error_text = await response.text()
-                    print(f"Erreur Ollama {response.status}: {error_text}")
-                    return f"Erreur Ollama {response.status}: {error_text}"
+            with metrics.span("ollama_generate"):
+                async with self.session.post(
+                        f"{self.base_url}/api/generate",
+                        json=payload,
+                        timeout=aiohttp.ClientTimeout(total=60)
+                    ) as response:
+                        if response.status == 200:
+                            result = await response.json()
+                            metrics.record_ollama_stats(result)
+                            return result["response"], result.get("context")
+                        else:
+                            error_text = await response.text()
+                            print(f"Erreur Ollama {response.status}: {error_text}")
+                            if raise_errors:
+                                raise RuntimeError(f"Erreur Ollama {response.status}: {error_text}")
+                            return f"Erreur Ollama {response.status}: {error_text}", None
                     
         except asyncio.TimeoutError:
-            return "Désolé, la requête a pris trop de temps. Veuillez réessayer."
+            if raise_errors:
+                raise
+            return "Désolé, la requête a pris trop de temps. Veuillez réessayer.", None
         except Exception as e:
-            return f"Erreur de connexion à Ollama: {str(e)}"
+            if raise_errors:
+                raise
+            return f"Erreur de connexion à Ollama: {str(e)}", None
+    
+    async def list_models(self) -> List[str]:
+        """Noms des modèles installés dans Ollama (/api/tags)"""
+        await self.ensure_session()
+        async with self.session.get(f"{self.base_url}/api/tags") as response:
+            response.raise_for_status()
+            data = await response.json()
+        return [model.get("name", "") for model in data.get("models", [])]
+    
+    def has_model(self, names: List[str]) -> bool:
+        # Ollama ajoute l'étiquette ":latest" aux modèles nommés sans étiquette
+        wanted = self.model if ":" in self.model else f"{self.model}:latest"
+        return wanted in names or self.model in names
+    
+    async def load_model(self, warm_prefix: bool = False, timeout: float = config.WARMUP_TIMEOUT):
+        """Charge le modèle en mémoire sans générer de réponse.
+
+        Avec warm_prefix, un token est généré après le préfixe système : son
+        évaluation est alors déjà en cache pour la première vraie question.
+        """
+        import aiohttp
+        await self.ensure_session()
+        payload = {"model": self.model, "prompt": "", "stream": False}
+        if warm_prefix:
+            payload.update(system=SYSTEM_PROMPT, prompt="Bonjour", options={"num_predict": 1})
+        if config.OLLAMA_KEEP_ALIVE:
+            payload["keep_alive"] = config.OLLAMA_KEEP_ALIVE
+        self.last_request_at = time.monotonic()
+        async with self.session.post(
+                f"{self.base_url}/api/generate",
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+            response.raise_for_status()
+            return await response.json()
     
     async def close(self):
         if self.session:
             await self.session.close()
 
+def load_embedding_model():
+    """Charge l'encodeur configuré (YOLSDA_EMBEDDING_BACKEND), avec import paresseux"""
+    return load_encoder(config.EMBEDDING_BACKEND)
+
 class DataProcessor:
-    def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+    def __init__(self, model=None, shard: Optional[Tuple[int, int]] = None):
+        # Le modèle peut être partagé entre deux instances (rechargement à chaud)
+        self.model = model or load_embedding_model()
+        # (i, n) : seuls les passages du shard i sur n sont chargés (voir backend.sharding)
+        self.shard = shard
         self.data = []
+        # Texte des passages d'un index chargé (BlockStore) : absent de self.data
+        self.texts = None
         self.embeddings = None
+        self.lexical_index = None
+        self.metadata_index = None
+        # Shard : statistiques BM25 du corpus entier, relevées au chargement des fichiers
+        self.corpus_statistics = CorpusStatistics() if shard else None
+        self._positions = None
+    
+    def __len__(self) -> int:
+        return len(self.data)
+    
+    def text(self, idx: int) -> str:
+        """Texte complet du passage `idx` (décompresse au plus un bloc)"""
+        if self.texts is not None:
+            return self.texts.get(idx)
+        return self.data[idx]['content']
+    
+    @staticmethod
+    def index_key(fingerprint: tuple, encoder_name: str = "") -> str:
+        """Nom de répertoire d'index associé à une empreinte de corpus et à l'encodeur"""
+        return hashlib.sha1(repr((encoder_name, fingerprint)).encode('utf-8')).hexdigest()[:16]
+    
+    @staticmethod
+    def corpus_fingerprint(folder_path: str = "data") -> tuple:
+        """Empreinte (nom, taille, date de modification) des fichiers JSON du corpus"""
+        if not os.path.exists(folder_path):
+            return ()
+        fingerprint = []
+        for filename in sorted(os.listdir(folder_path)):
+            if filename.endswith('.json'):
+                stat = os.stat(os.path.join(folder_path, filename))
+                fingerprint.append((filename, stat.st_size, stat.st_mtime_ns))
+        return tuple(fingerprint)
         
     def load_data_from_folder(self, folder_path: str = "data"):
         """Charge tous les fichiers JSON du dossier data"""
@@ -157,9 +360,16 @@ class DataProcessor:
         """Traite un élément individuel de données"""
         text_content = self.extract_text_content(item)
         if text_content:
+            content_hash = hashlib.sha1(text_content.encode('utf-8')).hexdigest()
+            if self.corpus_statistics is not None:
+                self.corpus_statistics.add(text_content)
+            if self.shard and shard_of(content_hash, self.shard[1]) != self.shard[0]:
+                return
             self.data.append({
                 'content': text_content,
                 'source': source,
+                'content_hash': content_hash,
+                'metadata': {field: item.get(field) for field in METADATA_FIELDS},
                 'embedding': None
             })
     
@@ -182,153 +392,868 @@ class DataProcessor:
         
         return " ".join(content_parts) if content_parts else ""
     
-    def generate_embeddings(self):
-        """Génère les embeddings pour tout le contenu chargé"""
+    def embeddings_by_hash(self) -> dict:
+        """Associe chaque contenu (par son hash) à son embedding"""
+        if self.embeddings is None:
+            return {}
+        return {item['content_hash']: self.embeddings[i] for i, item in enumerate(self.data)}
+    
+    def generate_embeddings(self, previous: Optional["DataProcessor"] = None):
+        """Génère les embeddings pour tout le contenu chargé.
+        
+        Si une instance précédente est fournie, ses embeddings sont réutilisés
+        et seuls les contenus nouveaux ou modifiés sont encodés.
+        """
+        import numpy as np
         if not self.data:
             print("Aucune donnée à traiter")
             return
-            
-        texts = [item['content'] for item in self.data]
-        self.embeddings = self.model.encode(texts)
+        
+        known = previous.embeddings_by_hash() if previous is not None else {}
+        rows = [known.get(item['content_hash']) for item in self.data]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        
+        if missing:
+            encoded = self.model.encode([self.data[i]['content'] for i in missing], show_progress_bar=False)
+            for i, row in zip(missing, encoded):
+                rows[i] = row
+        print(f"Embeddings: {len(missing)} encodés, {len(rows) - len(missing)} réutilisés")
+        
+        self.embeddings = np.vstack(rows)
         
         for i, item in enumerate(self.data):
             item['embedding'] = self.embeddings[i]
     
-    def find_similar_content(self, query: str, top_k: int = 2) -> List[dict]:
-        """Trouve le contenu le plus similaire à la requête"""
-        if not self.data or self.embeddings is None:
-            return []
+    def build_lexical_index(self):
+        """Construit l'index inversé BM25 sur le contenu chargé"""
+        self.lexical_index = BM25Index()
+        self.lexical_index.build([self.text(i) for i in range(len(self.data))], statistics=self.corpus_statistics)
+    
+    def build_metadata_index(self):
+        """Construit l'index de métadonnées (catégorie, type, source) en colonnes"""
+        self.metadata_index = MetadataIndex()
+        self.metadata_index.build([item.get('metadata') or {} for item in self.data])
+    
+    def save_index(self, index_dir: str):
+        """Écrit les chunks, leur texte (blocs compressés) et la matrice d'embeddings
+        sur disque (écriture atomique)"""
+        import numpy as np
+        os.makedirs(index_dir, exist_ok=True)
+        suffix = f".{os.getpid()}.tmp"
+        
+        header = write_block_store(index_dir, (self.text(i) for i in range(len(self.data))),
+                                   block_size=config.TEXT_BLOCK_SIZE, suffix=suffix)
+        for name in BLOCK_STORE_FILES:
+            os.replace(os.path.join(index_dir, name + suffix), os.path.join(index_dir, name))
+        print(f"Texte des passages: {header['raw_bytes'] / 1e6:.1f} Mo -> "
+              f"{header['compressed_bytes'] / 1e6:.1f} Mo ({header['codec']}, {header['blocks']} blocs)")
+        
+        chunks_path = os.path.join(index_dir, "chunks.json")
+        with open(chunks_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump([
+                {'source': item['source'], 'content_hash': item['content_hash']}
+                for item in self.data
+            ], f, ensure_ascii=False)
+        os.replace(chunks_path + suffix, chunks_path)
+        
+        if self.lexical_index is not None:
+            self.lexical_index.save(os.path.join(index_dir, "lexical.json"))
+        if self.metadata_index is not None:
+            self.metadata_index.save(os.path.join(index_dir, "metadata.json"))
+        
+        # La matrice est écrite en dernier : sa présence signale un index complet
+        embeddings_path = os.path.join(index_dir, "embeddings.npy")
+        with open(embeddings_path + suffix, 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        os.replace(embeddings_path + suffix, embeddings_path)
+    
+    def load_index(self, index_dir: str) -> bool:
+        """Charge un index depuis le disque ; la matrice est mappée en mémoire (mmap)
+        afin que tous les workers partagent les mêmes pages physiques"""
+        import numpy as np
+        chunks_path = os.path.join(index_dir, "chunks.json")
+        embeddings_path = os.path.join(index_dir, "embeddings.npy")
+        metadata_path = os.path.join(index_dir, "metadata.json")
+        if not all(os.path.exists(p) for p in (chunks_path, embeddings_path, metadata_path)):
+            return False
+        
+        try:
+            with open(chunks_path, 'r', encoding='utf-8') as f:
+                chunks = json.load(f)
+            embeddings = np.load(embeddings_path, mmap_mode='r')
+            metadata_index = MetadataIndex.load(metadata_path)
+            # Index antérieur au stockage par blocs : le texte est resté dans chunks.json
+            texts = None
+            if os.path.exists(os.path.join(index_dir, "texts.json")):
+                texts = BlockStore(index_dir, cache_blocks=config.TEXT_CACHE_BLOCKS)
+            elif chunks and 'content' not in chunks[0]:
+                return False
+        except Exception as e:
+            print(f"Index illisible dans {index_dir}: {e}")
+            return False
+        if not len(chunks) == embeddings.shape[0] == len(metadata_index):
+            return False
+        if texts is not None and len(texts) != len(chunks):
+            return False
+        lexical_path = os.path.join(index_dir, "lexical.json")
+        lexical_index = BM25Index.load(lexical_path) if os.path.exists(lexical_path) else None
+        if self.shard and lexical_index is not None and lexical_index.doc_freqs is None:
+            # Index de shard antérieur aux statistiques du corpus entier : reconstruit
+            return False
+        
+        self.data = chunks
+        self.texts = texts
+        self.embeddings = embeddings
+        self.metadata_index = metadata_index
+        for i, item in enumerate(self.data):
+            item['embedding'] = self.embeddings[i]
+        
+        self.lexical_index = lexical_index
+        if lexical_index is None:
+            # Index produit avant l'ajout de BM25 : reconstruit en mémoire
+            self.build_lexical_index()
+        return True
+    
+    def find_similar_content(self, query: str, top_k: int = 2, filters: Optional[dict] = None,
+                             query_embedding=None) -> List[dict]:
+        """Trouve le contenu le plus pertinent : recherche lexicale BM25 et recherche
+        vectorielle, fusionnées par Reciprocal Rank Fusion.
         
+        Les filtres de métadonnées (voir MetadataIndex.mask) restreignent la
+        recherche à la partition correspondante avant tout calcul de score.
+        `query_embedding` : question déjà encodée (voir encode_queries), sinon encodée ici.
+        """
+        query_embeddings = None if query_embedding is None else [query_embedding]
+        return self.search_batch([query], top_k=top_k, filters=filters, query_embeddings=query_embeddings)[0]
+    
+    def search_batch(self, queries: List[str], top_k: int = 2, filters: Optional[dict] = None,
+                     query_embeddings=None) -> List[List[dict]]:
+        """Recherche hybride de plusieurs questions à la fois (mêmes filtres) : un seul
+        appel à l'encodeur et un seul produit matriciel pour les scores vectoriels"""
+        rankings = self._rank_batch(queries, top_k, filters, query_embeddings)
+        return [self._results(ranking, top_k) for ranking in rankings]
+    
+    def encode_queries(self, queries: List[str]):
+        """Embeddings des questions (une ligne par question)"""
+        import numpy as np
         # Encode sans barre de progression pour plus de rapidité
-        query_embedding = self.model.encode([query], show_progress_bar=False)
-        similarities = np.dot(self.embeddings, query_embedding.T).flatten()
-        
-        # Utilise argpartition au lieu de argsort pour plus de rapidité
-        top_indices = np.argpartition(similarities, -top_k)[-top_k:]
-        
-        results = []
-        for idx in top_indices:
-            similarity = float(similarities[idx])
-            if similarity > 0.3:  # Seuil de similarité augmenté pour plus de pertinence
-                # Tronque le contenu s'il est trop long
-                content = self.data[idx]['content']
-                if len(content) > 1000:
-                    content = content[:1000] + "..."
-                    
-                results.append({
-                    'content': content,
-                    'source': self.data[idx]['source'],
-                    'similarity': similarity
-                })
+        return np.asarray(self.model.encode(queries, show_progress_bar=False))
+    
+    def search_candidates(self, query: str, top_k: int = 2,
+                          filters: Optional[dict] = None) -> Tuple[List[dict], List[dict]]:
+        """Recherche d'un shard : ses top_k passages, et tous les candidats des deux
+        classements avec leurs scores, que le coordinateur refusionne (voir backend.sharding)"""
+        ranking = self._rank_batch([query], top_k, filters)[0]
+        if ranking is None:
+            return [], []
+        dense_ranking, lexical_scores, similarity = ranking
+        dense = set(dense_ranking)
+        candidates = [
+            {
+                'content_hash': self.data[idx]['content_hash'],
+                'similarity': similarity(idx),
+                'lexical_score': lexical_scores.get(idx),
+                'dense': idx in dense
+            }
+            for idx in dict.fromkeys(dense_ranking + list(lexical_scores))
+        ]
+        return self._results(ranking, top_k), candidates
+    
+    def passages(self, content_hashes: List[str]) -> List[dict]:
+        """Passages désignés par leur hash de contenu (ceux absents sont ignorés)"""
+        if self._positions is None:
+            self._positions = {item['content_hash']: i for i, item in enumerate(self.data)}
+        return [self.passage(self._positions[h]) for h in content_hashes if h in self._positions]
+    
+    def passage(self, idx: int, **scores) -> dict:
+        # Tronque le contenu s'il est trop long (seuls les blocs des résultats sont décompressés)
+        content = self.text(idx)
+        if len(content) > 1000:
+            content = content[:1000] + "..."
+        return {
+            'content': content,
+            'source': self.data[idx]['source'],
+            **scores,
+            'content_hash': self.data[idx]['content_hash']
+        }
+    
+    def collection_size(self) -> int:
+        """Passages du corpus entier (un shard n'en détient qu'une partie)"""
+        collection = self.lexical_index.collection_documents if self.lexical_index else None
+        return collection or len(self.data)
+    
+    def _results(self, ranking, top_k: int) -> List[dict]:
+        if ranking is None:
+            return []
+        dense_ranking, lexical_scores, similarity = ranking
+        return [
+            # Score BM25 (None hors des candidats lexicaux) : refusion entre shards
+            self.passage(idx, similarity=similarity(idx), score=score, lexical_score=lexical_scores.get(idx))
+            for idx, score in hybrid_fusion(dense_ranking, list(lexical_scores), similarity, top_k, config.RRF_K)
+        ]
+    
+    def _rank_batch(self, queries: List[str], top_k: int, filters: Optional[dict], query_embeddings=None) -> list:
+        """Classements de chaque question : (classement dense, scores BM25 par indice,
+        similarité d'un indice), ou None si aucun passage ne correspond aux filtres"""
+        import numpy as np
+        if not queries:
+            return []
+        if not self.data or self.embeddings is None:
+            return [None for _ in queries]
+        
+        mask = self.metadata_index.mask(filters) if self.metadata_index else None
+        if mask is not None and not mask.any():
+            return [None for _ in queries]
+        
+        # Classement lexical : termes exacts (CEFORE, IUTS, numéros d'articles...)
+        lexical_scores = [
+            dict(self.lexical_index.search(query, config.LEXICAL_CANDIDATES, mask=mask))
+            if self.lexical_index else {}
+            for query in queries
+        ]
+        
+        if query_embeddings is None:
+            query_embeddings = self.encode_queries(queries)
+        query_embeddings = np.asarray(query_embeddings)
+        
+        # Pré-filtre lexical : sur un grand corpus, seuls les candidats BM25 sont scorés
+        # (taille du corpus entier : un shard décide comme l'index unique)
+        prefiltered = [
+            self.collection_size() >= config.LEXICAL_PREFILTER_MIN_DOCS and len(scores) >= top_k
+            for scores in lexical_scores
+        ]
+        dense_candidates = dense_scores = None
+        if not all(prefiltered):
+            # Scores de toutes les questions restantes en un produit matriciel (passages x questions)
+            dense_candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(self.data))
+            matrix = self.embeddings[dense_candidates] if mask is not None else self.embeddings
+            dense_scores = np.dot(matrix, query_embeddings.T)
         
-        return results
+        rankings = []
+        for j, scores in enumerate(lexical_scores):
+            query_embedding = query_embeddings[j]
+            if prefiltered[j]:
+                # Les dictionnaires conservent l'ordre : indices par score BM25 décroissant
+                candidates = np.asarray(list(scores), dtype=np.int64)
+                similarities = np.dot(self.embeddings[candidates], query_embedding)
+            else:
+                candidates, similarities = dense_candidates, dense_scores[:, j]
+            
+            # Utilise argpartition au lieu de argsort pour plus de rapidité
+            n_dense = min(config.DENSE_CANDIDATES, len(candidates))
+            dense_top = np.argpartition(similarities, -n_dense)[-n_dense:]
+            dense_top = dense_top[np.argsort(-similarities[dense_top])]
+            dense_ranking = [int(candidates[i]) for i in dense_top]
+            similarity_by_idx = {int(candidates[i]): float(similarities[i]) for i in dense_top}
+            rankings.append((dense_ranking, scores, self._similarity(similarity_by_idx, query_embedding)))
+        return rankings
+    
+    def _similarity(self, similarity_by_idx: dict, query_embedding):
+        def similarity(idx: int) -> float:
+            value = similarity_by_idx.get(idx)
+            if value is None:
+                # Candidat lexical hors du classement dense : calculé à la demande
+                import numpy as np
+                value = similarity_by_idx[idx] = float(np.dot(self.embeddings[idx], query_embedding))
+            return value
+        return similarity
 
 class AIAssistant:
-    def __init__(self, ollama_model: str = "Mistral-7B"):
-        self.data_processor = DataProcessor()
-        self.ollama_client = OllamaClient(model=ollama_model)
-        self.load_knowledge_base()
+    def __init__(self, ollama_model: str = "Mistral-7B", data_dir: str = config.DATA_DIR,
+                 index_dir: str = config.INDEX_DIR, embedding_model=None, ollama_url: str = config.OLLAMA_URL,
+                 memory: Optional[ConversationMemory] = None, shard: Optional[Tuple[int, int]] = None,
+                 shard_urls: Optional[List[str]] = None, faq: Optional[FaqCache] = None,
+                 scheduler: Optional[FairScheduler] = None):
+        self.data_dir = data_dir
+        self.memory = memory
+        self.faq = faq
+        # Sans ordonnanceur (traitements par lots), Ollama est appelé directement
+        self.scheduler = scheduler
+        # Processus de shard (partition locale) ou coordinateur (shards distants)
+        self.shard = shard
+        self.shard_urls = config.SHARD_URLS if shard_urls is None and shard is None else (shard_urls or [])
+        if shard:
+            # Répertoire propre au shard : le nettoyage des anciens index reste local
+            index_dir = "%s-shard-%d-of-%d" % ((index_dir.rstrip(os.sep),) + tuple(shard))
+        self.index_dir = index_dir
+        self.embedding_model = embedding_model
+        self.ollama_client = OllamaClient(base_url=ollama_url, model=ollama_model)
+        self.corpus_fingerprint = DataProcessor.corpus_fingerprint(data_dir)
+        self.reload_lock = asyncio.Lock()
+        self.reload_task = None
+        self.data_processor = self.load_knowledge_base()
+        # Le reclassement s'applique aux candidats fusionnés, donc côté coordinateur
+        self.reranker = None if shard else self.load_reranker()
+    
+    def load_reranker(self) -> Optional[CrossEncoderReranker]:
+        """Charge le cross-encoder de reclassement (désactivé si aucun modèle n'est configuré)"""
+        if not config.RERANKER_MODEL:
+            return None
+        try:
+            reranker = CrossEncoderReranker(config.RERANKER_MODEL, budget_ms=config.RERANK_BUDGET_MS)
+            print(f"Reranker chargé: {config.RERANKER_MODEL}")
+            return reranker
+        except Exception as e:
+            print(f"Reranker indisponible, ordre du bi-encodeur conservé: {e}")
+            return None
+    
+    def corpus_version(self) -> str:
+        """Version du corpus et de l'encodeur, à laquelle sont liées les réponses précalculées"""
+        # Coordinateur d'un index réparti : pas d'encodeur local
+        model = getattr(self.data_processor, "model", None)
+        return DataProcessor.index_key(self.corpus_fingerprint, getattr(model, "name", ""))
+    
+    def retrieval_candidates(self) -> int:
+        """Nombre de passages demandés à la première étape de recherche"""
+        return config.RETRIEVAL_CANDIDATES if self.reranker else config.RETRIEVAL_TOP_K
+    
+    def retrieve(self, data_processor: DataProcessor, query: str, filters: Optional[dict] = None,
+                 query_embedding=None):
+        """Recherche en deux étapes : large sélection de candidats, puis reclassement
+        par cross-encoder. Retourne (passages, statistiques par étape).
+        `query_embedding` : question déjà encodée (index local uniquement)."""
+        top_k = config.RETRIEVAL_TOP_K
+        candidate_k = self.retrieval_candidates()
+        
+        start = time.perf_counter()
+        shard_stats = {}
+        with metrics.span("retrieval"):
+            if isinstance(data_processor, ShardedRetriever):
+                candidates, shard_stats = data_processor.search(query, top_k=candidate_k, filters=filters)
+            else:
+                candidates = data_processor.find_similar_content(query, top_k=candidate_k, filters=filters,
+                                                                 query_embedding=query_embedding)
+        stats = {
+            "candidates": len(candidates),
+            "top_k": top_k,
+            "first_stage_ms": round((time.perf_counter() - start) * 1000, 2),
+            "reranked": False,
+            **shard_stats
+        }
+        
+        return self.rerank(query, candidates, stats)
+    
+    def rerank(self, query: str, candidates: List[dict], stats: dict):
+        """Seconde étape : reclassement des candidats par le cross-encoder, s'il y en a un"""
+        top_k = config.RETRIEVAL_TOP_K
+        if self.reranker and len(candidates) > top_k:
+            with metrics.span("rerank"):
+                results, rerank_stats = self.reranker.rerank(query, candidates, top_k)
+            stats.update(rerank_stats)
+        else:
+            results = candidates[:top_k]
+        return results, stats
+    
+    def retrieve_batch(self, data_processor: DataProcessor, queries: List[str], filters: Optional[dict] = None):
+        """Recherche de plusieurs questions : première étape groupée (un encodage, un
+        produit matriciel), puis reclassement question par question"""
+        if not isinstance(data_processor, DataProcessor):
+            # Index réparti : chaque shard encode lui-même les questions
+            return [self.retrieve(data_processor, query, filters) for query in queries]
+        start = time.perf_counter()
+        with metrics.span("retrieval"):
+            batch = data_processor.search_batch(queries, top_k=self.retrieval_candidates(), filters=filters)
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+        return [
+            self.rerank(query, candidates, {
+                "candidates": len(candidates),
+                "top_k": config.RETRIEVAL_TOP_K,
+                # Durée de la première étape pour tout le lot
+                "first_stage_ms": elapsed_ms,
+                "batch_size": len(queries),
+                "reranked": False,
+            })
+            for query, candidates in zip(queries, batch)
+        ]
+    
+    @staticmethod
+    def prompt_context(similar_content: List[dict]) -> str:
+        """Contexte du prompt : les passages retenus, ou une consigne s'il n'y en a aucun"""
+        if not similar_content:
+            return NO_CONTEXT_PROMPT
+        context = "INFORMATIONS PERTINENTES DE LA BASE DE CONNAISSANCES:\n\n"
+        for i, item in enumerate(similar_content):
+            context += f"--- Source {i+1} ({item['source']}) ---\n"
+            context += f"{item['content']}\n\n"
+        return context
     
-    def load_knowledge_base(self):
-        """Charge la base de connaissances"""
+    def load_knowledge_base(self, previous: Optional[DataProcessor] = None) -> DataProcessor:
+        """Charge la base de connaissances dans une nouvelle instance de DataProcessor"""
+        if self.shard_urls:
+            # Coordinateur : chaque shard charge et recharge sa partition lui-même
+            retriever = previous if previous is not None else ShardedRetriever(
+                self.shard_urls, config.SHARD_TIMEOUT_MS, config.SHARD_MIN_ANSWERS)
+            for url, health in retriever.refresh().items():
+                print(f"Shard {url}: {health}")
+            return retriever
+        
         print("Chargement de la base de connaissances...")
-        self.data_processor.load_data_from_folder("data")
-        print(f"Données chargées: {len(self.data_processor.data)} éléments")
+        data_processor = DataProcessor(model=previous.model if previous is not None else self.embedding_model,
+                                       shard=self.shard)
+        
+        # Un index déjà construit pour ce corpus (par un autre worker) est réutilisé tel quel
+        index_key = DataProcessor.index_key(DataProcessor.corpus_fingerprint(self.data_dir),
+                                            getattr(data_processor.model, "name", ""))
+        index_path = os.path.join(self.index_dir, index_key)
+        if data_processor.load_index(index_path):
+            print(f"Index chargé depuis {index_path}: {len(data_processor.data)} éléments")
+            return data_processor
         
-        if self.data_processor.data:
+        data_processor.load_data_from_folder(self.data_dir)
+        print(f"Données chargées: {len(data_processor.data)} éléments")
+        
+        if data_processor.data:
             print("Génération des embeddings...")
-            self.data_processor.generate_embeddings()
+            data_processor.generate_embeddings(previous=previous)
             print("Embeddings générés avec succès")
+            data_processor.build_lexical_index()
+            print(f"Index lexical construit: {len(data_processor.lexical_index.postings)} termes")
+            data_processor.build_metadata_index()
+            
+            # Persiste puis recharge en mmap pour libérer la copie privée de la matrice
+            data_processor.save_index(index_path)
+            data_processor.load_index(index_path)
+            self.prune_indexes(keep=index_key)
+        return data_processor
+    
+    def prune_indexes(self, keep: str):
+        """Supprime les index des versions précédentes du corpus"""
+        if not os.path.isdir(self.index_dir):
+            return
+        for name in os.listdir(self.index_dir):
+            if name != keep:
+                # Les workers qui les mappent encore conservent l'accès (inode ouvert)
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+    
+    async def reload_knowledge_base(self) -> dict:
+        """Reconstruit la base de connaissances en arrière-plan puis la bascule atomiquement"""
+        async with self.reload_lock:
+            start = time.perf_counter()
+            fingerprint = DataProcessor.corpus_fingerprint(self.data_dir)
+            data_processor = await asyncio.to_thread(self.load_knowledge_base, self.data_processor)
+            
+            # Simple réaffectation : les requêtes en cours gardent l'ancienne instance
+            self.data_processor = data_processor
+            self.corpus_fingerprint = fingerprint
+            
+            duration = time.perf_counter() - start
+            print(f"Base de connaissances rechargée en {duration:.2f}s ({len(data_processor)} éléments)")
+            return {"data_loaded": len(data_processor), "duration_s": round(duration, 3)}
+    
+    def schedule_reload(self) -> bool:
+        """Lance un rechargement en tâche de fond ; False si un rechargement est déjà en cours"""
+        if self.reload_task and not self.reload_task.done():
+            return False
+        self.reload_task = asyncio.create_task(self.reload_knowledge_base())
+        return True
+    
+    async def watch_data_folder(self, interval: int):
+        """Surveille le dossier du corpus et recharge la base à chaque modification"""
+        while True:
+            await asyncio.sleep(interval)
+            if DataProcessor.corpus_fingerprint(self.data_dir) != self.corpus_fingerprint:
+                print("Modification du corpus détectée")
+                if self.schedule_reload():
+                    try:
+                        await self.reload_task
+                    except Exception as e:
+                        print(f"Erreur lors du rechargement: {e}")
+    
+    async def warm_up(self) -> dict:
+        """Préchauffage : recherche factice (embeddings, BM25, reranker), présence
+        du modèle dans Ollama et génération courte pour le charger en mémoire.
+        
+        Un échec côté Ollama (injoignable, modèle absent, chargement en erreur ou trop
+        long) ne bloque pas la disponibilité : le maintien au chaud (keep_warm)
+        retente le chargement, et les questions restent possibles dès son retour."""
+        stats = {}
+        start = time.perf_counter()
+        await asyncio.to_thread(self.retrieve, self.data_processor, "création d'entreprise")
+        stats["retrieval_s"] = round(time.perf_counter() - start, 3)
+        
+        try:
+            models = await self.ollama_client.list_models()
+        except Exception as e:
+            # Ollama peut démarrer après l'API : le maintien au chaud prendra le relais
+            print(f"Ollama injoignable, préchauffage du modèle reporté: {e}")
+            stats["ollama"] = "unreachable"
+            return stats
+        if not self.ollama_client.has_model(models):
+            # Modèle en cours de téléchargement (ollama pull) ou mal configuré
+            print(f"Modèle Ollama '{self.ollama_client.model}' introuvable "
+                  f"(disponibles: {', '.join(models) or 'aucun'}), préchauffage du modèle reporté")
+            stats["ollama"] = "model_missing"
+            return stats
+        
+        start = time.perf_counter()
+        try:
+            result = await self.ollama_client.load_model(warm_prefix=True)
+        except Exception as e:
+            print(f"Chargement du modèle Ollama impossible, préchauffage reporté: {e!r}")
+            stats["ollama"] = "load_failed"
+            return stats
+        stats["generation_s"] = round(time.perf_counter() - start, 3)
+        stats["load_s"] = round(result.get("load_duration", 0) / 1e9, 3)
+        stats["ollama"] = "ready"
+        return stats
+    
+    async def keep_warm(self, interval: float):
+        """Recharge le modèle Ollama après `interval` secondes sans requête"""
+        while True:
+            idle = time.monotonic() - self.ollama_client.last_request_at
+            if idle < interval:
+                await asyncio.sleep(interval - idle)
+                continue
+            try:
+                await self.ollama_client.load_model()
+            except Exception as e:
+                print(f"Maintien au chaud du modèle Ollama impossible: {e}")
+                await asyncio.sleep(interval)
     
-    async def generate_response(self, query: str) -> dict:
-        """Génère une réponse basée sur les données disponibles avec Ollama"""
+    async def generate(self, client: Optional[str], *args, **kwargs) -> Tuple[str, Optional[List[int]]]:
+        """Appel à Ollama, dans un créneau de l'ordonnanceur équitable s'il y en a un"""
+        if self.scheduler is None:
+            return await self.ollama_client.generate_response(*args, **kwargs)
+        async with self.scheduler.slot(client or "anonymous"):
+            return await self.ollama_client.generate_response(*args, **kwargs)
+    
+    async def generate_response(self, query: str, filters: Optional[dict] = None,
+                                conversation_id: Optional[str] = None, client: Optional[str] = None,
+                                raise_errors: bool = False) -> dict:
+        """Génère une réponse basée sur les données disponibles avec Ollama
+        (raise_errors : voir OllamaClient.generate_response)"""
+        # Instantané de la base : un rechargement concurrent ne l'affecte pas
+        data_processor = self.data_processor
+        
+        # Historique de la conversation et question reformulée pour la recherche
+        history, search_query, ollama_context = "", query, None
+        if self.memory and conversation_id:
+            with metrics.span("conversation_history"):
+                await self.memory.load(conversation_id)
+                search_query = self.memory.rewrite_query(conversation_id, query)
+                # Le context Ollama du tour précédent contient déjà l'historique ;
+                # trop long, il est abandonné au profit de l'historique résumé
+                ollama_context = self.memory.ollama_context(conversation_id)
+                if not ollama_context or len(ollama_context) > config.OLLAMA_CONTEXT_TOKENS:
+                    ollama_context = None
+                    history = self.memory.build_history(conversation_id)
+        
+        # Question fréquente autonome : réponse précalculée pour la version courante du corpus
+        # (les questions de suivi dépendent de la conversation et ne sont jamais concernées)
+        query_embedding = None
+        if self.faq is not None and not filters and search_query == query and isinstance(data_processor, DataProcessor):
+            def lookup():
+                # Question encodée une seule fois : la recherche la réutilise si le cache ne répond pas
+                embedding = data_processor.encode_queries([query])[0]
+                return self.faq.lookup(data_processor.model, query, self.corpus_version(), embedding), embedding
+
+            with metrics.span("faq_lookup"):
+                cached, query_embedding = await asyncio.to_thread(lookup)
+            if cached:
+                if self.memory and conversation_id:
+                    # Ce tour n'est pas passé par Ollama : le context précédent ne le contient pas
+                    self.memory.set_ollama_context(conversation_id, None)
+                return {
+                    "response": cached["answer"],
+                    "sources": cached["sources"],
+                    "retrieval": {
+                        "faq": True,
+                        "faq_question": cached["question"],
+                        "faq_similarity": round(cached["similarity"], 4),
+                        "faq_updated_at": cached["updated_at"]
+                    }
+                }
+        
         # Cherche le contenu pertinent
-        similar_content = self.data_processor.find_similar_content(query)
+        # (hors de la boucle d'événements : encodage et reclassement sont coûteux en CPU)
+        similar_content, retrieval_stats = await asyncio.to_thread(self.retrieve, data_processor, search_query, filters,
+                                                                   query_embedding)
+        print(f"Recherche: {retrieval_stats}")
         
         if not similar_content:
             # Si pas de contenu pertinent, on utilise quand même Ollama
-            response = await self.ollama_client.generate_response(
+            response, new_context = await self.generate(
+                client,
                 query, 
-                "Aucune information spécifique dans la base de connaissances. Réponds en tant qu'expert en entrepreneuriat."
+                NO_CONTEXT_PROMPT,
+                history,
+                ollama_context,
+                raise_errors=raise_errors
             )
             print(f"Réponse sans contexte: {response}")
+            if self.memory and conversation_id:
+                self.memory.set_ollama_context(conversation_id, new_context)
             return {
                 "response": response,
-                "sources": []
+                "sources": [],
+                "retrieval": retrieval_stats
             }
         
         # Construit le contexte avec les informations pertinentes
-        context = "INFORMATIONS PERTINENTES DE LA BASE DE CONNAISSANCES:\n\n"
-        for i, item in enumerate(similar_content):
-            context += f"--- Source {i+1} ({item['source']}) ---\n"
-            context += f"{item['content']}\n\n"
+        with metrics.span("context_assembly"):
+            context = self.prompt_context(similar_content)
         
         # Génère la réponse avec Ollama
-        response = await self.ollama_client.generate_response(query, context)
+        response, new_context = await self.generate(client, query, context, history, ollama_context,
+                                                    raise_errors=raise_errors)
+        if self.memory and conversation_id:
+            self.memory.set_ollama_context(conversation_id, new_context)
         
         return {
             "response": response,
-            "sources": list(set([item['source'] for item in similar_content]))
+            "sources": list(set([item['source'] for item in similar_content])),
+            "retrieval": retrieval_stats
         }
     
     async def close(self):
         await self.ollama_client.close()
+        if isinstance(self.data_processor, ShardedRetriever):
+            self.data_processor.close()
 
 # Initialisation de l'assistant et de la base de données
 assistant = None
 db_manager = None
+write_queue = None
+event_broker = None
+watch_task = None
+keep_warm_task = None
+maintenance_task = None
+
+# Mode préchargement (gunicorn --preload) : le modèle est chargé une seule fois
+# dans le processus maître, puis partagé en copie-sur-écriture par les workers
+shared_embedding_model = load_embedding_model() if config.PRELOAD_MODEL else None
+
+class StartupTimer:
+    """Mesure et journalise la durée de chaque phase du démarrage"""
+    def __init__(self):
+        self.phases = {}
+        self.started_at = time.perf_counter()
+    
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 3)
+            print(f"[démarrage] {name}: {self.phases[name]:.2f}s")
+    
+    def total(self) -> float:
+        return round(time.perf_counter() - self.started_at, 3)
+
+startup_timer = StartupTimer()
+startup_task = None
+startup_error = None
+
+async def initialize_assistant():
+    """Charge les composants de recherche en arrière-plan puis signale la disponibilité"""
+    global assistant, watch_task, keep_warm_task, startup_error
+    try:
+        model = None
+        if not config.SHARD_URLS:
+            # Coordinateur d'un index réparti : les requêtes sont encodées par les shards
+            with startup_timer.phase("imports"):
+                await asyncio.to_thread(__import__, BACKEND_MODULES.get(config.EMBEDDING_BACKEND, "sentence_transformers"))
+            
+            with startup_timer.phase("embedding_model"):
+                model = shared_embedding_model or await asyncio.to_thread(load_embedding_model)
+        
+        with startup_timer.phase("knowledge_base"):
+            ready_assistant = await asyncio.to_thread(
+                AIAssistant, config.OLLAMA_MODEL, embedding_model=model,
+                memory=ConversationMemory(db_manager, write_queue=write_queue),
+                faq=FaqCache(config.DB_PATH) if config.FAQ_ENABLED else None, scheduler=generation_scheduler
+            )
+        
+        if config.WARMUP:
+            # Avant la disponibilité : la première question ne paie pas les chargements
+            with startup_timer.phase("warm_up"):
+                try:
+                    warm_up_stats = await ready_assistant.warm_up()
+                except Exception:
+                    await ready_assistant.close()
+                    raise
+            print(f"Préchauffage: {warm_up_stats}")
+        
+        assistant = ready_assistant
+        if config.RELOAD_WATCH_INTERVAL > 0:
+            watch_task = asyncio.create_task(assistant.watch_data_folder(config.RELOAD_WATCH_INTERVAL))
+        if config.KEEP_WARM_INTERVAL > 0:
+            keep_warm_task = asyncio.create_task(assistant.keep_warm(config.KEEP_WARM_INTERVAL))
+        print(f"Assistant IA prêt en {startup_timer.total():.2f}s")
+    except Exception as e:
+        startup_error = str(e)
+        print(f"Erreur lors de l'initialisation de l'assistant: {e}")
+
+async def maintain_history(interval: int):
+    """Rétention et compaction périodiques de l'historique (un seul worker à la fois)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Les messages en attente sont écrits avant qu'une conversation soit archivée
+            await write_queue.flush()
+            stats = await asyncio.to_thread(run_maintenance, db_manager)
+            print(f"Maintenance de l'historique: {stats}")
+        except Exception as e:
+            print(f"Erreur lors de la maintenance de l'historique: {e}")
+
+def require_admin(x_admin_token: Optional[str]):
+    """Vérifie le jeton d'administration ; sans YOLSDA_ADMIN_TOKEN, tout accès est refusé"""
+    if not config.ADMIN_TOKEN:
+        # Pas d'exception pour les connexions locales : derrière un proxy, toutes le sont
+        raise HTTPException(status_code=403, detail="Administration désactivée (YOLSDA_ADMIN_TOKEN non défini)")
+    if not hmac.compare_digest((x_admin_token or "").encode("utf-8"), config.ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Accès administrateur refusé")
+
+async def check_rate_limit(client: str):
+    """Consomme un jeton du client ; 429 avec Retry-After si son seau est vide"""
+    if rate_limiter is None:
+        return
+    if rate_limiter.blocking:
+        # Base SQLite partagée : l'attente du verrou ne bloque pas la boucle d'événements
+        allowed, retry_after = await asyncio.to_thread(rate_limiter.acquire, client)
+    else:
+        allowed, retry_after = rate_limiter.acquire(client)
+    if not allowed:
+        rate_limited.inc(reason="rate")
+        raise HTTPException(status_code=429, detail="Trop de requêtes, réessayez dans un instant",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
 
 @app.on_event("startup")
 async def startup_event():
-    global assistant, db_manager
-    assistant = AIAssistant(ollama_model="gemma:2b")  # Configuration pour utiliser Gemma 2B
-    db_manager = DatabaseManager()  # Initialisation de la base de données
-    print("Assistant IA et base de données initialisés")
+    global db_manager, write_queue, event_broker, startup_task, maintenance_task
+    with startup_timer.phase("database"):
+        db_manager = DatabaseManager(config.DB_PATH, archive_dir=config.ARCHIVE_DIR)  # Initialisation de la base de données
+        write_queue = WriteBehindQueue(db_manager, config.WRITE_FLUSH_INTERVAL_MS, config.WRITE_MAX_BATCH)
+        write_queue.start()
+        event_broker = EventBroker(db_manager)
+        event_broker.attach(asyncio.get_running_loop())
+        event_broker.stop_on_signals()
+    
+    if config.MAINTENANCE_INTERVAL > 0:
+        maintenance_task = asyncio.create_task(maintain_history(config.MAINTENANCE_INTERVAL))
+    
+    # Le serveur répond immédiatement ; la recherche devient disponible une fois chargée
+    startup_task = asyncio.create_task(initialize_assistant())
+    print("Base de données initialisée, chargement de l'assistant en arrière-plan")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    if startup_task:
+        startup_task.cancel()
+    if watch_task:
+        watch_task.cancel()
+    if keep_warm_task:
+        keep_warm_task.cancel()
+    if maintenance_task:
+        maintenance_task.cancel()
+    if write_queue:
+        # Aucun message perdu lors d'un arrêt normal
+        await write_queue.close()
+    if event_broker:
+        await event_broker.close()
     if assistant:
         await assistant.close()
 
+index_html = None
+
 @app.get("/")
 async def read_index():
-    return FileResponse("templates/index.html")
+    # Page réécrite une fois pour pointer vers les URL versionnées des fichiers statiques
+    global index_html
+    if index_html is None:
+        with open("templates/index.html", "r", encoding="utf-8") as f:
+            index_html = asset_manifest.rewrite_html(f.read())
+    return HTMLResponse(index_html, headers={"Cache-Control": REVALIDATE})
 
-@app.post("/chat", response_model=AIResponse)
-async def chat_endpoint(chat_message: ChatMessage):
+@app.post("/chat", response_model=AIResponse, response_class=FastJSONResponse)
+async def chat_endpoint(chat_message: ChatMessage, request: Request):
     try:
-        if not assistant or not db_manager:
-            raise HTTPException(status_code=500, detail="Assistant ou base de données non initialisé")
+        client = client_id(request.headers, request.client.host if request.client else None)
+        await check_rate_limit(client)
+        if not db_manager:
+            raise HTTPException(status_code=500, detail="Base de données non initialisée")
+        if not assistant:
+            raise HTTPException(status_code=503, detail="Assistant en cours de chargement, réessayez dans un instant")
         
-        # Génère la réponse
-        response_data = await assistant.generate_response(chat_message.message)
+        unknown_filters = set(chat_message.filters or {}) - set(METADATA_FIELDS)
+        if unknown_filters:
+            raise HTTPException(status_code=400, detail=f"Filtres inconnus: {', '.join(sorted(unknown_filters))}")
         
-        # Crée un ID de conversation si non fourni
-        conversation_id = chat_message.conversation_id or f"conv_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # Crée un ID de conversation si non fourni ; aléatoire, car l'historique et le context
+        # Ollama en dépendent : deux nouvelles conversations ne doivent jamais le partager
+        conversation_id = chat_message.conversation_id or f"conv_{uuid.uuid4().hex}"
         
-        # Sauvegarde dans l'historique
-        db_manager.save_message(
+        # Génère la réponse (en tenant compte des échanges précédents de la conversation)
+        response_data = await assistant.generate_response(
+            chat_message.message,
+            filters=chat_message.filters,
+            conversation_id=conversation_id,
+            client=client
+        )
+        
+        # Sauvegarde dans l'historique (écriture différée, groupée avec les autres requêtes)
+        write_queue.save_message(
             conversation_id=conversation_id,
             message=chat_message.message,
             response=response_data["response"],
             sources=response_data["sources"]
         )
+        if assistant.memory:
+            assistant.memory.append(conversation_id, chat_message.message, response_data["response"])
         
         return AIResponse(
             response=response_data["response"],
             conversation_id=conversation_id,
-            sources=response_data["sources"]
+            sources=response_data["sources"],
+            retrieval=response_data.get("retrieval", {})
         )
+    except HTTPException:
+        raise
+    except SchedulerFull:
+        # Ce client a déjà plusieurs questions en attente de génération
+        raise HTTPException(status_code=429, detail="Trop de questions en attente, réessayez dans un instant",
+                            headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors du traitement: {str(e)}")
 
 @app.get("/api/conversations")
-async def get_conversations(limit: int = 20):
-    """Récupère la liste des conversations"""
+async def get_conversations(request: Request, limit: int = 20):
+    """Récupère la liste des conversations (GET conditionnel : 304 si inchangée)"""
     if not db_manager:
         raise HTTPException(status_code=500, detail="Base de données non initialisée")
+    await write_queue.flush()
+    etag = f'W/"{db_manager.get_revision()}-{limit}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
     # Retourne une liste directement (frontend attend un tableau)
-    return db_manager.get_all_conversations(limit)
+    return FastJSONResponse(db_manager.get_all_conversations(limit), headers=headers)
+
+
+@app.get("/api/conversations/events")
+async def conversation_events():
+    """Flux SSE des modifications de conversations (création, renommage, suppression, message)"""
+    if not event_broker:
+        raise HTTPException(status_code=500, detail="Base de données non initialisée")
+    return StreamingResponse(
+        event_broker.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Déclarée avant /api/conversations/{conversation_id}, qui capturerait sinon « search »
+@app.get("/api/conversations/search", response_class=FastJSONResponse)
+async def search_conversations(q: str, limit: int = 20, offset: int = 0):
+    """Recherche plein texte dans les messages et réponses de l'historique"""
+    if not db_manager:
+        raise HTTPException(status_code=500, detail="Base de données non initialisée")
+    if limit < 1 or limit > 100 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit doit être entre 1 et 100, offset positif")
+    await write_queue.flush()
+    with metrics.span("search"):
+        return db_manager.search_messages(q, limit, offset)
 
 
 @app.post("/api/conversations")
@@ -338,8 +1263,8 @@ async def create_conversation(payload: dict):
         raise HTTPException(status_code=500, detail="Base de données non initialisée")
 
     title = payload.get('title') if isinstance(payload, dict) else None
-    # Génère un ID unique simple
-    conversation_id = payload.get('id') if isinstance(payload, dict) and payload.get('id') else f"conv_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+    # Génère un ID unique (aléatoire)
+    conversation_id = payload.get('id') if isinstance(payload, dict) and payload.get('id') else f"conv_{uuid.uuid4().hex}"
 
     db_manager.create_conversation(conversation_id, title)
 
@@ -360,6 +1285,7 @@ async def update_conversation(conversation_id: str, payload: dict):
     if title is None:
         raise HTTPException(status_code=400, detail="title is required")
 
+    await write_queue.flush(conversation_id)
     db_manager.update_conversation_title(conversation_id, title)
     return {"id": conversation_id, "title": title}
 
@@ -371,18 +1297,23 @@ async def delete_conversation_api(conversation_id: str):
         raise HTTPException(status_code=500, detail="Base de données non initialisée")
 
     try:
+        # Les messages encore en file recréeraient la conversation après sa suppression
+        await write_queue.flush(conversation_id)
         db_manager.delete_conversation(conversation_id)
+        if assistant and assistant.memory:
+            assistant.memory.forget(conversation_id)
         return {"status": "deleted", "id": conversation_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression: {str(e)}")
 
 
-@app.get("/api/conversations/{conversation_id}")
+@app.get("/api/conversations/{conversation_id}", response_class=FastJSONResponse)
 async def get_conversation(conversation_id: str):
     """Récupère une conversation complète (métadonnées + messages)"""
     if not db_manager:
         raise HTTPException(status_code=500, detail="Base de données non initialisée")
 
+    await write_queue.flush(conversation_id)
     conv = db_manager.get_conversation(conversation_id)
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation non trouvée")
@@ -390,41 +1321,143 @@ async def get_conversation(conversation_id: str):
     return conv
 
 
-@app.post("/api/chat", response_model=AIResponse)
-async def api_chat(chat_message: ChatMessage):
+@app.post("/api/chat", response_model=AIResponse, response_class=FastJSONResponse)
+async def api_chat(chat_message: ChatMessage, request: Request):
     """Compatibilité : endpoint utilisé par le frontend (/api/chat)"""
     # Appelle la même logique que /chat
-    return await chat_endpoint(chat_message)
+    return await chat_endpoint(chat_message, request)
+
+@app.post("/api/batch")
+async def batch_endpoint(request: Request, run_id: Optional[str] = None):
+    """Questions-réponses par lots : questions en JSONL dans le corps, résultats en flux
+    JSONL. Avec run_id, les résultats sont aussi conservés côté serveur et la même
+    requête reprend le lot là où il s'était arrêté (voir backend.batch)."""
+    client = client_id(request.headers, request.client.host if request.client else None)
+    await check_rate_limit(client)
+    if not assistant:
+        raise HTTPException(status_code=503, detail="Assistant en cours de chargement, réessayez dans un instant")
+    if run_id is not None and not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", run_id):
+        raise HTTPException(status_code=400, detail="run_id invalide (lettres, chiffres, - et _)")
+    try:
+        items = parse_questions((await request.body()).decode("utf-8").splitlines(), config.BATCH_MAX_ITEMS)
+    except (BatchError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    output = None
+    if run_id is not None:
+        # Verrou sur le fichier de résultats : exclusif entre workers
+        try:
+            output = open_output(os.path.join(config.BATCH_DIR, f"{run_id}.jsonl"))
+        except BatchBusy:
+            raise HTTPException(status_code=409, detail="Ce lot est déjà en cours de traitement")
+    
+    # Le serveur de l'assistant passe par l'ordonnanceur équitable ; les autres sont dédiés aux lots
+    backends = [
+        assistant.ollama_client if url == assistant.ollama_client.base_url
+        else OllamaClient(base_url=url, model=assistant.ollama_client.model)
+        for url in config.BATCH_OLLAMA_URLS
+    ]
+    async def stream():
+        try:
+            async for result in run_batch(assistant, items, backends, output=output, client=client):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            if output:
+                output.close()
+            for backend in backends:
+                if backend is not assistant.ollama_client:
+                    await backend.close()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
-@app.get("/api/conversations/{conversation_id}/history")
+@app.get("/api/conversations/{conversation_id}/history", response_class=FastJSONResponse)
 async def get_conversation_history(conversation_id: str, limit: int = 10):
     """Récupère l'historique d'une conversation spécifique"""
     if not db_manager:
         raise HTTPException(status_code=500, detail="Base de données non initialisée")
+    await write_queue.flush(conversation_id)
     return {"history": db_manager.get_conversation_history(conversation_id, limit)}
 
+@app.post("/api/admin/reload")
+async def reload_knowledge_base(x_admin_token: Optional[str] = Header(None)):
+    """Recharge le corpus en arrière-plan sans redémarrer le serveur"""
+    require_admin(x_admin_token)
+    if not assistant:
+        raise HTTPException(status_code=503, detail="Assistant en cours de chargement")
+
+    started = assistant.schedule_reload()
+    return {
+        "status": "started" if started else "already_running",
+        "data_loaded": len(assistant.data_processor)
+    }
+
+@app.get("/api/admin/profiling")
+async def get_profiling(x_admin_token: Optional[str] = Header(None)):
+    """État du profileur par échantillonnage"""
+    require_admin(x_admin_token)
+    return profiler.status()
+
+@app.post("/api/admin/profiling")
+async def configure_profiling(settings: ProfilingSettings, x_admin_token: Optional[str] = Header(None)):
+    """Active/désactive le profileur et règle la fraction de requêtes échantillonnées,
+    pour tous les workers (réglage partagé via le répertoire des profils)"""
+    require_admin(x_admin_token)
+    profiler.configure(enabled=settings.enabled, sample_rate=settings.sample_rate,
+                       interval_ms=settings.interval_ms, shared=True)
+    return profiler.status()
+
+@app.get("/ready")
+async def readiness_check():
+    """Disponibilité : 200 uniquement lorsque l'assistant est chargé"""
+    body = {
+        "ready": assistant is not None,
+        "startup_phases": startup_timer.phases,
+        "error": startup_error
+    }
+    if assistant is None:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
 @app.get("/health")
 async def health_check():
+    """Vivacité : le processus répond, même pendant le chargement de l'assistant ; 503 si ce chargement a échoué"""
+    import aiohttp
     ollama_status = "unknown"
     try:
         async with aiohttp.ClientSession() as session:
-            async with session.get("http://localhost:11434/api/tags") as response:
+            async with session.get(f"{config.OLLAMA_URL}/api/tags") as response:
                 ollama_status = "healthy" if response.status == 200 else "unhealthy"
     except:
         ollama_status = "unreachable"
     
+    if startup_error:
+        # Chargement de l'assistant en échec (index, modèle d'embeddings...) : sans
+        # nouvelle tentative, seul un redémarrage du worker peut le rendre disponible
+        return JSONResponse(status_code=503, content={
+            "status": "unhealthy",
+            "ready": False,
+            "error": startup_error,
+            "ollama_status": ollama_status
+        })
     return {
         "status": "healthy", 
-        "data_loaded": len(assistant.data_processor.data) if assistant else 0,
-        "ollama_status": ollama_status
+        "ready": assistant is not None,
+        "data_loaded": len(assistant.data_processor) if assistant else 0,
+        "ollama_status": ollama_status,
+        "generation": generation_scheduler.stats()
     }
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Métriques au format d'exposition Prometheus"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/models")
 async def get_models():
     """Récupère la liste des modèles disponibles dans Ollama"""
+    import aiohttp
     try:
         async with aiohttp.ClientSession() as session:
-            async with session.get("http://localhost:11434/api/tags") as response:
+            async with session.get(f"{config.OLLAMA_URL}/api/tags") as response:
                 if response.status == 200:
                     data = await response.json()
                     return {"models": data.get("models", [])}
@@ -0,0 +1,102 @@
+"""
+Index de métadonnées en colonnes (catégorie, type, source) pour filtrer la recherche
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Union
+
+# Champs de métadonnées conservés pour chaque élément du corpus
+METADATA_FIELDS = ("category", "type", "source")
+
+FilterValue = Union[str, List[str]]
+
+
+class MetadataIndex:
+    """Stocke chaque champ sous forme de colonne codée (vocabulaire + codes entiers),
+    ce qui permet de calculer la partition correspondant à un filtre par simple
+    comparaison vectorielle."""
+
+    def __init__(self):
+        self.size = 0
+        self.vocabularies: Dict[str, List[str]] = {}
+        self.codes: Dict[str, list] = {}
+        self._arrays = {}
+
+    def __len__(self):
+        return self.size
+
+    def build(self, records: List[dict]):
+        """Construit les colonnes à partir d'une liste de dictionnaires de métadonnées"""
+        self.size = len(records)
+        self.vocabularies = {}
+        self.codes = {}
+        for field in METADATA_FIELDS:
+            vocabulary: Dict[str, int] = {}
+            column = []
+            for record in records:
+                value = str(record.get(field) or "")
+                column.append(vocabulary.setdefault(value, len(vocabulary)))
+            self.vocabularies[field] = list(vocabulary)
+            self.codes[field] = column
+        self._arrays = {}
+
+    def save(self, path: str):
+        """Écrit l'index sur disque (écriture atomique)"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "size": self.size,
+                "vocabularies": self.vocabularies,
+                "codes": self.codes
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MetadataIndex":
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        index = cls()
+        index.size = raw["size"]
+        index.vocabularies = raw["vocabularies"]
+        index.codes = raw["codes"]
+        return index
+
+    def _column(self, field: str):
+        import numpy as np
+        if field not in self._arrays:
+            self._arrays[field] = np.asarray(self.codes[field], dtype=np.int32)
+        return self._arrays[field]
+
+    def values(self, field: str) -> List[str]:
+        """Valeurs distinctes d'un champ"""
+        return [v for v in self.vocabularies.get(field, []) if v]
+
+    def mask(self, filters: Optional[Dict[str, FilterValue]]):
+        """Masque booléen des éléments satisfaisant les filtres, ou None sans filtre.
+
+        Chaque filtre accepte une valeur ou une liste de valeurs ; une valeur
+        préfixée par « ! » exclut au lieu d'inclure, par exemple
+        {"category": ["fiscalite", "financement"], "type": "!synthetic"}.
+        """
+        import numpy as np
+        if not filters:
+            return None
+
+        mask = np.ones(self.size, dtype=bool)
+        for field, wanted in filters.items():
+            if field not in self.vocabularies:
+                raise ValueError(f"Champ de filtre inconnu: {field}")
+            values = [wanted] if isinstance(wanted, str) else list(wanted)
+            included = [v for v in values if not v.startswith("!")]
+            excluded = [v[1:] for v in values if v.startswith("!")]
+
+            vocabulary = {value: code for code, value in enumerate(self.vocabularies[field])}
+            column = self._column(field)
+            if included:
+                codes = [vocabulary[v] for v in included if v in vocabulary]
+                mask &= np.isin(column, codes)
+            if excluded:
+                codes = [vocabulary[v] for v in excluded if v in vocabulary]
+                mask &= ~np.isin(column, codes)
+        return mask
@@ -0,0 +1,167 @@
+"""
+Métriques au format Prometheus et mesure du temps passé dans chaque étape d'une requête
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Bornes (en secondes) adaptées à des étapes allant de la milliseconde à la minute
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Durées des étapes de la requête HTTP en cours (nom -> secondes)
+request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # valeurs des labels -> (compteurs par borne, somme, nombre)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.histogram(
+    "yolsda_http_request_duration_seconds", "Durée des requêtes HTTP", ("method", "path", "status")
+)
+stage_duration = registry.histogram(
+    "yolsda_stage_duration_seconds", "Durée des étapes de traitement d'une question", ("stage",)
+)
+ollama_time_to_first_token = registry.histogram(
+    "yolsda_ollama_time_to_first_token_seconds",
+    "Temps avant le premier token (chargement du modèle + évaluation du prompt)"
+)
+ollama_prompt_eval_duration = registry.histogram(
+    "yolsda_ollama_prompt_eval_seconds", "Durée d'évaluation du prompt par Ollama"
+)
+ollama_tokens_per_second = registry.histogram(
+    "yolsda_ollama_tokens_per_second", "Débit de génération d'Ollama (eval_count / eval_duration)",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+)
+ollama_tokens = registry.counter(
+    "yolsda_ollama_tokens_total", "Tokens traités par Ollama", ("kind",)
+)
+
+
+@contextmanager
+def span(stage: str):
+    """Mesure une étape : histogramme global et détail de la requête en cours"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage=stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def record_ollama_stats(result: dict):
+    """Exploite les statistiques renvoyées par /api/generate (durées en nanosecondes)"""
+    load_s = result.get("load_duration", 0) / 1e9
+    prompt_eval_s = result.get("prompt_eval_duration", 0) / 1e9
+    eval_s = result.get("eval_duration", 0) / 1e9
+    eval_count = result.get("eval_count", 0)
+
+    ollama_time_to_first_token.observe(load_s + prompt_eval_s)
+    ollama_prompt_eval_duration.observe(prompt_eval_s)
+    if eval_s > 0:
+        ollama_tokens_per_second.observe(eval_count / eval_s)
+    ollama_tokens.inc(result.get("prompt_eval_count", 0), kind="prompt")
+    ollama_tokens.inc(eval_count, kind="generated")
+
+    timings = request_timings.get()
+    if timings is not None:
+        timings["ollama_ttft"] = load_s + prompt_eval_s
+        timings["ollama_prompt_eval"] = prompt_eval_s
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """En-tête Server-Timing (durées en millisecondes)"""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
@@ -0,0 +1,189 @@
+"""
+Profileur par échantillonnage activable à chaud pour une fraction des requêtes
+
+Pendant une requête échantillonnée, un thread relève la pile de tous les autres
+threads du worker à intervalle fixe (boucle d'événements et threads auxquels
+la recherche est déléguée). Le profil couvre donc tout le processus pendant la
+requête, requêtes simultanées comprises : chaque pile commence par
+« processus <pid> », et les tâches d'une même boucle d'événements ne peuvent
+pas être séparées. Les piles sont écrites au format « folded » (une pile par
+ligne, suivie de son nombre d'échantillons), directement exploitable par
+flamegraph.pl, speedscope ou inferno.
+
+Les réglages modifiés à chaud sont écrits dans settings.json (répertoire des
+profils) et relus par chaque worker au plus une fois par seconde.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+# Piles de threads inactifs (attente d'E/S ou de travail) : sans intérêt pour le CPU
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("connection.py", "_recv"),
+}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _StackSampler(threading.Thread):
+    def __init__(self, interval_s: float, root: str):
+        super().__init__(name="yolsda-profiler", daemon=True)
+        self.interval_s = interval_s
+        self.root = root
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self.interval_s):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stack.append(self.root)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class SamplingProfiler:
+    def __init__(self, output_dir: str = "profiles", sample_rate: float = 0.0,
+                 interval_ms: float = 5, max_files: int = 200):
+        self.output_dir = output_dir
+        self.enabled = False
+        self.sample_rate = sample_rate
+        self.interval_ms = interval_ms
+        self.max_files = max_files
+        self.profiled_requests = 0
+        self.settings_path = os.path.join(output_dir, "settings.json")
+        self._settings_mtime = None
+        self._synced_at = 0.0
+
+    def configure(self, enabled: bool = None, sample_rate: float = None, interval_ms: float = None,
+                  shared: bool = False):
+        """Applique les réglages ; avec shared, les écrit aussi pour les autres workers"""
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if interval_ms is not None:
+            self.interval_ms = max(float(interval_ms), 0.5)
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if shared:
+            os.makedirs(self.output_dir, exist_ok=True)
+            tmp_path = f"{self.settings_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"enabled": self.enabled, "sample_rate": self.sample_rate,
+                           "interval_ms": self.interval_ms}, f)
+            os.replace(tmp_path, self.settings_path)
+            self._settings_mtime = os.stat(self.settings_path).st_mtime_ns
+
+    def _sync(self):
+        """Relit settings.json s'il a changé (réglage fait via un autre worker)"""
+        try:
+            mtime = os.stat(self.settings_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._settings_mtime:
+            return
+        self._settings_mtime = mtime
+        try:
+            with open(self.settings_path, "r", encoding="utf-8") as f:
+                settings = json.load(f)
+            self.configure(enabled=settings.get("enabled"), sample_rate=settings.get("sample_rate"),
+                           interval_ms=settings.get("interval_ms"))
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Réglages du profileur illisibles ({self.settings_path}): {e}")
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "interval_ms": self.interval_ms,
+            "output_dir": self.output_dir,
+            "profiled_requests": self.profiled_requests,
+            "scope": "process",
+            "pid": os.getpid(),
+        }
+
+    def should_sample(self) -> bool:
+        # Coût lorsque le profileur est désactivé : une lecture d'horloge, et un stat
+        # de settings.json par seconde
+        now = time.monotonic()
+        if now - self._synced_at >= 1:
+            self._synced_at = now
+            self._sync()
+        return self.enabled and random.random() < self.sample_rate
+
+    @asynccontextmanager
+    async def profile(self, label: str):
+        """Échantillonne les piles du processus pendant l'exécution du bloc puis écrit le profil"""
+        sampler = _StackSampler(self.interval_ms / 1000, f"processus {os.getpid()}")
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            self.profiled_requests += 1
+            # Arrêt du thread (jusqu'à un intervalle) et écriture hors de la boucle d'événements
+            await asyncio.to_thread(self._finish, label, sampler, time.perf_counter() - start)
+
+    def _finish(self, label: str, sampler: _StackSampler, duration_s: float):
+        sampler.stop()
+        self._write(label, sampler, duration_s)
+
+    def _write(self, label: str, sampler: _StackSampler, duration_s: float):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        safe_label = label.strip("/").replace("/", "_") or "root"
+        path = os.path.join(self.output_dir, f"{safe_label}-{stamp}-{os.getpid()}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Profil écrit: {path} ({sampler.samples} échantillons du processus, {duration_s * 1000:.0f} ms)")
+        self._rotate()
+
+    def _rotate(self):
+        """Ne conserve que les max_files profils les plus récents"""
+        files = []
+        for name in os.listdir(self.output_dir):
+            if not name.endswith(".folded"):
+                continue
+            path = os.path.join(self.output_dir, name)
+            # Les autres workers font la même rotation : un fichier peut disparaître à tout moment
+            try:
+                files.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+        files.sort()
+        for _, path in files[:-self.max_files]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,222 @@
+"""
+Limitation de débit par client et partage équitable de la génération
+
+- Seau à jetons par client (clé d'API, sinon adresse IP) : RATE_LIMIT_PER_MINUTE
+  requêtes par minute en régime continu, avec des rafales d'au plus
+  RATE_LIMIT_BURST requêtes. L'état est gardé en mémoire (un seau par worker)
+  ou, avec YOLSDA_RATE_LIMIT_DB, dans une base SQLite partagée par les workers.
+- Ordonnanceur de génération : au plus GENERATION_CONCURRENCY appels à Ollama
+  simultanés par worker ; au-delà, les requêtes attendent dans une file par
+  client, servies à tour de rôle (round-robin) : un client qui envoie dix
+  questions d'affilée ne fait pas attendre les autres derrière les siennes.
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+from . import config, metrics
+
+rate_limited = metrics.registry.counter(
+    "yolsda_rate_limited_total", "Requêtes refusées par client trop actif", labelnames=("reason",)
+)
+
+
+def client_id(headers, peer: Optional[str], trust_proxy: bool = config.RATE_LIMIT_TRUST_PROXY) -> str:
+    """Identité du client : empreinte de la clé d'API (X-API-Key), sinon adresse IP
+    (premier élément de X-Forwarded-For derrière un proxy de confiance)"""
+    api_key = headers.get("x-api-key")
+    if api_key:
+        # La clé elle-même n'est ni conservée ni journalisée
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    if trust_proxy:
+        forwarded = headers.get("x-forwarded-for", "").split(",")[0].strip()
+        if forwarded:
+            return "ip:" + forwarded
+    return "ip:" + (peer or "unknown")
+
+
+def refill(tokens: float, updated_at: float, now: float, rate: float, burst: float) -> float:
+    """Jetons disponibles à `now` dans un seau rempli de `rate` jetons par seconde"""
+    return min(burst, tokens + max(0.0, now - updated_at) * rate)
+
+
+class MemoryRateLimiter:
+    """Seaux à jetons en mémoire (propres au worker)"""
+
+    # acquire() ne fait pas d'entrées-sorties : appelable depuis la boucle d'événements
+    blocking = False
+
+    def __init__(self, per_minute: int = config.RATE_LIMIT_PER_MINUTE, burst: int = config.RATE_LIMIT_BURST,
+                 max_clients: int = 10000):
+        self.rate = per_minute / 60
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, client: str) -> Tuple[bool, float]:
+        """Consomme un jeton ; retourne (accepté, secondes avant le prochain jeton)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self.buckets.get(client, (self.burst, now))
+            tokens = refill(tokens, updated_at, now, self.rate, self.burst)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[client] = (tokens, now)
+            if len(self.buckets) > self.max_clients:
+                self._prune(now)
+        return allowed, 0.0 if allowed else (1 - tokens) / self.rate
+
+    def _prune(self, now: float):
+        # Un seau redevenu plein équivaut à un seau absent
+        for client, (tokens, updated_at) in list(self.buckets.items()):
+            if refill(tokens, updated_at, now, self.rate, self.burst) >= self.burst:
+                del self.buckets[client]
+
+
+class SqliteRateLimiter:
+    """Seaux à jetons dans une base SQLite partagée par les workers (horloge murale commune)"""
+
+    # acquire() peut attendre le verrou d'écriture (jusqu'à 5 s) : à appeler dans un thread
+    blocking = True
+
+    def __init__(self, db_path: str, per_minute: int = config.RATE_LIMIT_PER_MINUTE,
+                 burst: int = config.RATE_LIMIT_BURST, prune_every: int = 1000):
+        self.db_path = db_path
+        self.rate = per_minute / 60
+        self.burst = max(1, burst)
+        self.prune_every = prune_every
+        self._calls = 0
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            client TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        ''')
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Mode autocommit : les transactions sont ouvertes explicitement (BEGIN IMMEDIATE)
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, client: str) -> Tuple[bool, float]:
+        now = time.time()
+        conn = self._connection()
+        # Verrou d'écriture dès la lecture : deux workers ne consomment pas le même jeton
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_limits WHERE client = ?", (client,)).fetchone()
+            tokens = refill(*row, now, self.rate, self.burst) if row else self.burst
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                "INSERT INTO rate_limits (client, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (client) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (client, tokens, now)
+            )
+            self._calls += 1
+            if self._calls % self.prune_every == 0:
+                # Seaux pleins depuis longtemps : inutiles
+                conn.execute("DELETE FROM rate_limits WHERE updated_at < ?", (now - self.burst / self.rate,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, 0.0 if allowed else (1 - tokens) / self.rate
+
+
+def create_rate_limiter():
+    """Limiteur configuré, ou None si la limitation est désactivée"""
+    if config.RATE_LIMIT_PER_MINUTE <= 0:
+        return None
+    if config.RATE_LIMIT_DB:
+        return SqliteRateLimiter(config.RATE_LIMIT_DB)
+    return MemoryRateLimiter()
+
+
+class SchedulerFull(Exception):
+    """Trop de requêtes du même client attendent déjà un créneau de génération"""
+
+
+class FairScheduler:
+    """Créneaux de génération partagés à tour de rôle entre les clients en attente"""
+
+    def __init__(self, concurrency: int = config.GENERATION_CONCURRENCY,
+                 max_queued_per_client: int = config.GENERATION_MAX_QUEUED):
+        self.concurrency = max(1, concurrency)
+        self.max_queued_per_client = max_queued_per_client
+        self.active = 0
+        # Client -> futures en attente (ordre d'arrivée) ; l'ordre des clients est le tour de rôle
+        self.waiting: "OrderedDict[str, deque]" = OrderedDict()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": sum(len(queue) for queue in self.waiting.values()),
+            "waiting_clients": len(self.waiting),
+        }
+
+    @asynccontextmanager
+    async def slot(self, client: str):
+        await self._acquire(client)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, client: str):
+        if self.active < self.concurrency and not self.waiting:
+            self.active += 1
+            return
+        queue = self.waiting.get(client)
+        if queue is not None and len(queue) >= self.max_queued_per_client:
+            rate_limited.inc(reason="queue")
+            raise SchedulerFull(client)
+
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self.waiting[client] = deque()
+        queue.append(future)
+        try:
+            # Attente visible dans Server-Timing et l'histogramme des étapes
+            with metrics.span("generation_queue"):
+                await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Créneau attribué juste avant l'annulation : il passe au suivant
+                self._release()
+            elif future in queue:
+                queue.remove(future)
+                if not queue and self.waiting.get(client) is queue:
+                    del self.waiting[client]
+            raise
+
+    def _release(self):
+        # Le créneau libéré va au premier client du tour, qui passe ensuite en fin de tour
+        while self.waiting:
+            client, queue = next(iter(self.waiting.items()))
+            future = queue.popleft()
+            if queue:
+                self.waiting.move_to_end(client)
+            else:
+                del self.waiting[client]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
@@ -0,0 +1,64 @@
+"""
+Reclassement des passages candidats par un cross-encoder, sous budget de latence
+"""
+
+import time
+from typing import List, Tuple
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str, budget_ms: float = 150, batch_size: int = 8):
+        # Import paresseux : sentence_transformers n'est chargé qu'avec le reranker
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, max_length=256)
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+
+    def rerank(self, query: str, candidates: List[dict], top_k: int) -> Tuple[List[dict], dict]:
+        """Reclasse les candidats par pertinence croisée (requête, passage).
+
+        Les passages sont scorés par lots ; si le budget est dépassé, ou si le lot
+        suivant risque de le dépasser, on abandonne et on conserve l'ordre du
+        bi-encoder. Retourne (top_k passages, statistiques).
+        """
+        start = time.perf_counter()
+        scores = []
+        for offset in range(0, len(candidates), self.batch_size):
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if offset:
+                per_batch_ms = elapsed_ms / (offset / self.batch_size)
+                if elapsed_ms + per_batch_ms > self.budget_ms:
+                    return self._fallback(candidates, top_k, offset, elapsed_ms)
+
+            batch = candidates[offset:offset + self.batch_size]
+            scores.extend(self.model.predict(
+                [(query, item['content']) for item in batch],
+                show_progress_bar=False
+            ))
+            # Lot plus lent que prévu (premier lot, machine chargée) : scores incomplets
+            # ou obtenus hors budget, l'ordre du bi-encoder est conservé
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms > self.budget_ms:
+                return self._fallback(candidates, top_k, offset + len(batch), elapsed_ms)
+
+        order = sorted(range(len(candidates)), key=lambda i: float(scores[i]), reverse=True)
+        reranked = []
+        for i in order[:top_k]:
+            reranked.append({**candidates[i], 'rerank_score': float(scores[i])})
+
+        return reranked, {
+            "reranked": True,
+            "budget_exceeded": False,
+            "scored": len(candidates),
+            "rerank_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+
+    @staticmethod
+    def _fallback(candidates: List[dict], top_k: int, scored: int, elapsed_ms: float) -> Tuple[List[dict], dict]:
+        return candidates[:top_k], {
+            "reranked": False,
+            "budget_exceeded": True,
+            "scored": scored,
+            "rerank_ms": round(elapsed_ms, 2)
+        }
@@ -0,0 +1,151 @@
+"""
+Processus de recherche servant un shard de l'index (voir backend.sharding)
+
+    python -m backend.shard_server --shard 0 --shards 3 --port 8101
+
+Le processus charge (ou construit) l'index de sa seule partition du corpus,
+avec son propre modèle d'embeddings, et répond en JSON :
+
+- POST /search {"query", "top_k", "filters"} : recherche hybride sur la partition,
+  avec les candidats des deux classements et leurs scores (refusion) ;
+- POST /passages {"hashes"} : passages désignés par leur hash de contenu ;
+- GET /health : partition servie et nombre de passages.
+
+Le coordinateur est une instance de l'API avec YOLSDA_SHARD_URLS
+(par exemple http://127.0.0.1:8101,http://127.0.0.1:8102,http://127.0.0.1:8103).
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import config
+from .main import AIAssistant, DataProcessor
+from .metadata_index import METADATA_FIELDS
+
+
+class ShardHandler(BaseHTTPRequestHandler):
+    # Connexions persistantes : le coordinateur réutilise une connexion par thread
+    protocol_version = "HTTP/1.1"
+    # En-têtes et corps sont écrits séparément : sans TCP_NODELAY, Nagle et l'ACK
+    # différé du client ajoutent ~40 ms à chaque réponse
+    disable_nagle_algorithm = True
+    assistant: AIAssistant = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_json(404, {"detail": "Introuvable"})
+            return
+        shard, num_shards = self.assistant.shard
+        self.send_json(200, {
+            "shard": shard,
+            "shards": num_shards,
+            "documents": len(self.assistant.data_processor),
+        })
+
+    def do_POST(self):
+        if self.path == "/passages":
+            self.send_passages()
+            return
+        if self.path != "/search":
+            self.send_json(404, {"detail": "Introuvable"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            query = request["query"]
+            top_k = int(request.get("top_k", config.RETRIEVAL_TOP_K))
+            filters = request.get("filters") or None
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"detail": f"Requête invalide: {e}"})
+            return
+        unknown_filters = set(filters or {}) - set(METADATA_FIELDS)
+        if unknown_filters:
+            self.send_json(400, {"detail": f"Filtres inconnus: {', '.join(sorted(unknown_filters))}"})
+            return
+
+        # Instantané : un rechargement concurrent ne l'affecte pas
+        data_processor = self.assistant.data_processor
+        start = time.perf_counter()
+        results, candidates = data_processor.search_candidates(query, top_k=top_k, filters=filters)
+        self.send_json(200, {
+            "shard": self.assistant.shard[0],
+            "documents": len(data_processor),
+            "collection_documents": data_processor.collection_size(),
+            "results": results,
+            "candidates": candidates,
+            "search_ms": round((time.perf_counter() - start) * 1000, 2),
+        })
+
+    def send_passages(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            hashes = [str(h) for h in request["hashes"]]
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"detail": f"Requête invalide: {e}"})
+            return
+        self.send_json(200, {"results": self.assistant.data_processor.passages(hashes)})
+
+
+def watch_data_folder(assistant: AIAssistant, interval: int):
+    """Recharge la partition quand le corpus change (thread d'arrière-plan)"""
+    while True:
+        time.sleep(interval)
+        fingerprint = DataProcessor.corpus_fingerprint(assistant.data_dir)
+        if fingerprint == assistant.corpus_fingerprint:
+            continue
+        print("Modification du corpus détectée")
+        try:
+            assistant.data_processor = assistant.load_knowledge_base(assistant.data_processor)
+            assistant.corpus_fingerprint = fingerprint
+        except Exception as e:
+            print(f"Erreur lors du rechargement: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Processus de shard de l'index Yolsda")
+    parser.add_argument("--shard", type=int, required=True, help="numéro du shard (à partir de 0)")
+    parser.add_argument("--shards", type=int, required=True, help="nombre total de shards")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--data-dir", default=config.DATA_DIR)
+    parser.add_argument("--index-dir", default=config.INDEX_DIR)
+    args = parser.parse_args()
+    if not 0 <= args.shard < args.shards:
+        parser.error("--shard doit être compris entre 0 et --shards - 1")
+
+    assistant = AIAssistant(config.OLLAMA_MODEL, data_dir=args.data_dir, index_dir=args.index_dir,
+                            shard=(args.shard, args.shards))
+    # Premier encodage hors requête (initialisation paresseuse du modèle)
+    assistant.data_processor.find_similar_content("création d'entreprise")
+    ShardHandler.assistant = assistant
+    if config.RELOAD_WATCH_INTERVAL > 0:
+        threading.Thread(target=watch_data_folder, args=(assistant, config.RELOAD_WATCH_INTERVAL),
+                         daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), ShardHandler)
+    server.daemon_threads = True
+    print(f"Shard {args.shard}/{args.shards} prêt sur {args.host}:{args.port} "
+          f"({len(assistant.data_processor)} éléments)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Index vectoriel réparti en shards (scatter-gather)
+
+Le corpus est partitionné par hash de contenu : le shard i sur n détient les
+passages dont `shard_of(content_hash, n) == i`. Chaque shard est servi par un
+processus de recherche (backend.shard_server) qui applique la recherche hybride
+complète sur sa partition. Le coordinateur interroge tous les shards en
+parallèle, attend au plus `timeout_ms`, puis fusionne les top-k obtenus ; un
+shard lent ou en panne ne fait pas échouer la requête (résultat partiel signalé
+dans les statistiques).
+
+Le score RRF d'un shard dépend des rangs dans sa seule partition : il n'est pas
+comparable d'un shard à l'autre. Chaque shard renvoie donc aussi les candidats
+de ses deux classements, avec leur similarité (même modèle d'embeddings
+partout) et leur score BM25 (calculé avec les statistiques du corpus entier) ;
+le coordinateur reconstitue les classements globaux et leur applique la même
+fusion que l'index unique (lexical_index.hybrid_fusion). Les passages retenus
+absents des top-k des shards sont demandés ensuite (POST /passages).
+"""
+
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from . import config, metrics
+from .lexical_index import hybrid_fusion, reciprocal_rank_fusion
+
+shard_requests = metrics.registry.histogram(
+    "yolsda_shard_request_seconds", "Durée d'une recherche sur un shard", labelnames=("shard",)
+)
+shard_failures = metrics.registry.counter(
+    "yolsda_shard_failures_total", "Shards sans réponse exploitable", labelnames=("shard", "reason")
+)
+
+
+def shard_of(content_hash: str, num_shards: int) -> int:
+    """Shard d'un passage (content_hash est un SHA-1 hexadécimal, donc uniformément réparti)"""
+    return int(content_hash[:8], 16) % num_shards
+
+
+def fuse_candidates(candidates: List[dict], collection_documents: int, top_k: int) -> List[Tuple[str, float]]:
+    """Classement global à partir des candidats de tous les shards, comme l'index unique
+    (voir DataProcessor._rank_batch) ; retourne les (hash de contenu, score RRF) retenus"""
+    by_hash = {}
+    for candidate in candidates:
+        # Les partitions sont disjointes ; la déduplication ne protège que d'une erreur de configuration
+        by_hash.setdefault(candidate["content_hash"], candidate)
+
+    lexical = [c for c in by_hash.values() if c["lexical_score"] is not None]
+    lexical.sort(key=lambda c: c["lexical_score"], reverse=True)
+    lexical_ranking = [c["content_hash"] for c in lexical[:config.LEXICAL_CANDIDATES]]
+    if collection_documents >= config.LEXICAL_PREFILTER_MIN_DOCS and len(lexical_ranking) >= top_k:
+        # Pré-filtre lexical : seuls les candidats BM25 globaux sont classés par similarité
+        pool = [by_hash[h] for h in lexical_ranking]
+    else:
+        pool = [c for c in by_hash.values() if c["dense"]]
+    pool.sort(key=lambda c: c["similarity"], reverse=True)
+    dense_ranking = [c["content_hash"] for c in pool[:config.DENSE_CANDIDATES]]
+    return hybrid_fusion(dense_ranking, lexical_ranking, lambda h: by_hash[h]["similarity"], top_k, config.RRF_K)
+
+
+def merge_results(results: List[dict], top_k: int, rrf_k: int = config.RRF_K) -> List[dict]:
+    """Fusion approchée, pour des shards qui ne renvoient pas leurs candidats (version
+    antérieure) : RRF sur les top-k obtenus, classés par similarité et par score BM25"""
+    # Les partitions sont disjointes ; la déduplication ne protège que d'une erreur de configuration
+    unique, seen = [], set()
+    for item in results:
+        if item["content_hash"] not in seen:
+            seen.add(item["content_hash"])
+            unique.append(item)
+
+    dense_ranking = sorted(range(len(unique)), key=lambda i: unique[i]["similarity"], reverse=True)
+    # Shard sans score lexical (ancienne version) : seul le classement dense compte
+    lexical = [i for i in range(len(unique)) if unique[i].get("lexical_score") is not None]
+    lexical_ranking = sorted(lexical, key=lambda i: unique[i]["lexical_score"], reverse=True)
+    fused = reciprocal_rank_fusion([dense_ranking, lexical_ranking], k=rrf_k)
+
+    order = sorted(fused, key=lambda i: (fused[i], unique[i]["similarity"]), reverse=True)
+    return [{**unique[i], "score": fused[i]} for i in order[:top_k]]
+
+
+class ShardError(Exception):
+    pass
+
+
+class ShardClient:
+    """Client RPC (JSON sur HTTP/1.1) d'un shard ; une connexion persistante par thread"""
+
+    def __init__(self, url: str, timeout_s: float):
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout_s = timeout_s
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout_s)
+            self._local.connection = connection
+        return connection
+
+    def call(self, method: str, path: str, payload: Optional[dict] = None) -> dict:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body else {}
+        for attempt in (1, 2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError) as e:
+                # Connexion persistante fermée par le shard (redémarrage) : une seule reprise
+                connection.close()
+                self._local.connection = None
+                if attempt == 2:
+                    raise ShardError(f"{self.url}: {e}") from e
+                continue
+            except OSError:
+                connection.close()
+                self._local.connection = None
+                raise
+            if response.status != 200:
+                raise ShardError(f"{self.url}: HTTP {response.status} {data[:200]!r}")
+            return json.loads(data)
+
+    def search(self, query: str, top_k: int, filters: Optional[dict]) -> dict:
+        return self.call("POST", "/search", {"query": query, "top_k": top_k, "filters": filters})
+
+    def passages(self, content_hashes: List[str]) -> List[dict]:
+        return self.call("POST", "/passages", {"hashes": content_hashes})["results"]
+
+    def health(self) -> dict:
+        return self.call("GET", "/health")
+
+
+class ShardedRetriever:
+    """Coordinateur : remplace DataProcessor dans AIAssistant.retrieve"""
+
+    def __init__(self, urls: List[str], timeout_ms: float = 500, min_shards: int = 1):
+        self.timeout_s = timeout_ms / 1000
+        self.min_shards = min_shards
+        self.clients = [ShardClient(url, self.timeout_s) for url in urls]
+        # Plusieurs requêtes concurrentes, chacune adressée à tous les shards
+        self.executor = ThreadPoolExecutor(max_workers=4 * len(urls), thread_name_prefix="shard")
+        self.documents = {}
+
+    def __len__(self) -> int:
+        return sum(self.documents.values())
+
+    def refresh(self) -> dict:
+        """Interroge /health de chaque shard (nombre de passages, partition servie)"""
+        status = {}
+        for client in self.clients:
+            try:
+                health = client.health()
+                self.documents[client.url] = health.get("documents", 0)
+                status[client.url] = health
+            except Exception as e:
+                status[client.url] = {"error": str(e)}
+        return status
+
+    def _search_shard(self, index: int, query: str, top_k: int, filters: Optional[dict]) -> dict:
+        start = time.perf_counter()
+        try:
+            return self.clients[index].search(query, top_k, filters)
+        finally:
+            shard_requests.observe(time.perf_counter() - start, shard=index)
+
+    def search(self, query: str, top_k: int = 2, filters: Optional[dict] = None) -> Tuple[List[dict], dict]:
+        """Scatter-gather : candidats de chaque shard, refusionnés comme par l'index unique
+        (voir fuse_candidates). Retourne (passages, statistiques de répartition)."""
+        start = time.perf_counter()
+        futures = {
+            self.executor.submit(self._search_shard, i, query, top_k, filters): i
+            for i in range(len(self.clients))
+        }
+        done, not_done = wait(futures, timeout=self.timeout_s)
+
+        responses, failed = {}, {}
+        for future in not_done:
+            # La réponse tardive sera ignorée ; le thread se libère au délai du socket
+            future.cancel()
+            failed[futures[future]] = "timeout"
+        for future in done:
+            index = futures[future]
+            try:
+                response = future.result()
+            except Exception as e:
+                failed[index] = "timeout" if isinstance(e, TimeoutError) else "error"
+                print(f"Shard {self.clients[index].url} en erreur: {e}")
+                continue
+            self.documents[self.clients[index].url] = response.get("documents", 0)
+            responses[index] = response
+        for index, reason in failed.items():
+            shard_failures.inc(shard=index, reason=reason)
+
+        answered = len(self.clients) - len(failed)
+        if answered < self.min_shards:
+            raise ShardError(f"{answered}/{len(self.clients)} shards ont répondu (minimum {self.min_shards})")
+
+        return self._merge(responses, top_k), {
+            "shards": len(self.clients),
+            "shards_answered": answered,
+            "partial": bool(failed),
+            "shard_failures": {self.clients[i].url: reason for i, reason in sorted(failed.items())},
+            "scatter_gather_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    def _merge(self, responses: dict, top_k: int) -> List[dict]:
+        """responses : réponse de chaque shard ayant répondu, par indice de client"""
+        results = [item for index in sorted(responses) for item in responses[index]["results"]]
+        if not all("candidates" in response for response in responses.values()):
+            return merge_results(results, top_k)
+
+        candidates, owners = [], {}
+        for index in sorted(responses):
+            for candidate in responses[index]["candidates"]:
+                candidates.append(candidate)
+                owners.setdefault(candidate["content_hash"], index)
+        collection_documents = max(response["collection_documents"] for response in responses.values())
+        selected = fuse_candidates(candidates, collection_documents, top_k)
+        by_hash = {c["content_hash"]: c for c in reversed(candidates)}
+
+        # Passages retenus hors des top-k de leur shard : second appel, rare
+        passages = {item["content_hash"]: item for item in results}
+        missing = {}
+        for content_hash, _ in selected:
+            if content_hash not in passages:
+                missing.setdefault(owners[content_hash], []).append(content_hash)
+        for shard, hashes in missing.items():
+            try:
+                passages.update((item["content_hash"], item) for item in self.clients[shard].passages(hashes))
+            except Exception as e:
+                shard_failures.inc(shard=shard, reason="error")
+                print(f"Shard {self.clients[shard].url} en erreur (passages): {e}")
+
+        merged = []
+        for content_hash, score in selected:
+            passage = passages.get(content_hash)
+            if passage is None:
+                continue
+            candidate = by_hash[content_hash]
+            merged.append({
+                "content": passage["content"],
+                "source": passage["source"],
+                "similarity": candidate["similarity"],
+                "score": score,
+                "lexical_score": candidate["lexical_score"],
+                "content_hash": content_hash,
+            })
+        return merged
+
+    def find_similar_content(self, query: str, top_k: int = 2, filters: Optional[dict] = None) -> List[dict]:
+        return self.search(query, top_k, filters)[0]
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
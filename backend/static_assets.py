@@ -0,0 +1,70 @@
+"""
+Fichiers statiques à nom contenant leur empreinte, mis en cache sans limite par les navigateurs
+
+Au démarrage, chaque fichier de static/ reçoit une URL versionnée
+(/static/js/history.3f2a9c1b.js) ; les pages HTML sont réécrites pour y
+faire référence. Une URL versionnée ne change jamais de contenu : elle est
+servie avec « Cache-Control: immutable ». Les URL non versionnées restent
+servies, avec revalidation (ETag).
+"""
+
+import hashlib
+import os
+import re
+
+from fastapi.staticfiles import StaticFiles
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+class AssetManifest:
+    def __init__(self, directory: str, url_prefix: str = "/static"):
+        self.directory = directory
+        self.url_prefix = url_prefix.rstrip("/")
+        # chemin relatif -> chemin relatif versionné, et inversement
+        self.hashed = {}
+        self.original = {}
+        self.scan()
+
+    @staticmethod
+    def file_hash(path: str) -> str:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(65536), b""):
+                digest.update(block)
+        return digest.hexdigest()[:10]
+
+    def scan(self):
+        hashed, original = {}, {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                stem, ext = os.path.splitext(relative)
+                versioned = f"{stem}.{self.file_hash(path)}{ext}"
+                hashed[relative] = versioned
+                original[versioned] = relative
+        self.hashed, self.original = hashed, original
+
+    def url(self, relative: str) -> str:
+        return f"{self.url_prefix}/{self.hashed.get(relative, relative)}"
+
+    def rewrite_html(self, html: str) -> str:
+        """Remplace les références /static/... connues par leur URL versionnée"""
+        pattern = re.compile(re.escape(self.url_prefix) + r"/([^\"'?#\s]+)")
+        return pattern.sub(lambda m: self.url(m.group(1)), html)
+
+
+class HashedStaticFiles(StaticFiles):
+    def __init__(self, *args, manifest: AssetManifest, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manifest = manifest
+
+    async def get_response(self, path: str, scope):
+        relative = path.replace(os.sep, "/")
+        original = self.manifest.original.get(relative)
+        response = await super().get_response(original or path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE if original else REVALIDATE
+        return response
@@ -0,0 +1,114 @@
+"""
+File d'écriture différée de l'historique des conversations
+
+Les messages sont mis en file et rendus immédiatement à l'appelant ; une tâche
+de fond les regroupe (quelques millisecondes ou `max_batch` messages) et les
+écrit en une seule transaction SQLite. La file est vidée à l'arrêt du serveur.
+"""
+
+import asyncio
+import time
+from collections import Counter
+from typing import List, Optional
+
+from . import metrics
+
+batch_size = metrics.registry.histogram(
+    "yolsda_db_write_batch_size", "Nombre de messages écrits par transaction",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+write_errors = metrics.registry.counter(
+    "yolsda_db_write_errors_total", "Échecs d'écriture d'un lot de messages"
+)
+
+
+class WriteBehindQueue:
+    def __init__(self, db_manager, flush_interval_ms: float = 5, max_batch: int = 256, max_retries: int = 3):
+        self.db_manager = db_manager
+        self.flush_interval_s = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task = None
+        # Messages en file ou en cours d'écriture, par conversation
+        self.pending = Counter()
+        self._written = asyncio.Condition()
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def save_message(self, conversation_id: str, message: str, response: str, sources: List[str]):
+        """Met le message en file ; il sera écrit avec le prochain lot"""
+        self.pending[conversation_id] += 1
+        self.queue.put_nowait((conversation_id, message, response, sources))
+
+    async def flush(self, conversation_id: Optional[str] = None):
+        """Attend l'écriture des messages en file, de toutes les conversations ou
+        d'une seule (une lecture voit ainsi les écritures qui la précèdent)"""
+        def written() -> bool:
+            return not (self.pending[conversation_id] if conversation_id else self.pending)
+
+        if not written():
+            async with self._written:
+                await self._written.wait_for(written)
+
+    async def close(self):
+        """Vide la file puis arrête la tâche d'écriture"""
+        if self.task is None:
+            return
+        await self.flush()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def _collect(self) -> list:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: list):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                with metrics.span("db_flush"):
+                    await asyncio.to_thread(self.db_manager.save_messages, batch)
+                batch_size.observe(len(batch))
+                return
+            except Exception as e:
+                write_errors.inc()
+                print(f"Écriture de {len(batch)} messages échouée (tentative {attempt}): {e}")
+                await asyncio.sleep(0.05 * attempt)
+        lost = [item[0] for item in batch]
+        if len(batch) > 1:
+            # Un message fautif ne doit pas faire perdre tout le lot : écriture un par un
+            lost = []
+            for item in batch:
+                try:
+                    await asyncio.to_thread(self.db_manager.save_messages, [item])
+                except Exception:
+                    lost.append(item[0])
+        if lost:
+            print(f"{len(lost)} messages abandonnés (conversations: {lost})")
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._write(batch)
+            finally:
+                for conversation_id, *_ in batch:
+                    self.pending[conversation_id] -= 1
+                    if not self.pending[conversation_id]:
+                        del self.pending[conversation_id]
+                async with self._written:
+                    self._written.notify_all()
@@ -0,0 +1,374 @@
+"""
+Benchmark du pipeline RAG : démarrage, construction de l'index, latence et
+qualité de la recherche, réponse de bout en bout avec un faux serveur Ollama,
+évaluation du prompt avec et sans réutilisation (keep_alive, context),
+comparaison des encodeurs PyTorch et ONNX int8 (--compare-encoders).
+
+    python -m benchmarks.bench_retrieval --output bench.json
+    python -m benchmarks.bench_retrieval --baseline bench_precedent.json
+
+Le résultat est un document JSON comparable d'un commit à l'autre.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentiles(values: list) -> dict:
+    """Moyenne et percentiles p50/p95/p99 (en millisecondes)"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 3)
+
+    return {
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": pick(50),
+        "p95": pick(95),
+        "p99": pick(99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss est exprimé en kilo-octets sous Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def load_questions(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_startup(corpus_dir: str, index_dir: str) -> dict:
+    """Phase exécutée dans un processus neuf : import, modèle, base de connaissances"""
+    timings = {}
+    start = time.perf_counter()
+    from backend import main as backend_main
+    timings["import_s"] = round(time.perf_counter() - start, 3)
+
+    phase = time.perf_counter()
+    model = backend_main.load_embedding_model()
+    timings["embedding_model_s"] = round(time.perf_counter() - phase, 3)
+
+    phase = time.perf_counter()
+    assistant = backend_main.AIAssistant(backend_main.config.OLLAMA_MODEL, data_dir=corpus_dir,
+                                         index_dir=index_dir, embedding_model=model)
+    timings["knowledge_base_s"] = round(time.perf_counter() - phase, 3)
+
+    phase = time.perf_counter()
+    assistant.retrieve(assistant.data_processor, "création d'entreprise")
+    timings["first_query_ms"] = round((time.perf_counter() - phase) * 1000, 3)
+
+    timings["total_s"] = round(time.perf_counter() - start, 3)
+    timings["peak_rss_mb"] = peak_rss_mb()
+    timings["documents"] = len(assistant.data_processor.data)
+    return timings
+
+
+def spawn_startup(corpus_dir: str, index_dir: str, env: dict = None) -> dict:
+    """Mesure le démarrage dans un sous-processus (interpréteur froid)"""
+    output = subprocess.check_output(
+        [sys.executable, "-m", "benchmarks.bench_retrieval", "--startup-only",
+         "--corpus-dir", corpus_dir, "--index-dir", index_dir],
+        cwd=REPO_ROOT, env={**os.environ, **(env or {})},
+    )
+    # Le rapport JSON est la dernière ligne (les précédentes sont les journaux du backend)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def evaluate_retrieval(assistant, questions: list, repeats: int) -> dict:
+    """Latences par étape, recall@k et MRR sur le jeu de questions annoté"""
+    data_processor = assistant.data_processor
+    id_by_hash = {}
+    with open(os.path.join(assistant.data_dir, "corpus.json"), "r", encoding="utf-8") as f:
+        for doc in json.load(f):
+            content = data_processor.extract_text_content(doc)
+            id_by_hash[hashlib.sha1(content.encode("utf-8")).hexdigest()] = doc["id"]
+
+    latencies, first_stage, rerank = [], [], []
+    hits_at_k, hits_candidates, reciprocal_ranks = 0, 0, []
+    for question in questions:
+        relevant = set(question["relevant_ids"])
+
+        candidates = data_processor.find_similar_content(
+            question["question"], top_k=assistant.retrieval_candidates())
+        candidate_ids = [id_by_hash.get(item["content_hash"]) for item in candidates]
+        hits_candidates += bool(relevant & set(candidate_ids))
+
+        for _ in range(repeats):
+            start = time.perf_counter()
+            results, stats = assistant.retrieve(data_processor, question["question"])
+            latencies.append((time.perf_counter() - start) * 1000)
+            first_stage.append(stats["first_stage_ms"])
+            if "rerank_ms" in stats:
+                rerank.append(stats["rerank_ms"])
+
+        result_ids = [id_by_hash.get(item["content_hash"]) for item in results]
+        hits_at_k += bool(relevant & set(result_ids))
+        rank = next((i + 1 for i, doc_id in enumerate(result_ids) if doc_id in relevant), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    n = len(questions)
+    return {
+        "questions": n,
+        "top_k": len(results) if questions else 0,
+        "recall_at_k": round(hits_at_k / n, 4),
+        "recall_at_candidates": round(hits_candidates / n, 4),
+        "mrr": round(sum(reciprocal_ranks) / n, 4),
+        "latency_ms": percentiles(latencies),
+        "first_stage_ms": percentiles(first_stage),
+        "rerank_ms": percentiles(rerank),
+    }
+
+
+async def evaluate_end_to_end(assistant, questions: list, stub_options: dict) -> dict:
+    """Réponse complète (recherche + génération) contre le faux serveur Ollama"""
+    from backend.main import OllamaClient
+    from benchmarks.stub_ollama import start_stub_server
+
+    runner, url, stub = await start_stub_server(model=assistant.ollama_client.model, **stub_options)
+    assistant.ollama_client = OllamaClient(base_url=url, model=assistant.ollama_client.model)
+    try:
+        latencies = []
+        for question in questions:
+            start = time.perf_counter()
+            await assistant.generate_response(question["question"])
+            latencies.append((time.perf_counter() - start) * 1000)
+        return {"requests": stub.requests, "latency_ms": percentiles(latencies)}
+    finally:
+        await assistant.close()
+        await runner.cleanup()
+
+
+async def evaluate_prompt_reuse(assistant, questions: list, stub_options: dict, db_path: str,
+                                turns: int = 3, burst_gap_s: float = 1.0) -> dict:
+    """Évaluation du prompt côté Ollama sur des conversations de plusieurs tours
+
+    Les questions sont regroupées en conversations séparées par une pause plus
+    longue que le keep_alive par défaut du faux serveur. Le mode « baseline »
+    n'envoie ni keep_alive ni context ; le mode « reuse » utilise la configuration.
+    """
+    from backend import config
+    from backend.conversation_memory import ConversationMemory
+    from backend.database import DatabaseManager
+    from backend.main import OllamaClient
+    from benchmarks.stub_ollama import start_stub_server
+
+    modes = {
+        "baseline": {"OLLAMA_KEEP_ALIVE": "", "OLLAMA_CONTEXT_TOKENS": 0},
+        "reuse": {"OLLAMA_KEEP_ALIVE": config.OLLAMA_KEEP_ALIVE, "OLLAMA_CONTEXT_TOKENS": config.OLLAMA_CONTEXT_TOKENS},
+    }
+    saved = {name: getattr(config, name) for name in modes["baseline"]}
+    memory = assistant.memory
+    report = {}
+    try:
+        db_manager = DatabaseManager(db_path)
+        assistant.memory = ConversationMemory(db_manager)
+        for mode, settings in modes.items():
+            for name, value in settings.items():
+                setattr(config, name, value)
+            runner, url, stub = await start_stub_server(model=assistant.ollama_client.model,
+                                                        keep_alive_s=burst_gap_s / 2, **stub_options)
+            assistant.ollama_client = OllamaClient(base_url=url, model=assistant.ollama_client.model)
+            try:
+                latencies = []
+                for start_index in range(0, len(questions), turns):
+                    conversation_id = f"bench_{mode}_{start_index}"
+                    for question in questions[start_index:start_index + turns]:
+                        start = time.perf_counter()
+                        result = await assistant.generate_response(question["question"],
+                                                                   conversation_id=conversation_id)
+                        latencies.append((time.perf_counter() - start) * 1000)
+                        # Comme /api/chat : le tour est enregistré puis ajouté au cache
+                        db_manager.save_message(conversation_id, question["question"], result["response"],
+                                                result["sources"])
+                        assistant.memory.append(conversation_id, question["question"], result["response"])
+                    await asyncio.sleep(burst_gap_s)
+                report[mode] = {
+                    "requests": stub.requests,
+                    "model_loads": stub.loads,
+                    "prompt_tokens_evaluated": stub.prompt_tokens_evaluated,
+                    "prompt_eval_ms_per_request": round(stub.prompt_eval_s * 1000 / max(stub.requests, 1), 3),
+                    "latency_ms": percentiles(latencies),
+                }
+            finally:
+                await assistant.close()
+                await runner.cleanup()
+    finally:
+        assistant.memory = memory
+        for name, value in saved.items():
+            setattr(config, name, value)
+
+    baseline_ms = report["baseline"]["prompt_eval_ms_per_request"]
+    if baseline_ms:
+        report["prompt_eval_reduction"] = round(1 - report["reuse"]["prompt_eval_ms_per_request"] / baseline_ms, 4)
+    return report
+
+
+def evaluate_encoders(corpus_texts: list, questions: list, repeats: int, top_k: int = 10) -> dict:
+    """Latence d'encodage et concordance des embeddings : PyTorch fp32 (référence)
+    contre ONNX Runtime int8, sur les mêmes textes"""
+    import numpy as np
+    from backend.encoders import OnnxEncoder, SentenceTransformerEncoder
+
+    queries = [question["question"] for question in questions]
+    report, embeddings = {}, {}
+    for backend, factory in (("torch", SentenceTransformerEncoder), ("onnx", OnnxEncoder)):
+        start = time.perf_counter()
+        try:
+            encoder = factory()
+        except Exception as e:
+            report[backend] = {"error": str(e)}
+            continue
+        load_s = time.perf_counter() - start
+        encoder.encode(queries[:1])
+
+        query_latencies = []
+        for _ in range(repeats):
+            for query in queries:
+                start = time.perf_counter()
+                encoder.encode([query])
+                query_latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        corpus_embeddings = encoder.encode(corpus_texts)
+        corpus_s = time.perf_counter() - start
+        embeddings[backend] = (encoder.encode(queries), corpus_embeddings)
+        report[backend] = {
+            "name": encoder.name,
+            "load_s": round(load_s, 3),
+            "query_ms": percentiles(query_latencies),
+            "corpus_docs_per_s": round(len(corpus_texts) / corpus_s, 1) if corpus_s else None,
+        }
+
+    if len(embeddings) == 2:
+        (torch_queries, torch_corpus), (onnx_queries, onnx_corpus) = embeddings["torch"], embeddings["onnx"]
+        cosines = np.concatenate([np.sum(torch_queries * onnx_queries, axis=1),
+                                  np.sum(torch_corpus * onnx_corpus, axis=1)])
+        k = min(top_k, len(corpus_texts))
+        torch_top = np.argsort(-torch_queries @ torch_corpus.T, axis=1)[:, :k]
+        onnx_top = np.argsort(-onnx_queries @ onnx_corpus.T, axis=1)[:, :k]
+        overlap = [len(set(a) & set(b)) / k for a, b in zip(torch_top, onnx_top)]
+        report["agreement"] = {
+            "cosine_mean": round(float(cosines.mean()), 5),
+            "cosine_min": round(float(cosines.min()), 5),
+            f"top{k}_overlap": round(float(np.mean(overlap)), 4),
+            "top1_match": round(float(np.mean(torch_top[:, 0] == onnx_top[:, 0])), 4),
+        }
+        torch_p50, onnx_p50 = report["torch"]["query_ms"]["p50"], report["onnx"]["query_ms"]["p50"]
+        if onnx_p50:
+            report["query_speedup"] = round(torch_p50 / onnx_p50, 2)
+    return report
+
+
+def compare(current: dict, baseline: dict, prefix: str = ""):
+    """Affiche l'écart relatif de chaque mesure numérique par rapport à une référence"""
+    for key, value in current.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(baseline.get(key), dict):
+            compare(value, baseline[key], name + ".")
+        elif isinstance(value, (int, float)) and isinstance(baseline.get(key), (int, float)) and baseline[key]:
+            delta = (value - baseline[key]) / baseline[key] * 100
+            print(f"{name:45s} {baseline[key]:>12} -> {value:<12} ({delta:+.1f}%)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline de recherche Yolsda")
+    parser.add_argument("--corpus-dir", default=FIXTURES_DIR, help="dossier du corpus figé (corpus.json)")
+    parser.add_argument("--questions", default=os.path.join(FIXTURES_DIR, "questions.jsonl"))
+    parser.add_argument("--index-dir", default=None, help="dossier d'index (temporaire par défaut)")
+    parser.add_argument("--repeats", type=int, default=5, help="répétitions par question")
+    parser.add_argument("--stub-tokens-per-sec", type=float, default=200)
+    parser.add_argument("--stub-latency-ms", type=float, default=20)
+    parser.add_argument("--conversation-turns", type=int, default=3, help="tours par conversation (réutilisation du prompt)")
+    parser.add_argument("--burst-gap", type=float, default=1.0, help="pause entre deux conversations (secondes)")
+    parser.add_argument("--compare-encoders", action="store_true",
+                        help="compare les encodeurs torch et onnx (modèle exporté dans YOLSDA_ONNX_MODEL_DIR)")
+    parser.add_argument("--skip-startup", action="store_true", help="ne mesure pas le démarrage à froid/chaud")
+    parser.add_argument("--output", help="fichier JSON de sortie (stdout par défaut)")
+    parser.add_argument("--baseline", help="résultat précédent à comparer")
+    parser.add_argument("--startup-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_only:
+        print(json.dumps(run_startup(args.corpus_dir, args.index_dir)))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="yolsda-bench-") as tmp_dir:
+        index_dir = args.index_dir or os.path.join(tmp_dir, "index")
+        report = {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "corpus_dir": args.corpus_dir,
+        }
+
+        if not args.skip_startup:
+            # À froid : aucun index sur disque ; à chaud : index existant mappé en mémoire
+            cold = spawn_startup(args.corpus_dir, index_dir)
+            warm = spawn_startup(args.corpus_dir, index_dir)
+            report["startup"] = {"cold": cold, "warm": warm}
+            report["index_build_s"] = round(cold["knowledge_base_s"] - warm["knowledge_base_s"], 3)
+            if args.compare_encoders:
+                # Import, chargement et mémoire d'un worker selon l'encodeur (sans reranker,
+                # qui importerait PyTorch dans les deux cas)
+                report["startup"]["encoders"] = {
+                    backend: spawn_startup(args.corpus_dir, os.path.join(tmp_dir, f"index-{backend}"),
+                                           env={"YOLSDA_EMBEDDING_BACKEND": backend, "YOLSDA_RERANKER_MODEL": ""})
+                    for backend in ("torch", "onnx")
+                }
+
+        from backend import main as backend_main
+        assistant = backend_main.AIAssistant(backend_main.config.OLLAMA_MODEL, data_dir=args.corpus_dir,
+                                             index_dir=index_dir)
+        questions = load_questions(args.questions)
+        if args.compare_encoders:
+            data_processor = assistant.data_processor
+            report["encoders"] = evaluate_encoders(
+                [data_processor.text(i) for i in range(len(data_processor))], questions, args.repeats)
+        report["retrieval"] = evaluate_retrieval(assistant, questions, args.repeats)
+        report["end_to_end"] = asyncio.run(evaluate_end_to_end(assistant, questions, {
+            "tokens_per_sec": args.stub_tokens_per_sec,
+            "latency_ms": args.stub_latency_ms,
+        }))
+        report["prompt_reuse"] = asyncio.run(evaluate_prompt_reuse(
+            assistant, questions, {"tokens_per_sec": args.stub_tokens_per_sec, "latency_ms": args.stub_latency_ms},
+            os.path.join(tmp_dir, "bench.db"), args.conversation_turns, args.burst_gap))
+        report["peak_rss_mb"] = peak_rss_mb()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Test de charge de bout en bout de l'API (asyncio + aiohttp)
+
+Des utilisateurs virtuels enchaînent /api/chat, /api/conversations et
+/api/conversations/{id}/history selon un mélange pondéré. Avec --spawn, le
+harnais démarre lui-même un faux serveur Ollama et l'application réelle
+(uvicorn) sur une base SQLite temporaire.
+
+    python -m benchmarks.load_test --spawn --users 20 --duration 60
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --users 5
+
+Rapporte débit, percentiles de latence et taux d'erreur par endpoint, erreurs
+de verrouillage SQLite, ainsi que la latence d'une sonde /ready : une sonde
+lente sous charge signale une boucle d'événements bloquée.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from benchmarks.bench_retrieval import FIXTURES_DIR, REPO_ROOT, load_questions, percentiles
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock_errors = 0
+        self.probe_latencies = []
+
+    def record(self, endpoint: str, status: int, latency_ms: float, body: str = ""):
+        self.latencies[endpoint].append(latency_ms)
+        self.statuses[endpoint][status] += 1
+        if status >= 500 and "locked" in body:
+            self.lock_errors += 1
+
+    def report(self, duration_s: float) -> dict:
+        endpoints = {}
+        total = 0
+        for endpoint, latencies in self.latencies.items():
+            statuses = self.statuses[endpoint]
+            errors = sum(n for status, n in statuses.items() if status >= 400 or status == 0)
+            total += len(latencies)
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "throughput_rps": round(len(latencies) / duration_s, 2),
+                "error_rate": round(errors / len(latencies), 4),
+                "statuses": dict(statuses),
+                "latency_ms": percentiles(latencies),
+            }
+        return {
+            "duration_s": round(duration_s, 2),
+            "requests": total,
+            "throughput_rps": round(total / duration_s, 2),
+            "sqlite_lock_errors": self.lock_errors,
+            "endpoints": endpoints,
+            "event_loop_probe_ms": percentiles(self.probe_latencies),
+        }
+
+
+async def timed_request(session, stats: LoadStats, endpoint: str, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        async with session.request(method, url, **kwargs) as response:
+            body = await response.text()
+            stats.record(endpoint, response.status, (time.perf_counter() - start) * 1000, body)
+            return response.status, body
+    except Exception as e:
+        # status 0 : erreur réseau ou délai dépassé
+        stats.record(endpoint, 0, (time.perf_counter() - start) * 1000, str(e))
+        return 0, ""
+
+
+async def virtual_user(user_id: int, base_url: str, questions: list, mix: dict, deadline: float,
+                       think_time_s: float, stats: LoadStats):
+    rng = random.Random(user_id)
+    conversation_ids = []
+    endpoints, weights = zip(*mix.items())
+    timeout = aiohttp.ClientTimeout(total=120)
+    # Une clé par utilisateur : chacun est un client distinct pour l'ordonnanceur équitable
+    headers = {"X-API-Key": f"load-test-{user_id}"}
+    async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
+        while time.monotonic() < deadline:
+            action = rng.choices(endpoints, weights)[0]
+            if action == "chat" or not conversation_ids:
+                payload = {"message": rng.choice(questions)["question"]}
+                # Une fois sur deux, on poursuit une conversation existante
+                if conversation_ids and rng.random() < 0.5:
+                    payload["conversation_id"] = rng.choice(conversation_ids)
+                status, body = await timed_request(session, stats, "chat", "POST",
+                                                   f"{base_url}/api/chat", json=payload)
+                if status == 200:
+                    conversation_id = json.loads(body)["conversation_id"]
+                    if conversation_id not in conversation_ids:
+                        conversation_ids.append(conversation_id)
+            elif action == "conversations":
+                await timed_request(session, stats, "conversations", "GET", f"{base_url}/api/conversations")
+            else:
+                conversation_id = rng.choice(conversation_ids)
+                await timed_request(session, stats, "history", "GET",
+                                    f"{base_url}/api/conversations/{conversation_id}/history")
+            if think_time_s:
+                await asyncio.sleep(rng.expovariate(1 / think_time_s))
+
+
+async def loop_probe(base_url: str, deadline: float, stats: LoadStats, interval_s: float = 0.1):
+    """Sonde légère à intervalle fixe : sa latence mesure la réactivité du serveur"""
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                async with session.get(f"{base_url}/ready") as response:
+                    await response.read()
+                stats.probe_latencies.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                pass
+            await asyncio.sleep(interval_s)
+
+
+async def wait_ready(base_url: str, timeout_s: float = 300):
+    deadline = time.monotonic() + timeout_s
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/ready") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"{base_url} n'est pas prêt après {timeout_s}s")
+
+
+def spawn_stack(args, tmp_dir: str):
+    """Démarre le faux Ollama puis l'application réelle ; retourne (processus, url de l'API)"""
+    stub_port, app_port = free_port(), free_port()
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_ollama", "--port", str(stub_port),
+         "--tokens-per-sec", str(args.stub_tokens_per_sec), "--latency-ms", str(args.stub_latency_ms),
+         "--max-tokens", str(args.stub_max_tokens)],
+        cwd=REPO_ROOT,
+    )
+    env = dict(os.environ,
+               YOLSDA_OLLAMA_URL=f"http://127.0.0.1:{stub_port}",
+               YOLSDA_DATA_DIR=args.corpus_dir,
+               YOLSDA_INDEX_DIR=os.path.join(tmp_dir, "index"),
+               YOLSDA_DB_PATH=os.path.join(tmp_dir, "chat_history.db"),
+               YOLSDA_RELOAD_WATCH_INTERVAL="0")
+    # Mesure de capacité : pas de limitation de débit, sauf demande explicite
+    env.setdefault("YOLSDA_RATE_LIMIT_PER_MINUTE", "0")
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+         "--port", str(app_port), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL,
+    )
+    return [app, stub], f"http://127.0.0.1:{app_port}"
+
+
+async def run(args, base_url: str) -> dict:
+    await wait_ready(base_url)
+    questions = load_questions(args.questions)
+    mix = {"chat": args.chat_weight, "conversations": args.list_weight, "history": args.history_weight}
+    stats = LoadStats()
+
+    start = time.monotonic()
+    deadline = start + args.duration
+    # Tâches lancées dès leur création : chaque utilisateur démarre à son tour de rampe
+    tasks = [asyncio.create_task(loop_probe(base_url, deadline, stats))]
+    for user_id in range(args.users):
+        tasks.append(asyncio.create_task(
+            virtual_user(user_id, base_url, questions, mix, deadline, args.think_time, stats)))
+        # Montée en charge progressive
+        await asyncio.sleep(args.ramp_up / max(args.users, 1))
+    await asyncio.gather(*tasks)
+    report = stats.report(time.monotonic() - start)
+    report["users"] = args.users
+    report["mix"] = mix
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge de l'API Yolsda")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="API déjà démarrée")
+    parser.add_argument("--spawn", action="store_true", help="démarre le faux Ollama et l'application")
+    parser.add_argument("--users", type=int, default=10, help="utilisateurs virtuels simultanés")
+    parser.add_argument("--duration", type=float, default=30, help="durée du test (secondes)")
+    parser.add_argument("--ramp-up", type=float, default=2, help="durée de montée en charge (secondes)")
+    parser.add_argument("--think-time", type=float, default=0.5, help="pause moyenne entre deux requêtes")
+    parser.add_argument("--chat-weight", type=float, default=0.6)
+    parser.add_argument("--list-weight", type=float, default=0.25)
+    parser.add_argument("--history-weight", type=float, default=0.15)
+    parser.add_argument("--corpus-dir", default=FIXTURES_DIR)
+    parser.add_argument("--questions", default=os.path.join(FIXTURES_DIR, "questions.jsonl"))
+    parser.add_argument("--stub-tokens-per-sec", type=float, default=50)
+    parser.add_argument("--stub-latency-ms", type=float, default=100)
+    parser.add_argument("--stub-max-tokens", type=int, default=60)
+    parser.add_argument("--output", help="fichier JSON de sortie (stdout par défaut)")
+    args = parser.parse_args()
+
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="yolsda-load-") as tmp_dir:
+        base_url = args.url
+        try:
+            if args.spawn:
+                processes, base_url = spawn_stack(args, tmp_dir)
+            report = asyncio.run(run(args, base_url))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
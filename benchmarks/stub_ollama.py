@@ -0,0 +1,184 @@
+"""
+Faux serveur Ollama pour les benchmarks et tests de charge (fonctionne hors ligne)
+
+Simule /api/tags et /api/generate (avec ou sans streaming) : temps de chargement
+du modèle, évaluation du prompt, débit de génération configurables. Les champs
+de statistiques (prompt_eval_count, eval_count, eval_duration...) et le
+`context` renvoyés suivent le format d'Ollama. Un cache KV à un emplacement est
+simulé : seuls les tokens qui prolongent la requête précédente sont évalués.
+
+    python -m benchmarks.stub_ollama --port 11434 --tokens-per-sec 20 --latency-ms 200
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+NS_PER_S = 1_000_000_000
+
+
+class StubOllama:
+    def __init__(self, model: str = "gemma:2b", latency_ms: float = 50, tokens_per_sec: float = 200,
+                 prompt_tokens_per_sec: float = 2000, load_ms: float = 500, max_tokens: int = 60,
+                 keep_alive_s: float = 300):
+        self.model = model
+        self.latency_ms = latency_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.prompt_tokens_per_sec = prompt_tokens_per_sec
+        self.load_ms = load_ms
+        self.max_tokens = max_tokens
+        self.default_keep_alive_s = keep_alive_s
+        self.loaded_until = 0.0
+        # Cache KV simulé : tokens (prompt + réponse) de la dernière requête
+        self.cached_prefix = []
+        self.vocabulary = {}
+        self.requests = 0
+        self.loads = 0
+        self.prompt_tokens_evaluated = 0
+        self.prompt_eval_s = 0.0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/tags", self.tags)
+        app.router.add_post("/api/generate", self.generate)
+        return app
+
+    async def tags(self, request):
+        return web.json_response({"models": [{"name": self.model, "model": self.model}]})
+
+    @staticmethod
+    def parse_keep_alive(value, default: float) -> float:
+        if value is None:
+            return default
+        if isinstance(value, (int, float)):
+            return float(value)
+        units = {"s": 1, "m": 60, "h": 3600}
+        if value and value[-1] in units:
+            return float(value[:-1]) * units[value[-1]]
+        return float(value)
+
+    def tokenize(self, text: str) -> list:
+        return [self.vocabulary.setdefault(word, len(self.vocabulary)) for word in text.split()]
+
+    def evaluate_prompt(self, payload: dict):
+        """Retourne (tokens du prompt, nombre de tokens réellement évalués, durée de chargement en s)"""
+        # Comme Ollama : le context précédent, puis le système et le prompt mis en forme
+        tokens = list(payload.get("context") or [])
+        tokens.extend(self.tokenize(payload.get("system") or ""))
+        tokens.extend(self.tokenize(payload.get("prompt") or ""))
+
+        # Seule la partie qui diffère du préfixe mis en cache est évaluée
+        common = 0
+        for cached, token in zip(self.cached_prefix, tokens):
+            if cached != token:
+                break
+            common += 1
+
+        now = time.monotonic()
+        load_s = 0.0
+        if now > self.loaded_until:
+            load_s = self.load_ms / 1000
+            self.loads += 1
+            common = 0
+        # Le modèle reste chargé pendant la requête ; le délai keep_alive court à partir de sa fin
+        self.loaded_until = float("inf")
+        return tokens, len(tokens) - common, load_s
+
+    def release(self, payload: dict):
+        keep_alive = self.parse_keep_alive(payload.get("keep_alive"), self.default_keep_alive_s)
+        self.loaded_until = time.monotonic() + (keep_alive if keep_alive >= 0 else float("inf"))
+
+    async def generate(self, request):
+        payload = await request.json()
+        self.requests += 1
+        if payload.get("model") != self.model:
+            return web.json_response({"error": f"model '{payload.get('model')}' not found"}, status=404)
+
+        if not payload.get("prompt") and not payload.get("system") and not payload.get("context"):
+            # Prompt vide : Ollama charge seulement le modèle, sans toucher au cache
+            load_s = self.load_ms / 1000 if time.monotonic() > self.loaded_until else 0.0
+            self.loads += bool(load_s)
+            await asyncio.sleep(load_s)
+            self.release(payload)
+            return web.json_response({"model": self.model, "response": "", "done": True,
+                                      "done_reason": "load", "load_duration": int(load_s * NS_PER_S)})
+
+        start = time.perf_counter()
+        prompt_tokens, evaluated, load_s = self.evaluate_prompt(payload)
+        prompt_eval_s = evaluated / self.prompt_tokens_per_sec
+        self.prompt_tokens_evaluated += evaluated
+        self.prompt_eval_s += prompt_eval_s
+        await asyncio.sleep(load_s + prompt_eval_s + self.latency_ms / 1000)
+
+        options = payload.get("options") or {}
+        n_tokens = max(1, min(self.max_tokens, options.get("num_predict", self.max_tokens)))
+        words = [f"mot{i} " for i in range(n_tokens)]
+        context = prompt_tokens + self.tokenize("".join(words))
+        self.cached_prefix = context
+        token_delay = 1 / self.tokens_per_sec
+
+        def final_fields(eval_s: float) -> dict:
+            return {
+                "model": self.model,
+                "done": True,
+                "context": context,
+                "total_duration": int((time.perf_counter() - start) * NS_PER_S),
+                "load_duration": int(load_s * NS_PER_S),
+                "prompt_eval_count": evaluated,
+                "prompt_eval_duration": int(prompt_eval_s * NS_PER_S),
+                "eval_count": n_tokens,
+                "eval_duration": int(eval_s * NS_PER_S),
+            }
+
+        if not payload.get("stream", True):
+            await asyncio.sleep(n_tokens * token_delay)
+            self.release(payload)
+            return web.json_response({"response": "".join(words).strip(), **final_fields(n_tokens * token_delay)})
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        eval_start = time.perf_counter()
+        for word in words:
+            await asyncio.sleep(token_delay)
+            await response.write((json.dumps({"model": self.model, "response": word, "done": False}) + "\n").encode())
+        self.release(payload)
+        final = {"response": "", **final_fields(time.perf_counter() - eval_start)}
+        await response.write((json.dumps(final) + "\n").encode())
+        await response.write_eof()
+        return response
+
+
+async def start_stub_server(host: str = "127.0.0.1", port: int = 0, **options):
+    """Démarre le faux serveur dans la boucle courante ; retourne (runner, url, stub)"""
+    stub = StubOllama(**options)
+    runner = web.AppRunner(stub.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}", stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Faux serveur Ollama")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", default="gemma:2b")
+    parser.add_argument("--latency-ms", type=float, default=50, help="latence fixe avant le premier token")
+    parser.add_argument("--tokens-per-sec", type=float, default=200, help="débit de génération")
+    parser.add_argument("--prompt-tokens-per-sec", type=float, default=2000, help="débit d'évaluation du prompt")
+    parser.add_argument("--load-ms", type=float, default=500, help="temps de chargement du modèle")
+    parser.add_argument("--max-tokens", type=int, default=60, help="nombre maximal de tokens générés")
+    args = parser.parse_args()
+
+    stub = StubOllama(model=args.model, latency_ms=args.latency_ms, tokens_per_sec=args.tokens_per_sec,
+                      prompt_tokens_per_sec=args.prompt_tokens_per_sec, load_ms=args.load_ms,
+                      max_tokens=args.max_tokens)
+    web.run_app(stub.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""
+Configuration gunicorn : gunicorn -c gunicorn.conf.py backend.main:app
+"""
+
+import os
+
+bind = os.getenv("YOLSDA_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 120
+
+# Avec YOLSDA_PRELOAD_MODEL=1, l'application (et le modèle d'embeddings) est
+# importée dans le maître avant le fork : les poids sont partagés entre workers.
+# L'index, lui, est toujours partagé via le fichier embeddings.npy mappé en mémoire.
+preload_app = os.getenv("YOLSDA_PRELOAD_MODEL", "0") == "1"
+
+# Évite les threads de tokenisation créés avant le fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
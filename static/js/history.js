@@ -3,6 +3,7 @@ class HistoryManager {
         this.historyContainer = document.querySelector('.history-container');
         this.currentConversationId = null;
         this.conversations = [];
+        this.conversationsEtag = null;
         this.initializeHistory();
     }
 
@@ -13,8 +14,61 @@ class HistoryManager {
     }
 
     setupHistoryRefresh() {
-        // Rafraîchit l'historique toutes les 30 secondes
-        setInterval(() => this.loadConversations(), 30000);
+        if (!window.EventSource) {
+            // Navigateur sans SSE : rafraîchissement périodique (GET conditionnel)
+            setInterval(() => this.loadConversations(), 30000);
+            return;
+        }
+
+        // Le serveur pousse les modifications ; un onglet inactif ne génère aucune requête
+        const events = new EventSource('/api/conversations/events');
+        // À chaque (re)connexion, des événements ont pu être manqués : GET conditionnel (304 si rien n'a changé)
+        events.onopen = () => this.loadConversations();
+        events.addEventListener('conversation', (e) => this.applyConversationEvent(JSON.parse(e.data)));
+    }
+
+    applyConversationEvent(event) {
+        const index = this.conversations.findIndex(conv => conv.id === event.conversation_id);
+        const conv = this.conversations[index];
+
+        switch (event.type) {
+            case 'created':
+                if (!conv) {
+                    this.conversations.unshift({
+                        id: event.conversation_id,
+                        title: event.title || 'Nouvelle conversation',
+                        snippet: null,
+                        created_at: event.created_at,
+                        updated_at: event.created_at,
+                        message_count: 0,
+                        messages: []
+                    });
+                }
+                break;
+            case 'renamed':
+                if (!conv) return this.loadConversations();
+                conv.title = event.title;
+                conv.updated_at = event.updated_at;
+                break;
+            case 'deleted':
+            case 'archived':
+                if (!conv) return;
+                this.conversations.splice(index, 1);
+                break;
+            case 'message':
+                if (!conv) return this.loadConversations();
+                conv.snippet = event.snippet;
+                conv.updated_at = event.updated_at;
+                conv.message_count = (conv.message_count || 0) + 1;
+                // La conversation active remonte en tête de liste
+                this.conversations.splice(index, 1);
+                this.conversations.unshift(conv);
+                break;
+            default:
+                // resync : écriture d'un autre processus serveur
+                return this.loadConversations();
+        }
+        this.displayConversations(this.conversations);
     }
 
     setupKeyboardShortcuts() {
@@ -29,11 +83,16 @@ class HistoryManager {
 
     async loadConversations() {
         try {
-            const response = await fetch('/api/conversations');
+            const headers = this.conversationsEtag ? { 'If-None-Match': this.conversationsEtag } : {};
+            const response = await fetch('/api/conversations', { headers, cache: 'no-store' });
+            if (response.status === 304) {
+                return;
+            }
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             this.conversations = await response.json();
+            this.conversationsEtag = response.headers.get('ETag');
             this.displayConversations(this.conversations);
         } catch (error) {
             console.error('Erreur lors du chargement des conversations:', error);
@@ -297,30 +356,18 @@ class HistoryManager {
         const searchInput = dialog.querySelector('.search-input');
         const searchResults = dialog.querySelector('.search-results');
         
+        let searchTimer = null;
         searchInput.addEventListener('input', (e) => {
-            const query = e.target.value.toLowerCase();
+            const query = e.target.value.trim();
+            clearTimeout(searchTimer);
             
             if (query.length < 2) {
                 searchResults.innerHTML = '<p class="search-hint">Tapez au moins 2 caractères</p>';
                 return;
             }
 
-            const filtered = this.conversations.filter(conv => {
-                const title = this.generateTitle(conv).toLowerCase();
-                return title.includes(query);
-            });
-
-            if (filtered.length === 0) {
-                searchResults.innerHTML = '<p class="no-results">Aucun résultat trouvé</p>';
-            } else {
-                searchResults.innerHTML = filtered.map(conv => `
-                    <div class="search-result-item" 
-                         onclick="historyManager.loadConversation('${conv.id}'); document.querySelector('.search-dialog').close();">
-                        <strong>${this.escapeHtml(this.generateTitle(conv))}</strong>
-                        <small>${new Date(conv.updated_at).toLocaleDateString()}</small>
-                    </div>
-                `).join('');
-            }
+            // Recherche plein texte côté serveur, déclenchée après une courte pause de frappe
+            searchTimer = setTimeout(() => this.searchHistory(query, searchResults), 250);
         });
 
         dialog.querySelector('.close-dialog').onclick = () => {
@@ -332,6 +379,44 @@ class HistoryManager {
         dialog.showModal();
     }
 
+    async searchHistory(query, searchResults, offset = 0) {
+        try {
+            const params = new URLSearchParams({ q: query, limit: 20, offset });
+            const response = await fetch(`/api/conversations/search?${params}`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const data = await response.json();
+
+            if (data.results.length === 0 && offset === 0) {
+                searchResults.innerHTML = '<p class="no-results">Aucun résultat trouvé</p>';
+                return;
+            }
+
+            // Les extraits sont déjà échappés par le serveur, seuls les <mark> sont du HTML
+            const items = data.results.map(result => `
+                <div class="search-result-item" 
+                     onclick="historyManager.loadConversation('${this.escapeHtml(result.conversation_id)}'); document.querySelector('.search-dialog').close();">
+                    <strong>${this.escapeHtml(result.title)}</strong>
+                    <small>${new Date(result.created_at).toLocaleDateString()}</small>
+                    <p class="search-result-question">${result.message}</p>
+                    <p class="search-result-answer">${result.response}</p>
+                </div>
+            `).join('');
+
+            searchResults.querySelector('.search-more')?.remove();
+            searchResults.innerHTML = (offset === 0 ? '' : searchResults.innerHTML) + items;
+            if (data.has_more) {
+                const more = document.createElement('button');
+                more.className = 'search-more';
+                more.textContent = 'Plus de résultats';
+                more.onclick = () => this.searchHistory(query, searchResults, offset + data.limit);
+                searchResults.appendChild(more);
+            }
+        } catch (error) {
+            console.error('Erreur lors de la recherche:', error);
+            searchResults.innerHTML = '<p class="no-results">Recherche indisponible</p>';
+        }
+    }
+
     async saveMessage(message, response, sources = []) {
         if (!this.currentConversationId) {
             // Créer une nouvelle conversation automatiquement
@@ -0,0 +1,70 @@
+"""
+Rétention de l'historique : archivage, relecture, reprise d'une conversation archivée
+et compaction de la base
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+
+from backend.archive import run_maintenance
+from backend.database import DatabaseManager
+
+
+def make_history(tmp_path):
+    db_manager = DatabaseManager(str(tmp_path / "history.db"), archive_dir=str(tmp_path / "archives"))
+    # Réponses volumineuses : leur suppression libère des pages
+    db_manager.save_messages([
+        (conversation_id, f"Question {i} de {conversation_id}", f"Réponse {i} " + "x" * 4000, ["fiche.pdf", "site"])
+        for conversation_id in ("ancienne-1", "ancienne-2", "recente")
+        for i in range(10)
+    ])
+    conn = sqlite3.connect(db_manager.db_path)
+    conn.execute("UPDATE conversations SET updated_at = '2020-01-01 00:00:00' WHERE conversation_id LIKE 'ancienne-%'")
+    conn.commit()
+    conn.close()
+    return db_manager
+
+
+def test_archive_read_back_and_vacuum(tmp_path):
+    db_manager = make_history(tmp_path)
+    before = db_manager.get_conversation("ancienne-1")
+
+    stats = run_maintenance(db_manager, retention_days=90, batch_size=1, vacuum_pages=0)
+
+    assert stats["archived"] == 2
+    assert stats["incremental_vacuum"] and stats["freed_pages"] > 0
+    assert db_manager.count_messages("ancienne-1") == 0
+    archives = db_manager.archive.files()
+    assert len(archives) == 2
+    # Fichiers lisibles par les outils gzip habituels
+    with gzip.open(db_manager.archive.path(archives[0]), "rt", encoding="utf-8") as f:
+        assert len([json.loads(line) for line in f]) == 1
+
+    after = db_manager.get_conversation("ancienne-1")
+    assert after.pop("archived") is True
+    assert after["messages"] == before["messages"]
+    history = db_manager.get_conversation_history("ancienne-1", limit=3)
+    assert [h["message"] for h in history] == [f"Question {i} de ancienne-1" for i in (9, 8, 7)]
+    assert history[0]["sources"] == ["fiche.pdf", "site"]
+    assert db_manager.get_conversation("recente").get("archived") is None
+
+
+def test_resumed_and_deleted_conversations_leave_the_archive(tmp_path):
+    db_manager = make_history(tmp_path)
+    assert db_manager.archive_conversations(90) == 2
+    [archive_file] = db_manager.archive.files()
+
+    # Nouvelle question : la conversation revient dans la base, et son texte quitte l'archive
+    db_manager.save_message("ancienne-1", "Et ensuite ?", "Voici la suite.", [])
+    assert db_manager.count_messages("ancienne-1") == 11
+    assert not os.path.exists(db_manager.archive.path(archive_file))
+    [archive_file] = db_manager.archive.files()
+    with gzip.open(db_manager.archive.path(archive_file), "rt", encoding="utf-8") as f:
+        assert [json.loads(line)["conversation_id"] for line in f] == ["ancienne-2"]
+    assert db_manager.get_conversation("ancienne-2")["archived"] is True
+
+    db_manager.delete_conversation("ancienne-2")
+    assert db_manager.get_conversation("ancienne-2") == {}
+    assert db_manager.archive.files() == []
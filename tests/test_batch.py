@@ -0,0 +1,146 @@
+"""
+Lots de questions : reprise sur le fichier de résultats (ligne tronquée, erreurs,
+question, filtres ou corpus modifiés) et verrouillage du lot
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from backend.batch import BatchBusy, open_output, parse_questions, run_batch
+from backend.rate_limit import SchedulerFull
+
+
+class StubBackend:
+    base_url = "http://ollama.test"
+
+
+class StubAssistant:
+    """Assistant en mémoire : recherche et génération instantanées, questions générées relevées"""
+
+    def __init__(self, version="v1", failures=None):
+        self.version = version
+        self.failures = failures or {}
+        self.generated = []
+        self.data_processor = object()
+        self.ollama_client = StubBackend()
+
+    def corpus_version(self):
+        return self.version
+
+    def retrieve_batch(self, data_processor, queries, filters=None):
+        return [([{"source": "fiche.pdf", "content": query}], {"candidates": 1}) for query in queries]
+
+    @staticmethod
+    def prompt_context(similar_content):
+        return "\n".join(content["content"] for content in similar_content)
+
+    async def generate(self, client, question, context, raise_errors=False):
+        failure = self.failures.get(question)
+        if failure:
+            raise failure
+        self.generated.append(question)
+        return f"Réponse à {question}", None
+
+
+def questions(*items):
+    return parse_questions(json.dumps(item) for item in items)
+
+
+ITEMS = [
+    {"id": "1", "question": "Comment créer une entreprise ?"},
+    {"id": "2", "question": "Quels impôts payer ?", "filters": {"category": "fiscalite"}},
+    {"id": "3", "question": "Où trouver un financement ?"},
+]
+
+
+def run(assistant, items, path):
+    async def collect():
+        output = open_output(str(path))
+        try:
+            return [result async for result in run_batch(assistant, items, [assistant.ollama_client],
+                                                         concurrency=1, output=output, client="batch")]
+        finally:
+            output.close()
+    return asyncio.run(collect())
+
+
+def read_lines(path):
+    return path.read_text(encoding="utf-8").splitlines()
+
+
+def test_resume_redoes_truncated_last_line(tmp_path):
+    path = tmp_path / "reponses.jsonl"
+    run(StubAssistant(), questions(*ITEMS), path)
+    # Arrêt brutal pendant l'écriture du dernier résultat
+    lines = read_lines(path)
+    path.write_text("\n".join(lines[:2]) + "\n" + lines[2][:20], encoding="utf-8")
+    truncated_id = json.loads(lines[2])["id"]
+
+    assistant = StubAssistant()
+    results = run(assistant, questions(*ITEMS), path)
+
+    assert sorted(r["id"] for r in results if r.get("resumed")) == sorted({"1", "2", "3"} - {truncated_id})
+    assert [r["id"] for r in results if not r.get("resumed")] == [truncated_id]
+    assert len(assistant.generated) == 1
+    # Le résultat refait commence sur sa propre ligne
+    lines = read_lines(path)
+    assert json.loads(lines[-1])["id"] == truncated_id
+    assert sum(1 for line in lines if line.startswith("{") and line.endswith("}")) == 3
+
+
+def test_resume_redoes_errors(tmp_path):
+    path = tmp_path / "reponses.jsonl"
+    failing = StubAssistant(failures={"Quels impôts payer ?": RuntimeError("model runner has unexpectedly stopped")})
+    results = run(failing, questions(*ITEMS), path)
+    assert [r["error"] for r in results if r.get("error")] == ["model runner has unexpectedly stopped"]
+
+    assistant = StubAssistant()
+    results = run(assistant, questions(*ITEMS), path)
+
+    assert assistant.generated == ["Quels impôts payer ?"]
+    assert not any(r.get("error") for r in results)
+
+
+@pytest.mark.parametrize("change", ["question", "filters", "corpus_version"])
+def test_resume_regenerates_changed_answers(tmp_path, change):
+    path = tmp_path / "reponses.jsonl"
+    run(StubAssistant(), questions(*ITEMS), path)
+
+    items, version = [dict(item) for item in ITEMS], "v1"
+    if change == "question":
+        items[0]["question"] = "Comment créer une SARL ?"
+    elif change == "filters":
+        items[0]["filters"] = {"category": "creation_entreprise"}
+    else:
+        version = "v2"
+    assistant = StubAssistant(version=version)
+    results = run(assistant, questions(*items), path)
+
+    regenerated = {r["id"] for r in results if not r.get("resumed")}
+    assert regenerated == ({"1", "2", "3"} if change == "corpus_version" else {"1"})
+    assert len(assistant.generated) == len(regenerated)
+    assert {r["corpus_version"] for r in results} == {version}
+
+
+def test_locked_batch_is_busy(tmp_path):
+    path = str(tmp_path / "reponses.jsonl")
+    output = open_output(path)
+    try:
+        with pytest.raises(BatchBusy):
+            open_output(path)
+    finally:
+        output.close()
+    # Verrou libéré à la fermeture
+    open_output(path).close()
+
+
+def test_full_scheduler_error_is_readable(tmp_path):
+    path = tmp_path / "reponses.jsonl"
+    assistant = StubAssistant(failures={"Quels impôts payer ?": SchedulerFull("key:0123456789abcdef")})
+
+    results = run(assistant, questions(*ITEMS), path)
+
+    error = next(r["error"] for r in results if r.get("error"))
+    assert "key:" not in error and "attente" in error
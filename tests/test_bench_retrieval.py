@@ -0,0 +1,78 @@
+"""
+Outils du benchmark : percentiles, faux serveur Ollama (cache KV, keep_alive)
+et mesure de la qualité de recherche sur le corpus figé
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+
+import aiohttp
+import numpy as np
+
+from backend import config, main
+from benchmarks.bench_retrieval import FIXTURES_DIR, evaluate_retrieval, load_questions, percentiles
+from benchmarks.stub_ollama import start_stub_server
+
+
+def test_percentiles():
+    report = percentiles([float(v) for v in range(1, 101)])
+
+    assert report == {"mean": 50.5, "p50": 51.0, "p95": 95.0, "p99": 99.0, "max": 100.0}
+    assert percentiles([]) == {}
+
+
+def test_stub_reuses_cached_prefix_and_honours_keep_alive():
+    async def run():
+        runner, url, stub = await start_stub_server(latency_ms=0, tokens_per_sec=10000, load_ms=1, max_tokens=5)
+        try:
+            async with aiohttp.ClientSession() as session:
+                async def generate(**payload):
+                    async with session.post(f"{url}/api/generate",
+                                            json={"model": stub.model, "stream": False, **payload}) as response:
+                        return await response.json()
+
+                first = await generate(system="Tu es un assistant.", prompt="Comment créer une entreprise ?")
+                # Suite de la conversation : seuls les nouveaux tokens sont évalués
+                second = await generate(prompt="Et les impôts ?", context=first["context"], keep_alive=0)
+                # keep_alive=0 : le modèle est déchargé, tout est réévalué
+                third = await generate(prompt="Et les impôts ?", context=first["context"])
+            return first, second, third, stub
+        finally:
+            await runner.cleanup()
+
+    first, second, third, stub = asyncio.run(run())
+
+    assert first["prompt_eval_count"] == 9 and first["eval_count"] == 5
+    assert first["load_duration"] > 0 and second["load_duration"] == 0
+    assert second["prompt_eval_count"] == 4
+    assert third["load_duration"] > 0 and third["prompt_eval_count"] == len(first["context"]) + 4
+    assert stub.loads == 2 and stub.requests == 3
+
+
+class HashingEncoder:
+    name = "hashing:test"
+
+    def encode(self, texts, show_progress_bar=False):
+        vectors = np.zeros((len(texts), 256), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % 256] += 1
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+def test_evaluate_retrieval_on_fixtures(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RERANKER_MODEL", "")
+    assistant = main.AIAssistant(data_dir=FIXTURES_DIR, index_dir=str(tmp_path / "index"),
+                                 embedding_model=HashingEncoder(), shard_urls=[])
+    questions = load_questions(os.path.join(FIXTURES_DIR, "questions.jsonl"))
+
+    report = evaluate_retrieval(assistant, questions, repeats=1)
+
+    assert report["questions"] == len(questions) == 25
+    # Les passages retrouvés sont rattachés aux documents annotés par leur hash de contenu
+    assert 0 < report["recall_at_k"] <= report["recall_at_candidates"] <= 1
+    assert 0 < report["mrr"] <= report["recall_at_k"]
+    assert report["latency_ms"]["p50"] > 0
@@ -0,0 +1,51 @@
+"""
+Stockage compressé des passages : relecture exacte, y compris aux limites des blocs
+"""
+
+import random
+
+import pytest
+
+from backend.block_store import BlockStore, write_block_store, zstandard
+
+CODECS = ["zlib", pytest.param("zstd", marks=pytest.mark.skipif(zstandard is None, reason="zstandard absent"))]
+
+
+def sample_texts():
+    rng = random.Random(3)
+    words = ["CEFORE", "IUTS", "entreprise", "Ouagadougou", "crédit", "l'État", "ﬁnancement", "€", "🇧🇫"]
+    texts = [" ".join(rng.choices(words, k=rng.randint(1, 12))) for _ in range(200)]
+    # Passage vide, passage plus grand qu'un bloc, passage remplissant exactement un bloc
+    texts[10] = ""
+    texts[50] = "é" * 300
+    texts[120] = "x" * 128
+    return texts
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_round_trip_across_block_boundaries(tmp_path, codec):
+    texts = sample_texts()
+
+    header = write_block_store(str(tmp_path), texts, block_size=128, codec=codec)
+    store = BlockStore(str(tmp_path), cache_blocks=2)
+
+    assert header["count"] == len(store) == len(texts)
+    assert header["blocks"] > 10
+    assert header["raw_bytes"] == sum(len(t.encode("utf-8")) for t in texts)
+    # Accès dans le désordre : le cache de deux blocs est sans cesse renouvelé
+    order = list(range(len(texts)))
+    random.Random(5).shuffle(order)
+    assert [store.get(i) for i in order] == [texts[i] for i in order]
+    assert list(store) == texts
+    assert store.get_many([199, 0, 50]) == [texts[199], texts[0], texts[50]]
+    # Un passage n'est jamais coupé entre deux blocs
+    blocks = store.text_blocks
+    assert all(blocks[i] <= blocks[i + 1] <= blocks[i] + 1 for i in range(len(texts) - 1))
+
+
+def test_empty_store(tmp_path):
+    header = write_block_store(str(tmp_path), [], codec="zlib")
+    store = BlockStore(str(tmp_path))
+
+    assert header["blocks"] == 0
+    assert len(store) == 0 and list(store) == []
@@ -0,0 +1,56 @@
+"""
+/api/chat : une nouvelle conversation reçoit un identifiant propre
+"""
+
+import asyncio
+
+from starlette.requests import Request
+
+from backend import main
+
+
+class FakeAssistant:
+    memory = None
+
+    def __init__(self):
+        self.conversations = []
+
+    async def generate_response(self, query, filters=None, conversation_id=None, client=None):
+        self.conversations.append(conversation_id)
+        return {"response": "Réponse.", "sources": [], "retrieval": {}}
+
+
+class FakeWriteQueue:
+    def __init__(self):
+        self.saved = []
+
+    def save_message(self, **message):
+        self.saved.append(message)
+
+
+def make_request() -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/api/chat", "headers": [],
+                    "client": ("127.0.0.1", 50000)})
+
+
+def test_new_chats_get_distinct_conversation_ids(monkeypatch):
+    assistant, write_queue = FakeAssistant(), FakeWriteQueue()
+    monkeypatch.setattr(main, "assistant", assistant)
+    monkeypatch.setattr(main, "write_queue", write_queue)
+    monkeypatch.setattr(main, "db_manager", object())
+    monkeypatch.setattr(main, "rate_limiter", None)
+
+    async def run():
+        # Même seconde, sans identifiant : jamais la même conversation
+        return [
+            await main.chat_endpoint(main.ChatMessage(message="Comment créer une SARL ?", filters=filters),
+                                     make_request())
+            for filters in (None, {"category": "fiscalite"}, None)
+        ]
+
+    responses = asyncio.run(run())
+
+    ids = [response.conversation_id for response in responses]
+    assert len(set(ids)) == 3
+    assert assistant.conversations == ids
+    assert [message["conversation_id"] for message in write_queue.saved] == ids
@@ -0,0 +1,95 @@
+"""
+Téléchargement des PDF : reprise HTTP Range vérifiée par Content-Range, et une seule
+nouvelle tentative depuis zéro quand la reprise est refusée
+"""
+
+import hashlib
+import json
+
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("PyPDF2")
+
+from backend import data_collection  # noqa: E402
+
+PDF = b"%PDF-1.4 " + bytes(range(256)) * 40
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {"Content-Length": str(len(body)), **(headers or {})}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise data_collection.requests.HTTPError(f"{self.status_code}")
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+
+@pytest.fixture
+def collector(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    collector = data_collection.EntrepreneurshipDataCollector()
+    collector.chunk_size = 1000
+    (tmp_path / "data/pdfs/guide.pdf.part").write_bytes(PDF[:3000])
+    return collector
+
+
+def serve(monkeypatch, *responses):
+    requests = []
+
+    def get(url, headers=None, **kwargs):
+        requests.append(headers.get("Range"))
+        return responses[len(requests) - 1]
+
+    monkeypatch.setattr(data_collection.requests, "get", get)
+    return requests
+
+
+def check_complete(tmp_path):
+    assert (tmp_path / "data/pdfs/guide.pdf").read_bytes() == PDF
+    assert not (tmp_path / "data/pdfs/guide.pdf.part").exists()
+    manifest = json.loads((tmp_path / "data/pdfs/manifest.json").read_text())
+    assert manifest["guide.pdf"]["sha256"] == hashlib.sha256(PDF).hexdigest()
+
+
+def test_resume_appends_the_requested_range(tmp_path, monkeypatch, collector):
+    requests = serve(monkeypatch, FakeResponse(206, PDF[3000:], {"Content-Range": f"bytes 3000-{len(PDF) - 1}/{len(PDF)}"}))
+
+    assert collector.download_pdf("https://example.org/guide.pdf", "guide.pdf")
+    assert requests == ["bytes=3000-"]
+    check_complete(tmp_path)
+
+
+def test_unexpected_range_restarts_from_zero(tmp_path, monkeypatch, collector):
+    requests = serve(
+        monkeypatch,
+        FakeResponse(206, PDF[2000:], {"Content-Range": f"bytes 2000-{len(PDF) - 1}/{len(PDF)}"}),
+        FakeResponse(200, PDF),
+    )
+
+    assert collector.download_pdf("https://example.org/guide.pdf", "guide.pdf")
+    assert requests == ["bytes=3000-", None]
+    check_complete(tmp_path)
+
+
+def test_range_not_satisfiable_is_retried_once(tmp_path, monkeypatch, collector):
+    requests = serve(monkeypatch, FakeResponse(416), FakeResponse(416), FakeResponse(200, PDF))
+
+    # Reprise refusée, puis nouvel échec depuis zéro : abandon sans boucle
+    assert collector.download_pdf("https://example.org/guide.pdf", "guide.pdf") is None
+    assert requests == ["bytes=3000-", None]
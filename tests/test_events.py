@@ -0,0 +1,96 @@
+"""
+Révision de la liste des conversations : ETag de GET /api/conversations et
+événements SSE, y compris pour les écritures d'un autre worker
+"""
+
+import asyncio
+import json
+
+from starlette.requests import Request
+
+from backend import main
+from backend.database import DatabaseManager
+from backend.events import EventBroker
+
+
+class FakeWriteQueue:
+    async def flush(self, conversation_id=None):
+        pass
+
+
+def list_conversations(etag=None):
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    request = Request({"type": "http", "method": "GET", "path": "/api/conversations", "headers": headers,
+                       "query_string": b""})
+    return asyncio.run(main.get_conversations(request, limit=20))
+
+
+def test_every_write_bumps_the_shared_revision(tmp_path):
+    db_manager = DatabaseManager(str(tmp_path / "history.db"))
+    # Autre worker sur la même base
+    other_worker = DatabaseManager(db_manager.db_path)
+    revisions = [db_manager.get_revision()]
+
+    db_manager.create_conversation("conv_a", "Création d'entreprise")
+    revisions.append(db_manager.get_revision())
+    db_manager.save_message("conv_a", "Question", "Réponse", [])
+    revisions.append(db_manager.get_revision())
+    other_worker.update_conversation_title("conv_a", "Fiscalité")
+    revisions.append(db_manager.get_revision())
+    other_worker.delete_conversation("conv_a")
+    revisions.append(db_manager.get_revision())
+
+    assert revisions == sorted(set(revisions))
+    assert other_worker.get_revision() == revisions[-1]
+
+
+def test_conversation_list_etag(tmp_path, monkeypatch):
+    db_manager = DatabaseManager(str(tmp_path / "history.db"))
+    monkeypatch.setattr(main, "db_manager", db_manager)
+    monkeypatch.setattr(main, "write_queue", FakeWriteQueue())
+    db_manager.save_message("conv_a", "Question", "Réponse", [])
+
+    first = list_conversations()
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and len(json.loads(first.body)) == 1
+
+    assert list_conversations(etag).status_code == 304
+
+    # Écriture d'un autre worker : l'ETag change
+    DatabaseManager(db_manager.db_path).save_message("conv_b", "Question", "Réponse", [])
+    changed = list_conversations(etag)
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert len(json.loads(changed.body)) == 2
+
+
+def test_stream_relays_local_writes_and_resyncs_on_remote_ones(tmp_path):
+    db_manager = DatabaseManager(str(tmp_path / "history.db"))
+    other_worker = DatabaseManager(db_manager.db_path)
+
+    async def run():
+        broker = EventBroker(db_manager, resync_interval_s=0.01)
+        broker.attach(asyncio.get_running_loop())
+        stream = broker.stream()
+        assert await stream.__anext__() == "retry: 3000\n\n"
+        next_event = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+
+        # Écriture locale, validée dans un thread : relayée telle quelle
+        await asyncio.to_thread(db_manager.save_message, "conv_a", "Question", "Réponse", [])
+        events = [await next_event]
+        events.append(await stream.__anext__())
+        # Écriture d'un autre worker : les clients sont invités à se resynchroniser
+        other_worker.save_message("conv_b", "Question", "Réponse", [])
+        events.append(await asyncio.wait_for(stream.__anext__(), timeout=2))
+
+        await broker.close()
+        await stream.aclose()
+        return events
+
+    events = asyncio.run(run())
+
+    payloads = [json.loads(event.split("data: ", 1)[1]) for event in events]
+    assert [p["type"] for p in payloads] == ["created", "message", "resync"]
+    assert payloads[0]["conversation_id"] == "conv_a"
+    assert payloads[2]["revision"] == db_manager.get_revision() > payloads[1]["revision"]
+    assert events[1].startswith(f"id: {payloads[1]['revision']}\n")
@@ -0,0 +1,125 @@
+"""
+Réponses précalculées : une erreur d'Ollama n'est jamais enregistrée, et la
+question n'est encodée qu'une fois, pour le cache comme pour la recherche
+"""
+
+import asyncio
+import functools
+import json
+import sqlite3
+
+import numpy as np
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from backend import config, faq_cache, main
+
+
+class FakeEncoder:
+    name = "fake:test"
+
+    def encode(self, texts, show_progress_bar=False):
+        return np.ones((len(texts), 4), dtype=np.float32) / 2
+
+
+async def failing_generate(request):
+    return web.Response(status=500, text="model runner has unexpectedly stopped")
+
+
+def test_build_skips_failed_generation(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "corpus.json").write_text(json.dumps([
+        {"title": "CEFORE", "content": "Le CEFORE est le guichet unique de création d'entreprise."}
+    ]), encoding="utf-8")
+    db_path = str(tmp_path / "history.db")
+
+    monkeypatch.setattr(config, "RERANKER_MODEL", "")
+    monkeypatch.setattr(main, "load_embedding_model", FakeEncoder)
+    monkeypatch.setattr(faq_cache, "mine_frequent_questions", lambda *args, **kwargs: [{
+        "normalized": "comment creer une entreprise",
+        "question": "Comment créer une entreprise ?",
+        "asked_count": 12,
+        "embedding": np.ones(4, dtype=np.float32) / 2,
+    }])
+
+    async def run():
+        app = web.Application()
+        app.router.add_post("/api/generate", failing_generate)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            monkeypatch.setattr(main, "AIAssistant", functools.partial(
+                main.AIAssistant, data_dir=str(data_dir), index_dir=str(tmp_path / "index"),
+                ollama_url=str(server.make_url("")).rstrip("/")))
+            return await faq_cache.build(db_path, days=30, min_count=5, max_answers=10)
+        finally:
+            await server.close()
+
+    stats = asyncio.run(run())
+
+    assert stats["errors"] == 1
+    assert stats["generated"] == 0
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM faq_answers").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+class CountingEncoder:
+    """Sac de mots haché, qui compte les textes encodés"""
+    name = "counting:test"
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, show_progress_bar=False):
+        self.encoded.extend(texts)
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in faq_cache.normalize_question(text).split():
+                vectors[i, sum(map(ord, word)) % 64] += 1
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+def test_question_is_encoded_once(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "corpus.json").write_text(json.dumps([
+        {"title": "CEFORE", "content": "Le CEFORE est le guichet unique de création d'entreprise."}
+    ]), encoding="utf-8")
+    db_path = str(tmp_path / "history.db")
+    encoder = CountingEncoder()
+    monkeypatch.setattr(config, "RERANKER_MODEL", "")
+    faq = faq_cache.FaqCache(db_path)
+    assistant = main.AIAssistant(data_dir=str(data_dir), index_dir=str(tmp_path / "index"),
+                                 embedding_model=encoder, shard_urls=[], faq=faq)
+
+    async def generate(client, query, context, *args, **kwargs):
+        return f"Réponse générée ({context[:20]})", None
+
+    monkeypatch.setattr(assistant, "generate", generate)
+    conn = sqlite3.connect(db_path)
+    try:
+        question = "Comment créer une entreprise individuelle au Burkina ?"
+        conn.execute(
+            "INSERT INTO faq_answers (normalized, question, asked_count, embedding, encoder, answer, sources, "
+            "corpus_version, updated_at) VALUES (?, ?, 12, ?, ?, 'Au CEFORE.', '[]', ?, '2026-01-01 00:00:00')",
+            (faq_cache.normalize_question(question), question, encoder.encode([question])[0].tobytes(),
+             encoder.name, assistant.corpus_version())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    encoder.encoded.clear()
+    hit = asyncio.run(assistant.generate_response("Comment créer une entreprise individuelle au Burkina ?"))
+    assert hit["retrieval"]["faq"] and encoder.encoded == ["Comment créer une entreprise individuelle au Burkina ?"]
+
+    encoder.encoded.clear()
+    miss = asyncio.run(assistant.generate_response("Où trouver le guichet unique du CEFORE ?"))
+    # Échec du cache : la recherche réutilise l'embedding calculé pour la consultation
+    assert "faq" not in miss["retrieval"] and miss["retrieval"]["candidates"] == 1
+    assert encoder.encoded == ["Où trouver le guichet unique du CEFORE ?"]
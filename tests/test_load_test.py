@@ -0,0 +1,87 @@
+"""
+Harnais de charge : montée en charge progressive, mélange des endpoints et
+comptage des erreurs de verrouillage SQLite, contre une fausse API
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from benchmarks.bench_retrieval import FIXTURES_DIR
+from benchmarks.load_test import LoadStats, run
+
+
+class FakeApi:
+    def __init__(self):
+        self.first_request = {}
+        self.chats = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/ready", self.ready)
+        app.router.add_post("/api/chat", self.chat)
+        app.router.add_get("/api/conversations", self.conversations)
+        app.router.add_get("/api/conversations/{conversation_id}/history", self.history)
+        return app
+
+    async def ready(self, request):
+        return web.json_response({"status": "ready"})
+
+    async def chat(self, request):
+        self.first_request.setdefault(request.headers["X-API-Key"], time.monotonic())
+        payload = await request.json()
+        self.chats += 1
+        if self.chats % 5 == 0:
+            return web.Response(status=500, text="database is locked")
+        conversation_id = payload.get("conversation_id") or f"conv_{self.chats}"
+        return web.json_response({"conversation_id": conversation_id, "response": "Réponse."})
+
+    async def conversations(self, request):
+        return web.json_response([])
+
+    async def history(self, request):
+        return web.json_response([])
+
+
+def test_users_ramp_up_and_report_per_endpoint():
+    api = FakeApi()
+    args = argparse.Namespace(
+        questions=os.path.join(FIXTURES_DIR, "questions.jsonl"), users=3, duration=0.6, ramp_up=0.3,
+        think_time=0.02, chat_weight=2, list_weight=1, history_weight=1,
+    )
+
+    async def main():
+        server = TestServer(api.app())
+        await server.start_server()
+        try:
+            return await run(args, str(server.make_url("")).rstrip("/"))
+        finally:
+            await server.close()
+
+    report = asyncio.run(main())
+
+    # Chaque utilisateur démarre à son tour de rampe (0,1 s d'écart), pas tous à la fin
+    starts = [api.first_request[f"load-test-{user}"] for user in range(3)]
+    assert all(later - earlier >= 0.08 for earlier, later in zip(starts, starts[1:]))
+    assert set(report["endpoints"]) == {"chat", "conversations", "history"}
+    chat = report["endpoints"]["chat"]
+    assert chat["statuses"][500] == report["sqlite_lock_errors"] == api.chats // 5 > 0
+    assert report["requests"] == sum(e["requests"] for e in report["endpoints"].values())
+    assert report["event_loop_probe_ms"]["p50"] > 0
+
+
+def test_network_errors_count_as_failures():
+    stats = LoadStats()
+    stats.record("chat", 200, 10.0)
+    stats.record("chat", 0, 120000.0, "Server disconnected")
+    stats.record("chat", 500, 30.0, "Internal Server Error")
+
+    report = stats.report(duration_s=2)
+
+    assert report["endpoints"]["chat"]["error_rate"] == round(2 / 3, 4)
+    assert report["throughput_rps"] == 1.5
+    assert report["sqlite_lock_errors"] == 0
@@ -0,0 +1,37 @@
+"""
+Rotation des profils : tolère les fichiers supprimés en même temps par un autre worker
+"""
+
+import os
+
+from backend.profiler import SamplingProfiler
+
+
+def test_rotate_ignores_files_removed_concurrently(tmp_path, monkeypatch):
+    for i, name in enumerate("abcdef"):
+        path = tmp_path / f"{name}.folded"
+        path.write_text("main;handler 1\n")
+        os.utime(path, (1000 + i, 1000 + i))
+    (tmp_path / "settings.json").write_text("{}")
+    profiler = SamplingProfiler(output_dir=str(tmp_path), max_files=2)
+
+    getmtime, remove = os.path.getmtime, os.remove
+
+    def racing_getmtime(path):
+        # Un autre worker supprime « b » entre la liste et la lecture de sa date
+        if path.endswith("b.folded"):
+            remove(path)
+        return getmtime(path)
+
+    def racing_remove(path):
+        # … et supprime « c » juste avant nous
+        if path.endswith("c.folded"):
+            remove(path)
+        remove(path)
+
+    monkeypatch.setattr(os.path, "getmtime", racing_getmtime)
+    monkeypatch.setattr(os, "remove", racing_remove)
+
+    profiler._rotate()
+
+    assert sorted(os.listdir(tmp_path)) == ["e.folded", "f.folded", "settings.json"]
@@ -0,0 +1,142 @@
+"""
+Limitation de débit et ordonnanceur de génération : tour de rôle entre clients,
+file bornée par client, créneau d'un client annulé, remplissage des seaux
+"""
+
+import asyncio
+import types
+
+import pytest
+
+from backend import rate_limit
+from backend.rate_limit import FairScheduler, MemoryRateLimiter, SchedulerFull, SqliteRateLimiter
+
+
+async def enqueue(scheduler, client, order):
+    async with scheduler.slot(client):
+        order.append(client)
+
+
+def test_slots_go_round_robin_across_clients():
+    scheduler = FairScheduler(concurrency=1, max_queued_per_client=10)
+    order = []
+
+    async def run():
+        async with scheduler.slot("holder"):
+            tasks = []
+            for client in ["a", "a", "a", "b", "c"]:
+                tasks.append(asyncio.create_task(enqueue(scheduler, client, order)))
+                await asyncio.sleep(0)
+            assert scheduler.stats() == {"active": 1, "queued": 5, "waiting_clients": 3}
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    # Un client qui envoie trois questions d'affilée ne fait pas attendre les autres
+    assert order == ["a", "b", "c", "a", "a"]
+    assert scheduler.active == 0 and not scheduler.waiting
+
+
+def test_queue_is_bounded_per_client():
+    scheduler = FairScheduler(concurrency=1, max_queued_per_client=2)
+    order = []
+
+    async def run():
+        async with scheduler.slot("holder"):
+            tasks = [asyncio.create_task(enqueue(scheduler, "a", order)) for _ in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(SchedulerFull):
+                await enqueue(scheduler, "a", order)
+            # Les autres clients ne sont pas concernés
+            tasks.append(asyncio.create_task(enqueue(scheduler, "b", order)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    assert order == ["a", "b", "a"]
+    assert scheduler.active == 0
+
+
+def test_cancelled_waiter_hands_its_slot_to_the_next():
+    scheduler = FairScheduler(concurrency=1, max_queued_per_client=10)
+    order = []
+
+    async def run():
+        async with scheduler.slot("holder"):
+            first = asyncio.create_task(enqueue(scheduler, "a", order))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(enqueue(scheduler, "b", order))
+            await asyncio.sleep(0)
+        # Le créneau libéré vient d'être attribué à "a", qui n'a pas encore repris la main
+        assert scheduler.waiting and "a" not in scheduler.waiting
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # Sans passage de relais, "b" attendrait indéfiniment
+        await asyncio.wait_for(second, timeout=1)
+
+    asyncio.run(run())
+
+    assert order == ["b"]
+    assert scheduler.stats() == {"active": 0, "queued": 0, "waiting_clients": 0}
+
+
+def test_cancelled_queued_waiter_leaves_the_queue():
+    scheduler = FairScheduler(concurrency=1, max_queued_per_client=10)
+    order = []
+
+    async def run():
+        async with scheduler.slot("holder"):
+            waiter = asyncio.create_task(enqueue(scheduler, "a", order))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert not scheduler.waiting
+
+    asyncio.run(run())
+
+    assert order == [] and scheduler.active == 0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def limiter(request, tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", types.SimpleNamespace(monotonic=clock, time=clock))
+    if request.param == "memory":
+        limiter = MemoryRateLimiter(per_minute=60, burst=2)
+    else:
+        limiter = SqliteRateLimiter(str(tmp_path / "rate_limits.db"), per_minute=60, burst=2)
+    return limiter, clock
+
+
+def test_bucket_allows_burst_then_refills(limiter):
+    limiter, clock = limiter
+
+    assert limiter.acquire("a") == (True, 0.0)
+    assert limiter.acquire("a") == (True, 0.0)
+    allowed, retry_after = limiter.acquire("a")
+    assert not allowed and retry_after == pytest.approx(1.0)
+    # Chaque client a son propre seau
+    assert limiter.acquire("b") == (True, 0.0)
+
+    clock.now += 0.5
+    allowed, retry_after = limiter.acquire("a")
+    assert not allowed and retry_after == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert limiter.acquire("a") == (True, 0.0)
+    assert not limiter.acquire("a")[0]
+
+    # Le seau ne se remplit pas au-delà de la rafale
+    clock.now += 60
+    assert [limiter.acquire("a")[0] for _ in range(3)] == [True, True, False]
@@ -0,0 +1,128 @@
+"""
+Recherche répartie : les shards refusionnés donnent le même classement que l'index unique,
+et un shard absent ou trop lent ne fait que rendre la réponse partielle
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from backend import config, main
+from backend.shard_server import ShardHandler
+from backend.sharding import ShardedRetriever, ShardError
+
+NUM_SHARDS = 3
+
+
+class HashingEncoder:
+    """Sac de mots haché : déterministe, et sans égalités de similarité sur un corpus aléatoire"""
+    name = "hashing:test"
+
+    def encode(self, texts, show_progress_bar=False):
+        vectors = np.zeros((len(texts), 128), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % 127] += 1
+            # Composante propre à chaque texte : aucune similarité nulle ni égale à une autre
+            vectors[i, 127] = 1 + int(hashlib.md5(text.encode()).hexdigest(), 16) / 2 ** 128
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+def make_corpus(data_dir):
+    rng = random.Random(7)
+    vocabulary = [f"mot{i}" for i in range(80)]
+    # Longueurs toutes différentes : pas d'égalité de score BM25 entre deux passages
+    lengths = rng.sample(range(10, 70), 60)
+    data_dir.mkdir()
+    (data_dir / "corpus.json").write_text(json.dumps([
+        {"id": i, "title": f"Fiche {i}", "content": " ".join(rng.choices(vocabulary, k=length)),
+         "source": f"source{i % 4}"}
+        for i, length in enumerate(lengths)
+    ]), encoding="utf-8")
+    return [" ".join(rng.sample(vocabulary, 3)) for _ in range(20)]
+
+
+def serve(assistant):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), type("Handler", (ShardHandler,), {"assistant": assistant}))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def cluster(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RERANKER_MODEL", "")
+    queries = make_corpus(tmp_path / "data")
+    encoder = HashingEncoder()
+    single = main.AIAssistant(data_dir=str(tmp_path / "data"), index_dir=str(tmp_path / "single"),
+                              embedding_model=encoder, shard_urls=[])
+    servers = [
+        serve(main.AIAssistant(data_dir=str(tmp_path / "data"), index_dir=str(tmp_path / "shards"),
+                               embedding_model=encoder, shard=(i, NUM_SHARDS)))
+        for i in range(NUM_SHARDS)
+    ]
+    urls = [f"http://127.0.0.1:{server.server_address[1]}" for server in servers]
+    yield single.data_processor, servers, urls, queries
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("top_k", [2, 5])
+@pytest.mark.parametrize("prefilter_min_docs", [0, 5000])
+def test_sharded_search_matches_single_index(cluster, monkeypatch, top_k, prefilter_min_docs):
+    data_processor, servers, urls, queries = cluster
+    monkeypatch.setattr(config, "LEXICAL_PREFILTER_MIN_DOCS", prefilter_min_docs)
+    retriever = ShardedRetriever(urls, timeout_ms=5000)
+    retriever.refresh()
+    assert len(retriever) == len(data_processor)
+
+    for query in queries:
+        expected = data_processor.find_similar_content(query, top_k)
+        results, stats = retriever.search(query, top_k)
+        assert [r["content_hash"] for r in results] == [r["content_hash"] for r in expected], query
+        assert [r["content"] for r in results] == [r["content"] for r in expected]
+        assert [r["score"] for r in results] == pytest.approx([r["score"] for r in expected])
+        assert stats["shards_answered"] == NUM_SHARDS and not stats["partial"]
+
+
+def test_down_shard_gives_partial_results(cluster):
+    data_processor, servers, urls, queries = cluster
+    servers[1].shutdown()
+    servers[1].server_close()
+    retriever = ShardedRetriever(urls, timeout_ms=5000)
+
+    results, stats = retriever.search(queries[0], 5)
+
+    assert stats["partial"] and stats["shards_answered"] == NUM_SHARDS - 1
+    assert stats["shard_failures"] == {urls[1]: "error"}
+    assert results
+
+    with pytest.raises(ShardError):
+        ShardedRetriever(urls, timeout_ms=5000, min_shards=NUM_SHARDS).search(queries[0], 5)
+
+
+def test_slow_shard_times_out(cluster):
+    data_processor, servers, urls, queries = cluster
+    handler = servers[2].RequestHandlerClass
+    slow_search = handler.do_POST
+
+    def do_POST(self):
+        time.sleep(0.5)
+        slow_search(self)
+
+    handler.do_POST = do_POST
+    retriever = ShardedRetriever(urls, timeout_ms=200)
+
+    results, stats = retriever.search(queries[0], 5)
+
+    assert stats["shard_failures"] == {urls[2]: "timeout"}
+    assert stats["shards_answered"] == NUM_SHARDS - 1
+    assert results
@@ -0,0 +1,76 @@
+"""
+Écriture différée de l'historique : rien n'est perdu à l'arrêt, une lecture voit
+les écritures qui la précèdent, un message fautif n'emporte pas son lot
+"""
+
+import asyncio
+
+from backend import main
+from backend.database import DatabaseManager
+from backend.write_queue import WriteBehindQueue
+
+
+def test_shutdown_flushes_queued_messages(tmp_path, monkeypatch):
+    db_manager = DatabaseManager(str(tmp_path / "history.db"))
+
+    async def run():
+        # Lots regroupés sur 200 ms : les messages sont encore en file à l'arrêt
+        write_queue = WriteBehindQueue(db_manager, flush_interval_ms=200)
+        write_queue.start()
+        monkeypatch.setattr(main, "write_queue", write_queue)
+        monkeypatch.setattr(main, "event_broker", None)
+        monkeypatch.setattr(main, "assistant", None)
+        for i in range(20):
+            write_queue.save_message(f"conv_{i % 3}", f"Question {i}", f"Réponse {i}", ["fiche.pdf"])
+        assert db_manager.count_messages("conv_0") == 0
+
+        await main.shutdown_event()
+        assert write_queue.task is None and not write_queue.pending
+
+    asyncio.run(run())
+
+    assert [db_manager.count_messages(f"conv_{i}") for i in range(3)] == [7, 7, 6]
+
+
+def test_flush_waits_for_one_conversation(tmp_path):
+    db_manager = DatabaseManager(str(tmp_path / "history.db"))
+
+    async def run():
+        write_queue = WriteBehindQueue(db_manager, flush_interval_ms=20)
+        write_queue.start()
+        write_queue.save_message("conv_a", "Bonjour", "Bonjour !", [])
+        await write_queue.flush("conv_a")
+        history = db_manager.get_conversation_history("conv_a")
+        await write_queue.close()
+        return history
+
+    assert [h["response"] for h in asyncio.run(run())] == ["Bonjour !"]
+
+
+class FlakyDatabase:
+    """Refuse tout lot contenant la conversation "fautive" """
+
+    def __init__(self):
+        self.saved = []
+
+    def save_messages(self, batch):
+        if any(item[0] == "fautive" for item in batch):
+            raise ValueError("contrainte violée")
+        self.saved.extend(batch)
+
+
+def test_failing_message_does_not_lose_its_batch():
+    db_manager = FlakyDatabase()
+
+    async def run():
+        write_queue = WriteBehindQueue(db_manager, flush_interval_ms=50, max_retries=2)
+        write_queue.start()
+        for conversation_id in ("conv_a", "fautive", "conv_b"):
+            write_queue.save_message(conversation_id, "Question", "Réponse", [])
+        await write_queue.close()
+        return write_queue
+
+    write_queue = asyncio.run(run())
+
+    assert [item[0] for item in db_manager.saved] == ["conv_a", "conv_b"]
+    assert not write_queue.pending